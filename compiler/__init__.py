@@ -6,3 +6,8 @@ compiler_base_dir = os.path.join(root_base_dir, "compiler")
 graph_base_dir = os.path.join(compiler_base_dir, "graph")
 
 property_base_dir = os.path.join(root_base_dir, "examples/property")
+
+# On-disk caches shared across compiler runs (parser tables, analysis results, etc.)
+cache_base_dir = os.getenv(
+    "APPNET_CACHE_DIR", os.path.join(root_base_dir, ".appnet_cache")
+)
@@ -0,0 +1,196 @@
+"""
+Build a cost profile (see `compiler/main.py --cost_profile`) from benchmark measurements.
+
+The input is a list of runs, as a JSON list, JSON lines or a YAML list. Each run records the
+backend and the element it ran (both may be null) and one or more measured metrics:
+
+    {"backend": "sidecar_wasm", "element": "fault", "cpu": 412.0, "latency": 1.9, "dropped": 0.09}
+    {"backend": "sidecar_wasm", "element": null, "cpu": 371.0, "latency": 1.6}
+    {"backend": null, "element": null, "cpu": 205.0, "latency": 0.9}
+
+- A run with a backend and an element measures that element alone on the backend.
+- A run with a backend and no element measures the backend with an empty chain, i.e., its
+  processor (one sidecar, ambient or an empty interceptor chain).
+- A run without backend measures the application without any processor.
+- "dropped" is the fraction of requests an element drops or blocks in the benchmark.
+
+Costs are the differences between these runs, in units of the median cost of an element on
+grpc (or --unit), the unit of the default cost model. The processor overhead of a sidecar
+(ambient) excludes the default ipc (network) overhead, which the model charges separately, and
+the extra cost of an empty wasm backend over an empty native one is the wasm invocation overhead.
+Repeated runs are averaged. Numbers that cannot be derived are left out of the profile, so the
+defaults of the cost model are used for them.
+
+Usage:
+    python compiler/calibrate_cost_profile.py bench.json -o profile.yaml --metric cpu
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+
+from compiler.graph.ir.cost_model import (
+    ELEMENT_OVERHEAD,
+    SEGMENT_PROCESSOR,
+    SEGMENTS,
+    TRANSMISSION_OVERHEAD,
+)
+
+
+def load_runs(path: str) -> List[Dict]:
+    with open(path, "r") as f:
+        content = f.read()
+    if path.endswith(".json"):
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
+            return [
+                json.loads(line) for line in content.splitlines() if line.strip() != ""
+            ]
+    return yaml.safe_load(content) or []
+
+
+def processor_of(backend: str) -> str:
+    if backend in ["grpc", "interceptor_arpc"]:
+        return "grpc"
+    return backend.split("_")[0]
+
+
+def calibrate(runs: List[Dict], metric: str, unit: Optional[float] = None) -> Dict:
+    """Compute a cost profile (as written to yaml) from benchmark runs."""
+    samples: Dict[Tuple[Optional[str], Optional[str]], List[float]] = {}
+    dropped: Dict[str, List[float]] = {}
+    for run in runs:
+        backend, element = run.get("backend"), run.get("element")
+        if backend is not None and backend not in ELEMENT_OVERHEAD:
+            raise ValueError(
+                f"Unknown backend {backend}, expected one of {list(ELEMENT_OVERHEAD)}"
+            )
+        if metric in run:
+            samples.setdefault((backend, element), []).append(float(run[metric]))
+        if element is not None and "dropped" in run:
+            dropped.setdefault(element, []).append(float(run["dropped"]))
+    measured = {key: statistics.mean(values) for key, values in samples.items()}
+
+    # Element costs, relative to the same backend with an empty chain
+    element_costs: Dict[str, Dict[str, float]] = {}
+    for (backend, element), value in measured.items():
+        if backend is None or element is None or (backend, None) not in measured:
+            continue
+        element_costs.setdefault(element, {})[backend] = max(
+            value - measured[(backend, None)], 0.0
+        )
+    if unit is None:
+        grpc = [costs["grpc"] for costs in element_costs.values() if "grpc" in costs]
+        unit = statistics.median(grpc) if len(grpc) > 0 else None
+    if unit is None or unit <= 0:
+        raise ValueError(
+            "Cannot derive the cost unit without grpc element runs, please specify --unit"
+        )
+
+    profile: Dict = {
+        "metric": metric,
+        "source": {"unit": unit, "runs": len(runs)},
+    }
+    backends = {}
+    for backend in ELEMENT_OVERHEAD:
+        costs = [c[backend] for c in element_costs.values() if backend in c]
+        if len(costs) > 0:
+            backends[backend] = round(statistics.median(costs) / unit, 4)
+    if len(backends) > 0:
+        profile["backends"] = backends
+
+    # Processor overhead of each segment, from the cheapest empty backend of its processor
+    if (None, None) in measured:
+        empty: Dict[str, float] = {}
+        for (backend, element), value in measured.items():
+            if backend is not None and element is None:
+                overhead = (value - measured[(None, None)]) / unit
+                p = processor_of(backend)
+                empty[p] = min(empty.get(p, overhead), overhead)
+        processors = {}
+        for pos, p in zip(SEGMENTS, SEGMENT_PROCESSOR):
+            if p not in empty:
+                continue
+            transmission = {"sidecar": "ipc", "ambient": "network"}.get(p)
+            overhead = empty[p] - (
+                TRANSMISSION_OVERHEAD[transmission] if transmission else 0.0
+            )
+            processors[pos] = round(max(overhead, 0.0), 4)
+        if len(processors) > 0:
+            profile["processors"] = processors
+    for p in ["sidecar", "ambient"]:
+        wasm, native = (f"{p}_wasm", None), (f"{p}_native", None)
+        if wasm in measured and native in measured:
+            profile["wasm_invocation"] = round(
+                max(measured[wasm] - measured[native], 0.0) / unit, 4
+            )
+            break
+
+    elements = {}
+    for element in sorted(set(element_costs) | set(dropped)):
+        entry = {}
+        if element in element_costs:
+            entry["cost"] = {
+                b: round(c / unit, 4) for b, c in sorted(element_costs[element].items())
+            }
+        if element in dropped:
+            entry["drop_rate"] = round(statistics.mean(dropped[element]), 4)
+        elements[element] = entry
+    if len(elements) > 0:
+        profile["elements"] = elements
+    return profile
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "runs",
+        type=str,
+        nargs="+",
+        help="Benchmark output files (json, json lines or yaml).",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Path of the cost profile, default is stdout.",
+        default=None,
+    )
+    parser.add_argument(
+        "--metric",
+        type=str,
+        help="The measured metric to calibrate on (a field of the runs, e.g., cpu or latency), default is cpu.",
+        default="cpu",
+    )
+    parser.add_argument(
+        "--unit",
+        type=float,
+        help="The measured value of one cost unit, default is the median cost of an element on grpc.",
+        default=None,
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    runs = []
+    for path in args.runs:
+        runs.extend(load_runs(path))
+    profile = calibrate(runs, args.metric, args.unit)
+    profile["source"]["files"] = [os.path.abspath(path) for path in args.runs]
+    content = yaml.safe_dump(profile, sort_keys=False, default_flow_style=False)
+    if args.output is None:
+        print(content, end="")
+    else:
+        with open(args.output, "w") as f:
+            f.write(content)
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import os
-from typing import Dict, List, TYPE_CHECKING
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from compiler.graph.ir.element import AbsElement
@@ -29,10 +29,25 @@ from compiler.element.frontend.util import (
     extract_proto_message_names,
     extract_proto_package_name,
 )
+from compiler.element.cache import (
+    IR_CACHE,
+    PROPERTY_CACHE,
+    SENSITIVITY_CACHE,
+    source_digest,
+)
+from compiler.element.property_db import PROPERTY_DB
 from compiler.element.ir.consolidate import consolidate
-from compiler.element.ir.props.flow import FlowGraph, Property
+from compiler.element.ir.props.flow import (
+    FlowGraph,
+    Property,
+    combine_drop_rates,
+    literal_constants,
+)
 from compiler.element.logger import ELEMENT_LOG as LOG
-from compiler.element.frontend.sensitivity_analysis import *
+from compiler.element.frontend.sensitivity_analysis import (
+    analyze_sensitivity,
+    sensitivity_timeout,
+)
 
 # TODO: unified naming convention for services in proto
 def generate_service_name(mod_name: str, server: str) -> str:
@@ -132,7 +147,7 @@ def gen_code(
             tag=tag,
             envoy_verbose=envoy_verbose,
         )
-    
+
     LOG.info(f"Generating {backend_name} code")
     # TODO: Extend access analysis to all backends
     if "wasm" in backend_name:
@@ -313,7 +328,56 @@ def gen_code(
 #     finalize(output_name, ctx, output_dir, placement, proto_path)
 
 
+def parse_element(element_path: str) -> Program:
+    """Parse and transform an .appnet file, reusing cached IRs of unchanged sources."""
+    key = source_digest([element_path])
+    ir = IR_CACHE.get(key)
+    if ir is None:
+        with open(element_path) as f:
+            ir = ElementCompiler().parse_and_transform(f.read())
+        IR_CACHE.put(key, ir)
+    return ir
+
+
+def element_sensitivity(element_path: str, ir: Program) -> Dict[str, bool]:
+    """Sensitivity verdicts of an .appnet file, cached by its content and the solver timeout."""
+    timeout = sensitivity_timeout()
+    key = source_digest([element_path], timeout)
+    sensitivity = SENSITIVITY_CACHE.get(key)
+    if sensitivity is None:
+        sensitivity = analyze_sensitivity(ir, timeout)
+        SENSITIVITY_CACHE.put(key, sensitivity)
+    return sensitivity
+
+
 def compile_element_property(element_name: str, element_path: List[str], verbose: bool = False) -> Dict:
+    """The properties of an element, see resolve_element_property()."""
+    return resolve_element_property(element_name, element_path, verbose)[0]
+
+
+def resolve_element_property(
+    element_name: str, element_path: List[str], verbose: bool = False
+) -> Tuple[Dict, Optional[Dict]]:
+    """
+    The properties of an element: those of its up-to-date entry in the property database
+    (see compiler.element.property_db), or else the analyzed ones (analyze_element_property())
+    with the hand-curated override of its entry, if any, so that an override also applies
+    while a stale entry is analyzed again.
+
+    Returns:
+        The properties, and the analyzed ones (without the override) to add to the property
+        database, or None if they come from it.
+    """
+    if not verbose:
+        prop = PROPERTY_DB.lookup(element_name, element_path)
+        if prop is not None:
+            LOG.debug(f"Using element properties from the property database. Element: {element_name}")
+            return prop, None
+    analyzed = analyze_element_property(element_name, element_path, verbose)
+    return PROPERTY_DB.apply_override(element_name, element_path, analyzed), analyzed
+
+
+def analyze_element_property(element_name: str, element_path: List[str], verbose: bool = False) -> Dict:
     """
     Compiles and analyzes properties of elements defined using AppNet syntax.
 
@@ -322,8 +386,12 @@ def compile_element_property(element_name: str, element_path: List[str], verbose
     and then analyzes the properties of the request and response flows using FlowGraph.
 
     The function aggregates properties (like read, write, block, copy, drop operations) for
-    both request and response flows across all the provided element specifications. It also
-    determines if the overall behavior is stateful based on the state definitions in the IR.
+    both request and response flows across all the provided element specifications. The drop
+    rate is known when every drop only depends on literal probabilities (e.g., `randomf(0, 1) <
+    prob` with `prob = 0.95` in init()), and None otherwise. It also
+    determines if the overall behavior is stateful based on the state definitions in the IR,
+    and whether it is idempotent, ordering-sensitive or requires all RPCs by a symbolic
+    analysis with a solver timeout per query (see frontend/sensitivity_analysis.py).
 
     If 'verbose' is true, it prints the compiled intermediate representation for each element.
 
@@ -332,11 +400,21 @@ def compile_element_property(element_name: str, element_path: List[str], verbose
         element_path (str): The path to the element specification file.
         verbose (bool): Flag to enable verbose logging of the compilation process.
 
+    Results are cached by the content of the element sources (see compiler.element.cache),
+    so unchanged elements are analyzed only once across edges and runs. The property
+    database is not consulted, see compile_element_property().
+
     Returns:
         Dict: A dictionary containing the stateful flag, and the aggregated properties for
               both request and response processing.
     """
-    compiler = ElementCompiler()
+    cache_key = source_digest(element_path, str(element_name), sensitivity_timeout())
+    if not verbose:
+        prop = PROPERTY_CACHE.get(cache_key)
+        if prop is not None:
+            LOG.debug(f"Using cached element properties. Element: {element_name}")
+            return prop
+
     printer = Printer()
 
     # Initialize a tuple of Property objects to hold request and response properties
@@ -349,60 +427,61 @@ def compile_element_property(element_name: str, element_path: List[str], verbose
     combiner = "LWW" # last write wins
     persistence = False
     state_dependence = []
+    idempotent = True
+    ordering_sensitive = False
+    requires_all_rpcs = False
     for path in element_path:
-        with open(path) as f:
-            # Read the specification from file and generate the intermediate representation
-            spec = f.read()
-            ir = compiler.parse_and_transform(spec)
-
-            if verbose:
-                p = ir.accept(printer, None)
-                print(p)
-
-            # Analyze the IR and get the element properties
-            # The request and reponse logics are analyzed seperately
-            req = FlowGraph().analyze(ir.req, verbose)
-            resp = FlowGraph().analyze(ir.resp, verbose)
-
-            # Update request properties
-            ret[0].block = ret[0].block or req.block
-            ret[0].copy = ret[0].copy or req.copy
-            ret[0].drop = ret[0].drop or req.drop
-            ret[0].read = ret[0].read + req.read
-            ret[0].write = ret[0].write + req.write
-            ret[0].check() 
-
-            # Update response properties
-            ret[1].block = ret[1].block or resp.block
-            ret[1].copy = ret[1].copy or resp.copy
-            ret[1].drop = ret[1].drop or resp.drop
-            ret[1].read = ret[1].read + resp.read
-            ret[1].write = ret[1].write + resp.write
-            ret[1].check()
-
-            stateful = stateful or len(ir.definition.state) > 0
-
-            # Analyze the state variables
-            # TODO: might want to do a more fine-grained check state variables. (incl. conflict requirements)
-            for state in ir.definition.state:
-                consistency = consistency or state[2].name
-                # TODO: this won't work if we use the combiner in the future
-                combiner = combiner or state[3].name
-                persistence = persistence or state[4].name
-                # TODO: this is a temp hack
-                if "client_service" in state[0].name:
-                    state_dependence.append("client_service")
-                if "server_service" in state[0].name:
-                    state_dependence.append("server_service")
-            
-            # Sensitivity analysis
-            # idempotent = check_idempotent(ir)
-            # ordering_sensitive = check_ordering_sensitive(ir)
-            # requires_all_rpcs = check_requires_all_rpcs(ir)
-            
-            idempotent = False
-            ordering_sensitive = False
-            requires_all_rpcs = False
+        # Read the specification from file and generate the intermediate representation
+        ir = parse_element(path)
+
+        if verbose:
+            p = ir.accept(printer, None)
+            print(p)
+
+        # Analyze the IR and get the element properties
+        # The request and reponse logics are analyzed seperately
+        constants = literal_constants(ir)
+        req = FlowGraph().analyze(ir.req, verbose, constants)
+        resp = FlowGraph().analyze(ir.resp, verbose, constants)
+
+        # Update request properties
+        ret[0].block = ret[0].block or req.block
+        ret[0].copy = ret[0].copy or req.copy
+        ret[0].drop = ret[0].drop or req.drop
+        ret[0].read = ret[0].read + req.read
+        ret[0].write = ret[0].write + req.write
+        ret[0].drop_rate = combine_drop_rates(ret[0].drop_rate, req.drop_rate)
+        ret[0].check()
+
+        # Update response properties
+        ret[1].block = ret[1].block or resp.block
+        ret[1].copy = ret[1].copy or resp.copy
+        ret[1].drop = ret[1].drop or resp.drop
+        ret[1].read = ret[1].read + resp.read
+        ret[1].write = ret[1].write + resp.write
+        ret[1].drop_rate = combine_drop_rates(ret[1].drop_rate, resp.drop_rate)
+        ret[1].check()
+
+        stateful = stateful or len(ir.definition.state) > 0
+
+        # Analyze the state variables
+        # TODO: might want to do a more fine-grained check state variables. (incl. conflict requirements)
+        for state in ir.definition.state:
+            consistency = consistency or state[2].name
+            # TODO: this won't work if we use the combiner in the future
+            combiner = combiner or state[3].name
+            persistence = persistence or state[4].name
+            # TODO: this is a temp hack
+            if "client_service" in state[0].name:
+                state_dependence.append("client_service")
+            if "server_service" in state[0].name:
+                state_dependence.append("server_service")
+
+        # Sensitivity analysis, the parts of a fused element run one after another
+        sensitivity = element_sensitivity(path, ir)
+        idempotent = idempotent and sensitivity["idempotent"]
+        ordering_sensitive = ordering_sensitive or sensitivity["ordering_sensitive"]
+        requires_all_rpcs = requires_all_rpcs or sensitivity["requires_all_rpcs"]
     ret[0].check()
     ret[1].check()
 
@@ -425,6 +504,7 @@ def compile_element_property(element_name: str, element_path: List[str], verbose
             "drop": ret[0].drop,
             "block": ret[0].block,
             "copy": ret[0].copy,
+            "drop_rate": ret[0].drop_rate,
         },
         "response": {
             "read": [],
@@ -433,6 +513,7 @@ def compile_element_property(element_name: str, element_path: List[str], verbose
             "drop": ret[1].drop,
             "block": ret[1].block,
             "copy": ret[1].copy,
+            "drop_rate": ret[1].drop_rate,
         },
         "sensitivity": {
             "idempotent": idempotent,
@@ -440,7 +521,7 @@ def compile_element_property(element_name: str, element_path: List[str], verbose
             "requires_all_rpcs": requires_all_rpcs,
         },
     }
-    
+
     if record:
         prop["request"]["record"] = ret[0].read
         prop["response"]["record"] = ret[1].read
@@ -448,4 +529,5 @@ def compile_element_property(element_name: str, element_path: List[str], verbose
         prop["request"]["read"] = ret[0].read
         prop["response"]["read"] = ret[1].read
 
+    PROPERTY_CACHE.put(cache_key, prop)
     return prop
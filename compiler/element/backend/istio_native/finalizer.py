@@ -6,8 +6,7 @@ from compiler.element.backend.istio_native.nativegen import NativeContext
 from compiler.element.logger import ELEMENT_LOG as LOG
 
 
-def codegen_from_template(output_dir, ctx: NativeContext, lib_name, proto_path):
-
+def prepare_template():
     template_path = f"{COMPILER_ROOT}/element/backend/istio_native/template"
 
     # check if the template directory exists, if not, git clone.
@@ -18,6 +17,11 @@ def codegen_from_template(output_dir, ctx: NativeContext, lib_name, proto_path):
         )
         LOG.info(f"New template cloned from git repo to {template_path}")
 
+
+def codegen_from_template(output_dir, ctx: NativeContext, lib_name, proto_path):
+
+    prepare_template()
+
     # check if the output directory exists, if not, copy the template to the output directory
     # if the directory exists and non-empty, just rewrite the appnet_filter/appnet_filter.cc file and its .h file
     if os.path.exists(output_dir) == False or len(os.listdir(output_dir)) == 0:
@@ -0,0 +1,149 @@
+"""
+Content-addressed cache for element analysis results.
+
+Entries are keyed by the hash of the element source files plus a fingerprint of the
+element frontend/analysis code, so editing either one invalidates stale results.
+Results live in memory for the current run and are pickled under the cache directory
+so that later runs can skip parsing and property analysis for unchanged elements.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+from copy import deepcopy
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from compiler import cache_base_dir
+from compiler.element.logger import ELEMENT_LOG as LOG
+
+_ELEMENT_DIR = Path(__file__).parent
+# Sources whose behavior determines the cached IR and properties.
+_VERSION_SOURCES = [
+    "frontend/element.lark",
+    "frontend/parser.py",
+    "frontend/transformer.py",
+    "frontend/sensitivity_analysis.py",
+    "node.py",
+    "ir/props/analyzer.py",
+    "ir/props/flow.py",
+    "__init__.py",
+]
+
+# Code generator package of each backend target.
+_BACKEND_SOURCES = {
+    "grpc": "backend/grpc",
+    "sidecar_wasm": "backend/istio_wasm",
+    "ambient_wasm": "backend/istio_wasm",
+    "sidecar_native": "backend/istio_native",
+    "ambient_native": "backend/istio_native",
+    "sidecar_arpc": "backend/arpc",
+}
+
+_compiler_version: Optional[str] = None
+_backend_versions: Dict[str, str] = {}
+
+
+def compiler_version() -> str:
+    """Fingerprint of the element frontend and property analysis code."""
+    global _compiler_version
+    if _compiler_version is None:
+        h = hashlib.sha256()
+        for rel in _VERSION_SOURCES:
+            h.update(rel.encode())
+            h.update((_ELEMENT_DIR / rel).read_bytes())
+        _compiler_version = h.hexdigest()
+    return _compiler_version
+
+
+def backend_version(target: str) -> str:
+    """Fingerprint of the code generator (and its templates) used for a backend target."""
+    if target not in _backend_versions:
+        h = hashlib.sha256(compiler_version().encode())
+        backend_dir = _ELEMENT_DIR / _BACKEND_SOURCES[target]
+        for path in sorted(backend_dir.rglob("*")):
+            if not path.is_file() or "__pycache__" in path.parts:
+                continue
+            # Track the generators, the wasm templates and the native filter sources
+            # (the rest of the istio_native template is a large envoy checkout).
+            if (
+                path.suffix == ".py"
+                or "templates" in path.parts
+                or "appnet_filter" in path.parts
+            ):
+                h.update(str(path.relative_to(backend_dir)).encode())
+                h.update(path.read_bytes())
+        _backend_versions[target] = h.hexdigest()
+    return _backend_versions[target]
+
+
+def source_digest(paths: List[str], *extra: str) -> str:
+    """Hash the contents of the given source files together with the compiler version.
+
+    Args:
+        paths: Element source files (order matters, e.g., for fused elements).
+        extra: Additional strings that affect the cached result.
+    """
+    h = hashlib.sha256(compiler_version().encode())
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    for e in extra:
+        h.update(b"\0" + str(e).encode())
+    return h.hexdigest()
+
+
+class ElementCache:
+    """A two-level (memory + disk) cache.
+
+    Values are deep-copied on the way in and out because callers mutate IRs
+    (type inference, consolidation) and property dicts (fusion, dependency analysis).
+    Setting APPNET_NO_CACHE=1 disables the cache.
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.memory: Dict[str, Any] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return os.getenv("APPNET_NO_CACHE") != "1"
+
+    @property
+    def disk_dir(self) -> str:
+        return os.path.join(cache_base_dir, "element", self.namespace)
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        if key not in self.memory:
+            path = os.path.join(self.disk_dir, f"{key}.pkl")
+            if not os.path.exists(path):
+                return None
+            try:
+                with open(path, "rb") as f:
+                    self.memory[key] = pickle.load(f)
+            except Exception as e:
+                LOG.warning(f"Ignoring corrupted cache entry {path}: {e}")
+                return None
+        return deepcopy(self.memory[key])
+
+    def put(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        self.memory[key] = deepcopy(value)
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            # Write to a temporary file first so that concurrent runs never observe
+            # a partially-written entry.
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f)
+            os.replace(tmp_path, os.path.join(self.disk_dir, f"{key}.pkl"))
+        except Exception as e:
+            LOG.warning(f"Failed to persist {self.namespace} cache entry: {e}")
+
+
+IR_CACHE = ElementCache("ir")
+PROPERTY_CACHE = ElementCache("property")
+SENSITIVITY_CACHE = ElementCache("sensitivity")
@@ -1,9 +1,12 @@
 import os
 import pathlib
+from typing import Optional
 
 from lark import Lark
 from lark.indenter import Indenter
 
+from compiler import cache_base_dir
+
 
 class AppNetIndenter(Indenter):
     NL_type = "_NEWLINE"
@@ -14,11 +17,36 @@ class AppNetIndenter(Indenter):
     tab_len = 4
 
 
+# The LALR tables are built once per process and shared by every ElementParser.
+_lark_parser: Optional[Lark] = None
+
+
+def get_lark_parser() -> Lark:
+    """Return the process-wide parser for element.lark.
+
+    The parse tables are persisted with Lark's cache (keyed by the grammar, the
+    options and the Lark version), so later runs load them instead of rebuilding.
+    """
+    global _lark_parser
+    if _lark_parser is None:
+        cwd = pathlib.Path(__file__).parent
+        with open(os.path.join(cwd, "element.lark"), "r") as f:
+            grammar = f.read()
+        os.makedirs(cache_base_dir, exist_ok=True)
+        _lark_parser = Lark(
+            grammar,
+            start="appnet",
+            parser="lalr",
+            lexer="contextual",
+            postlex=AppNetIndenter(),
+            cache=os.path.join(cache_base_dir, "element_grammar.lark"),
+        )
+    return _lark_parser
+
+
 class ElementParser:
     def __init__(self):
-        cwd = pathlib.Path(__file__).parent
-        grammar = open(os.path.join(cwd, "element.lark"), "r").read()
-        self.lark_parser = Lark(grammar, start="appnet", postlex=AppNetIndenter())
+        self.lark_parser = get_lark_parser()
 
     def parse(self, spec):
         return self.lark_parser.parse(spec)
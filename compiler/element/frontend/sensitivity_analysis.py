@@ -1,260 +1,357 @@
-from z3 import *
-from compiler.element.node import *
+"""
+Sensitivity analysis of elements by symbolic execution with Z3.
+
+An element is run symbolically on symbolic RPCs from a symbolic state, and Z3 checks
+whether two scenarios can end differently:
+    idempotent          processing the same RPC twice leaves the state and the output of
+                        processing it once (e.g., a duplicate sent by a copy element);
+    ordering_sensitive  processing two RPCs in either order can leave different states;
+    requires_all_rpcs   not processing an earlier RPC (e.g., dropped before the element) can
+                        change the state or the output of a later one.
+
+Values are of an uninterpreted sort: arithmetic, comparisons and functions are uninterpreted
+functions, and current_time()/randomf() give fresh values. So an unsat query proves the
+property for every interpretation, in particular the real one. Branches are merged into
+If() terms guarded by their path condition.
+
+Each query has a solver timeout, and all queries of an element share one solver (with
+push/pop). Elements that use unsupported constructs (e.g., foreach), and queries that time
+out, get the conservative verdict (see CONSERVATIVE).
+"""
+import os
+from typing import Dict, List, Optional, Tuple
 
 from z3 import *
+
+from compiler.element.logger import ELEMENT_LOG as LOG
 from compiler.element.node import *
 
+VALUE = DeclareSort("Value")
+MESSAGE = ArraySort(VALUE, VALUE)
+
+# Verdicts when the analysis cannot tell
+CONSERVATIVE = {
+    "idempotent": False,
+    "ordering_sensitive": True,
+    "requires_all_rpcs": True,
+}
+
+# Per-query solver timeout in milliseconds, overridden by APPNET_SENSITIVITY_TIMEOUT
+DEFAULT_TIMEOUT = 1000
+
+
+def sensitivity_timeout() -> int:
+    """The per-query solver timeout in milliseconds, 0 disables the analysis."""
+    return int(os.getenv("APPNET_SENSITIVITY_TIMEOUT", DEFAULT_TIMEOUT))
+
+
+class Unsupported(Exception):
+    """A construct that the symbolic execution does not model."""
+
+
+class Symbols:
+    """The constants and uninterpreted functions shared by all runs of an element."""
+
+    def __init__(self):
+        self.literals: Dict[str, ExprRef] = {}
+        self.functions: Dict[str, FuncDeclRef] = {}
+        self.count = 0
+
+    def literal(self, value: str) -> ExprRef:
+        if value not in self.literals:
+            self.literals[value] = Const(f"lit{len(self.literals)}!{value}", VALUE)
+        return self.literals[value]
+
+    def function(self, name: str, *sorts) -> FuncDeclRef:
+        if name not in self.functions:
+            self.functions[name] = Function(name, *sorts)
+        return self.functions[name]
+
+    def fresh(self, name: str, sort=VALUE) -> ExprRef:
+        self.count += 1
+        return Const(f"{name}!{self.count}", sort)
+
+    def facts(self) -> List[BoolRef]:
+        """Distinct string literals (and true/false/None) are different values."""
+        distinct = [
+            v for k, v in self.literals.items() if k.startswith("'") or k in ["true", "false", "None"]
+        ]
+        return [Distinct(*distinct)] if len(distinct) > 1 else []
+
+
+class RPC:
+    """A symbolic RPC: its request and response messages and its id."""
+
+    def __init__(self, symbols: Symbols, name: str):
+        self.request = Const(f"{name}.request", MESSAGE)
+        self.response = Const(f"{name}.response", MESSAGE)
+        self.id = symbols.fresh(f"{name}.id")
+
+
+def initial_state(program: Program, symbols: Symbols) -> Dict[str, ExprRef]:
+    state = {}
+    for s in program.definition.state:
+        name, type = s[0].name, s[1].name
+        if type.startswith("Map<") or type.startswith("Vec<"):
+            state[name] = symbols.fresh(f"{name}0", MESSAGE)
+        else:
+            state[name] = symbols.fresh(f"{name}0")
+    return state
+
+
 class SymbolicEnv:
-    def __init__(self, state_vars):
-        self.state = {}
-        self.handle_state_var(state_vars)
-        
-        # TODO: is locals needed? 
-        self.locals = {}
-        self.rpc= Array("rpc", StringSort(), StringSort())
-        self.send_log = []
-
-    def handle_state_var(self, state_vars):
-        # TODO: handle other types of state variables
-        for name, type in state_vars:
-            if type.startswith("Map<"):
-                self.state[name] = Array(f"{name}0", StringSort(), StringSort())
-            else:
-                self.state[name] = Int(f"{name}0")
+    """Runs the req and resp procedures of an element on symbolic RPCs.
+
+    Maps and vectors are arrays from values to values (deleted and missing keys hold None),
+    every other state variable is a value. self.state holds the state after the runs so far.
+    """
+
+    def __init__(self, program: Program, symbols: Symbols, state: Dict[str, ExprRef]):
+        self.program = program
+        self.symbols = symbols
+        self.state = dict(state)
+        self.none = symbols.literal("None")
+        self.true = symbols.literal("true")
+        self.false = symbols.literal("false")
+
+    def run(self, rpc: RPC) -> Dict[str, Tuple[ExprRef, ExprRef]]:
+        """Process an RPC, returning the (number of sends, last message) of each direction."""
+        self.rpc_id = rpc.id
+        self.outputs = {d: (IntVal(0), self.none) for d in ["Up", "Down"]}
+        for proc, message in [(self.program.req, rpc.request), (self.program.resp, rpc.response)]:
+            self.rpc_name = proc.params[0].name if len(proc.params) > 0 else "rpc"
+            self.rpc = message
+            self.locals: Dict[str, ExprRef] = {}
+            self.exec_body(proc.body, BoolVal(True))
+        return self.outputs
 
-    def eval_expr(self, expr):
+    def value(self, e: ExprRef) -> ExprRef:
+        return If(e, self.true, self.false) if is_bool(e) else e
+
+    def cond(self, e: ExprRef) -> BoolRef:
+        return e if is_bool(e) else e == self.true
+
+    def message(self, expr) -> ExprRef:
+        if isinstance(expr, Identifier) and expr.name == self.rpc_name:
+            return self.symbols.function("message", MESSAGE, VALUE)(self.rpc)
+        return self.value(self.eval_expr(expr))
+
+    def container(self, obj: Identifier) -> ExprRef:
+        if obj.name == self.rpc_name:
+            return self.rpc
+        if obj.name in self.state and self.state[obj.name].sort() == MESSAGE:
+            return self.state[obj.name]
+        raise Unsupported(f"{obj.name} is not a map or a vector")
+
+    def eval_expr(self, expr) -> ExprRef:
         if isinstance(expr, Literal):
-            if isinstance(expr.value, str) and expr.value.isdigit():
-                return IntVal(int(expr.value))
-            return StringVal(expr.value)
+            return self.symbols.literal(expr.value)
+        elif isinstance(expr, Error):
+            return self.symbols.function("err", VALUE, VALUE)(self.symbols.literal(expr.msg.value))
         elif isinstance(expr, Identifier):
-            if expr.name in self.state:
-                return self.state[expr.name]
-            elif expr.name == "rpc":
-                return self.rpc
-            elif expr.name in self.locals:
+            if expr.name in self.locals:
                 return self.locals[expr.name]
-            else:
-                raise ValueError(f"Unknown identifier: {expr.name}")
+            elif expr.name in self.state and self.state[expr.name].sort() == VALUE:
+                return self.state[expr.name]
+            elif expr.name == self.rpc_name:
+                return self.message(expr)
+            raise Unsupported(f"unknown identifier {expr.name}")
         elif isinstance(expr, Pair):
-            return (self.eval_expr(expr.left), self.eval_expr(expr.right))
+            pair = self.symbols.function("pair", VALUE, VALUE, VALUE)
+            return pair(self.value(self.eval_expr(expr.first)), self.value(self.eval_expr(expr.second)))
         elif isinstance(expr, MethodCall):
-            if expr.method == MethodType.GET:
-                if expr.obj.name in self.state:
-                    arr = self.state[expr.obj.name]
-                    key = self.eval_expr(expr.args[0])
-                    return Select(arr, key)
-                elif expr.obj.name == "rpc":
-                    arr = self.rpc
-                    key = self.eval_expr(expr.args[0])
-                    return Select(arr, key)
-                else:
-                    raise ValueError(f"Unknown identifier: {expr.obj.name}")
-            elif expr.method == MethodType.SET:
-                # Should only be used in statement context
-                raise RuntimeError("SET should not be evaluated as expression")
-            elif expr.method == MethodType.DELETE:
-                # Should only be used in statement context
-                raise RuntimeError("DELETE should not be evaluated as expression")
-        elif isinstance(expr, Expr):
-            lhs = self.eval_expr(expr.lhs)
-            rhs = self.eval_expr(expr.rhs)
-            if expr.op == Operator.ADD:
-                return lhs + rhs
-            elif expr.op == Operator.SUB:
-                return lhs - rhs
-            elif expr.op == Operator.MUL:
-                return lhs * rhs
-            elif expr.op == Operator.DIV:
-                return lhs / rhs
-            elif expr.op == Operator.EQ:
-                return lhs == rhs
+            if expr.method in [MethodType.GET, MethodType.METAGET] and len(expr.args) == 1:
+                return Select(self.container(expr.obj), self.value(self.eval_expr(expr.args[0])))
+            elif expr.method == MethodType.SIZE:
+                return self.symbols.function("size", MESSAGE, VALUE)(self.container(expr.obj))
+            elif expr.method == MethodType.BYTE_SIZE:
+                args = [self.container(expr.obj)] + [self.value(self.eval_expr(a)) for a in expr.args]
+                sorts = [MESSAGE] + [VALUE] * len(expr.args) + [VALUE]
+                return self.symbols.function(f"byte_size{len(expr.args)}", *sorts)(*args)
+            raise Unsupported(f"{expr.method} in an expression")
+        elif isinstance(expr, (RandomFunc, CurrentTimeFunc)):
+            return self.symbols.fresh(expr.name.name)
+        elif isinstance(expr, FuncCall):
+            if expr.name.name == "rpc_id":
+                return self.rpc_id
+            args = [self.value(self.eval_expr(a)) for a in expr.args]
+            f = self.symbols.function(
+                f"{expr.name.name}/{len(args)}", *([VALUE] * (len(args) + 1))
+            )
+            return f(*args)
+        elif type(expr) is Expr:
+            lhs, rhs = self.eval_expr(expr.lhs), self.eval_expr(expr.rhs)
+            if expr.op == Operator.EQ:
+                return self.value(lhs) == self.value(rhs)
             elif expr.op == Operator.NEQ:
-                return lhs != rhs
-            elif expr.op == Operator.LT:
-                return lhs < rhs
-            elif expr.op == Operator.GT:
-                return lhs > rhs
-            elif expr.op == Operator.LE:
-                return lhs <= rhs
-            elif expr.op == Operator.GE:
-                return lhs >= rhs
+                return self.value(lhs) != self.value(rhs)
+            elif expr.op == Operator.LAND:
+                return And(self.cond(lhs), self.cond(rhs))
+            elif expr.op == Operator.LOR:
+                return Or(self.cond(lhs), self.cond(rhs))
+            elif expr.op in [Operator.LT, Operator.GT, Operator.LE, Operator.GE]:
+                f = self.symbols.function(expr.op.name, VALUE, VALUE, BoolSort())
             else:
-                raise NotImplementedError(f"Unsupported operator: {expr.op}")
+                f = self.symbols.function(expr.op.name, VALUE, VALUE, VALUE)
+            return f(self.value(lhs), self.value(rhs))
+        raise Unsupported(f"expression {expr}")
 
+    def assign(self, name: str, value: ExprRef, guard: BoolRef):
+        if name in self.state:
+            if self.state[name].sort() != VALUE:
+                raise Unsupported(f"assignment to container {name}")
+            self.state[name] = If(guard, value, self.state[name])
+        elif name in self.locals:
+            self.locals[name] = If(guard, value, self.locals[name])
         else:
-            raise NotImplementedError(f"Unknown expr: {expr}")
+            self.locals[name] = value
 
-    def exec_stmt(self, stmt):
+    def exec_stmt(self, stmt, guard: BoolRef):
+        if type(stmt) is Statement:
+            if stmt.stmt is None:
+                return  # pass
+            stmt = stmt.stmt
         if isinstance(stmt, Match):
-            # TODO: add full match handling
-            match_expr = self.eval_expr(stmt.expr)
-            
-            for pattern, actions in stmt.actions:
-                if isinstance(pattern, Pattern):
-                    self.exec_action(actions)
-        else:
-            inner = stmt.stmt
-            if isinstance(inner, Assign):
-                var = inner.left.name
-                # If RHS is a method call like get(...), eval it safely
-                if isinstance(inner.right, MethodCall):
-                    val = self.eval_expr(inner.right)
+            value = self.value(self.eval_expr(stmt.expr))
+            remaining = guard
+            for pattern, body in stmt.actions:
+                if pattern.some:
+                    if not isinstance(pattern.value, Identifier):
+                        raise Unsupported("Some() of an error")
+                    matched = value != self.none
+                    self.assign(pattern.value.name, value, And(remaining, matched))
+                elif pattern.value.value == "_":
+                    matched = BoolVal(True)
                 else:
-                    val = self.eval_expr(inner.right)
-                
-                if var in self.state:
-                    self.state[var] = val
+                    matched = value == self.symbols.literal(pattern.value.value)
+                self.exec_body(body, And(remaining, matched))
+                remaining = And(remaining, Not(matched))
+        elif isinstance(stmt, Assign):
+            if not isinstance(stmt.left, Identifier):
+                raise Unsupported("assignment to a pair")
+            self.assign(stmt.left.name, self.value(self.eval_expr(stmt.right)), guard)
+        elif isinstance(stmt, Send):
+            count, message = self.outputs[stmt.direction]
+            self.outputs[stmt.direction] = (
+                If(guard, count + 1, count),
+                If(guard, self.message(stmt.msg), message),
+            )
+        elif isinstance(stmt, MethodCall):
+            if stmt.method in [MethodType.SET, MethodType.DELETE]:
+                array = self.container(stmt.obj)
+                key = self.value(self.eval_expr(stmt.args[0]))
+                if stmt.method == MethodType.SET:
+                    if len(stmt.args) != 2:
+                        raise Unsupported("set() without a key")
+                    value = self.value(self.eval_expr(stmt.args[1]))
                 else:
-                    self.locals[var] = val
-                    
-            elif isinstance(inner, Send):
-                payload = self.eval_expr(inner.msg)
-                self.send_log.append(payload)
-            elif isinstance(inner, MethodCall):
-                if inner.method == MethodType.SET:
-                    key = self.eval_expr(inner.args[0])
-                    val = self.eval_expr(inner.args[1])
-                    if inner.obj.name == "rpc":
-                        self.rpc = Store(self.rpc, key, val)
-                    else:
-                        arr = self.state[inner.obj.name]
-                        self.state[inner.obj.name] = Store(arr, key, val)
-                elif inner.method == MethodType.DELETE:
-                    arr = self.state[inner.obj.name]
-                    key = self.eval_expr(inner.args[0])
-                    self.state[inner.obj.name] = Store(arr, key, StringVal("None"))
-                elif inner.method == MethodType.GET:
-                    # No effect as a statement
-                    _ = self.eval_expr(inner)
+                    value = self.none
+                array = If(guard, Store(array, key, value), array)
+                if stmt.obj.name == self.rpc_name:
+                    self.rpc = array
                 else:
-                    raise NotImplementedError(f"Unsupported method call type in stmt: {inner.method}")
+                    self.state[stmt.obj.name] = array
             else:
-                raise NotImplementedError(f"Unknown statement type: {type(inner)}")
-            
-    def exec_action(self, action):
-        for stmt in action:
-            self.exec_stmt(stmt)
-
-    def exec_body(self, req_body, resp_body):
-        """
-        Executes the request and response bodies.
-        """
-        for stmt in req_body:
-            self.exec_stmt(stmt)
-        if resp_body:
-            for stmt in resp_body:
-                self.exec_stmt(stmt)
-
-    def bind_inputs(self, value):
-        """
-        Binds the input parameters to the symbolic values.
-        This is used to run the program with different inputs.
-        """
-        self.rpc = value
+                self.eval_expr(stmt)  # no effect
+        elif isinstance(stmt, Expr):
+            self.eval_expr(stmt)  # no effect
+        else:
+            raise Unsupported(f"statement {type(stmt).__name__}")
 
+    def exec_body(self, body: List[Statement], guard: BoolRef):
+        for stmt in body:
+            self.exec_stmt(stmt, guard)
+
+
+def states_equal(a: Dict[str, ExprRef], b: Dict[str, ExprRef]) -> BoolRef:
+    return And([a[k] == b[k] for k in a])
+
+
+def outputs_equal(a: Dict, b: Dict) -> BoolRef:
+    return And([And(a[d][0] == b[d][0], a[d][1] == b[d][1]) for d in a])
 
-def check_idempotent(program: Program) -> bool:
-    state_vars = [(s[0].name, s[1].name) for s in program.definition.state]
-    req_body = program.req.body
-    resp_body = program.resp.body
 
-    # First execution
-    env1 = SymbolicEnv(state_vars)
-    env1.exec_body(req_body, resp_body)
+def differences(program: Program, symbols: Symbols) -> Dict[str, BoolRef]:
+    """For each property, a formula that is satisfiable iff the element is sensitive."""
+    s0 = initial_state(program, symbols)
+    m1, m2 = RPC(symbols, "rpc1"), RPC(symbols, "rpc2")
 
-    # Second execution (same input/state)
-    env2 = SymbolicEnv(state_vars)
-    env2.state = env1.state.copy()
-    env2.exec_body(req_body, resp_body)
+    # The same RPC twice vs once
+    env = SymbolicEnv(program, symbols, s0)
+    once = env.run(m1)
+    s1 = dict(env.state)
+    twice = env.run(m1)
+    duplicate = Not(And(states_equal(s1, env.state), outputs_equal(once, twice)))
+
+    # m1 then m2 vs m2 then m1
+    env1 = SymbolicEnv(program, symbols, s0)
+    env1.run(m1)
+    out12 = env1.run(m2)
+    env2 = SymbolicEnv(program, symbols, s0)
+    env2.run(m2)
+    env2.run(m1)
+    reordered = Not(states_equal(env1.state, env2.state))
+
+    # m1 then m2 vs only m2
+    env3 = SymbolicEnv(program, symbols, s0)
+    out2 = env3.run(m2)
+    skipped = Not(And(states_equal(env1.state, env3.state), outputs_equal(out12, out2)))
+
+    return {"idempotent": duplicate, "ordering_sensitive": reordered, "requires_all_rpcs": skipped}
+
+
+def check(solver: Solver, formula: BoolRef) -> CheckSatResult:
+    solver.push()
+    solver.add(formula)
+    result = solver.check()
+    solver.pop()
+    return result
+
+
+def analyze_sensitivity(program: Program, timeout: Optional[int] = None) -> Dict[str, bool]:
+    """The idempotent, ordering_sensitive and requires_all_rpcs verdicts of an element.
+
+    Args:
+        program: The element IR.
+        timeout: The solver timeout of each query in milliseconds (default:
+            sensitivity_timeout()), 0 gives the conservative verdicts without analysis.
+    """
+    timeout = sensitivity_timeout() if timeout is None else timeout
+    verdicts = dict(CONSERVATIVE)
+    # Without state, the order and the number of RPCs cannot matter.
+    if len(program.definition.state) == 0:
+        verdicts["ordering_sensitive"] = verdicts["requires_all_rpcs"] = False
+    if timeout <= 0:
+        return verdicts
+    symbols = Symbols()
+    try:
+        formulas = differences(program, symbols)
+    except (Unsupported, Z3Exception) as e:
+        LOG.debug(f"Sensitivity analysis not supported: {e}")
+        return verdicts
 
-    # Z3 Check
     solver = Solver()
-    state_eq = And([env1.state[k] == env2.state[k] for k in env1.state])
-    sends_eq = And([env1.send_log[i] == env2.send_log[i] for i in range(len(env1.send_log))])
-    solver.add(Not(And(state_eq, sends_eq)))
+    solver.set("timeout", timeout)
+    solver.add(symbols.facts())
+    for key, formula in formulas.items():
+        if key != "idempotent" and not verdicts[key]:
+            continue
+        result = check(solver, formula)
+        if result == unknown:
+            LOG.debug(f"Sensitivity query {key} timed out: {solver.reason_unknown()}")
+            continue
+        sensitive = result == sat
+        verdicts[key] = not sensitive if key == "idempotent" else sensitive
+    return verdicts
+
+
+def check_idempotent(program: Program) -> bool:
+    return analyze_sensitivity(program)["idempotent"]
 
-    if solver.check() == sat:
-        print("❌ Not idempotent:", solver.model())
-        return False
-    else:
-        print("✅ Idempotent")
-        return True
 
 def check_ordering_sensitive(program: Program) -> bool:
-    # Step 1: Extract state variables and input parameters
-    state_vars = [(s[0].name, s[1].name) for s in program.definition.state]
-    req_body = program.req.body
-    resp_body = program.resp.body
-
-    # Step 2: Define two symbolic messages with different symbolic values
-    m1 = Array(f"rpc1", StringSort(), StringSort())
-    m2 = Array(f"rpc2", StringSort(), StringSort())
-    
-    # Step 3: Run m1 followed by m2
-    env1 = SymbolicEnv(state_vars)
-    env1.bind_inputs(m1)
-    env1.exec_body(req_body, resp_body)
-    env1.bind_inputs(m2)
-    env1.exec_body(req_body, resp_body)
-    state1, sends1 = env1.state.copy(), env1.send_log[:]
-
-    # Step 4: Run m2 followed by m1
-    env2 = SymbolicEnv(state_vars)
-    env2.bind_inputs(m2)
-    env2.exec_body(req_body, resp_body)
-    env2.bind_inputs(m1)
-    env2.exec_body(req_body, resp_body)
-    state2, sends2 = env2.state.copy(), env2.send_log[:]
-
-    # Step 5: Compare final symbolic state — ignore outputs for now
-    # TODO: check send logs as well. 
-    solver = Solver()
-    state_diff = Or([state1[k] != state2[k] for k in state1])
-    solver.add(state_diff)
-
-    if solver.check() == sat:
-        print("❌ Ordering-sensitive (based on state):", solver.model())
-        return False
-    else:
-        print("✅ Ordering-insensitive (based on state only)")
-        return True
-
-
-# TODO: fix the get and set example.
-def check_requires_all_rpcs(program) -> bool:
-    state_vars = [(s[0].name, s[1].name) for s in program.definition.state]
-    req_body = program.req.body
-    resp_body = program.resp.body
-
-    # Symbolic RPCs
-    m1 = Array("rpc1", StringSort(), StringSort())
-    m2 = Array("rpc2", StringSort(), StringSort())
-    
-    # Full execution: m1 then m2
-    env1 = SymbolicEnv(state_vars)
-    env1.bind_inputs(m1)
-    env1.exec_body(req_body, resp_body)
-    env1.bind_inputs(m2)
-    env1.exec_body(req_body, resp_body)
-    state1, sends1 = env1.state.copy(), set(env1.send_log[:])
-
-    # Skip execution: only m2
-    env2 = SymbolicEnv(state_vars)
-    env2.bind_inputs(m2)
-    env2.exec_body(req_body, resp_body)
-    state2, sends2 = env2.state.copy(), set(env2.send_log[:])
-
-    # Compare states and send sets
-    solver = Solver()
-    state_diff = Or([state1[k] != state2[k] for k in state1])
-    # TODO: check send logs as well. 
-    solver.add(state_diff)
-
-    if solver.check() == sat:
-        print("❌ Must see all RPCs — dropping one affects output or state")
-        print("Model:", solver.model())
-        return False
-    else:
-        print("✅ Can tolerate RPC drops — output and state unchanged")
-        return True
\ No newline at end of file
+    return analyze_sensitivity(program)["ordering_sensitive"]
+
+
+def check_requires_all_rpcs(program: Program) -> bool:
+    return analyze_sensitivity(program)["requires_all_rpcs"]
@@ -240,6 +240,9 @@ class ElementTransformer(Transformer):
     def const(self, c) -> Literal:
         return Literal(c[0])
 
+    def literal(self, c) -> Literal:
+        return Literal(c[0])
+
     # TODO: remove this function as err(xxx) will be recognized as a function
     # and handled in def func().
     def err(self, e) -> Error:
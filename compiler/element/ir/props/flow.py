@@ -1,4 +1,7 @@
-from typing import Dict, List, Optional, Tuple
+from __future__ import annotations
+
+import heapq
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
 
 from compiler.element.ir.props.analyzer import *
 from compiler.element.node import *
@@ -11,6 +14,9 @@ class Property:
         self.read: List[str] = []
         self.write: List[str] = []
         self.copy: bool = False
+        # Probability that a message is dropped (or blocked) if it only depends on literal
+        # probabilities (see branch_probability), else None. 0.0 if it is never dropped.
+        self.drop_rate: Optional[float] = 0.0
     
     def check(self):
         # Remove duplicate entries from the read and write lists
@@ -22,11 +28,101 @@ class Property:
         self.write = [i.strip("'") for i in self.write]
 
 
+def combine_drop_rates(*rates: Optional[float]) -> Optional[float]:
+    """The drop rate of elements applied one after the other, None if any of them is unknown."""
+    kept = 1.0
+    for rate in rates:
+        if rate is None:
+            return None
+        kept *= 1.0 - rate
+    # rounded, so that e.g. 0.05 stays 0.05 in property dumps and cache signatures
+    return round(1.0 - kept, 12)
+
+
+def assigned_names(stmts: List[Statement]) -> Set[str]:
+    """The names of the variables assigned anywhere in a block."""
+    names = set()
+    for s in stmts:
+        if type(s) is Statement:
+            s = s.stmt
+        if isinstance(s, Assign) and isinstance(s.left, Identifier):
+            names.add(s.left.name)
+        elif isinstance(s, Match):
+            for _, body in s.actions:
+                names |= assigned_names(body)
+        elif isinstance(s, Foreach):
+            names |= assigned_names(s.func.body)
+    return names
+
+
+def literal_value(node: Node, constants: Dict[str, float]) -> Optional[float]:
+    if isinstance(node, Literal):
+        try:
+            return float(node.value)
+        except ValueError:
+            return None
+    if isinstance(node, Identifier):
+        return constants.get(node.name)
+    return None
+
+
+def literal_constants(ir: Program) -> Dict[str, float]:
+    """State variables set to a number literal in init() and never assigned again."""
+    constants = {}
+    for s in ir.init.body:
+        if type(s) is Statement:
+            s = s.stmt
+        if isinstance(s, Assign) and isinstance(s.left, Identifier):
+            value = literal_value(s.right, {})
+            if value is not None:
+                constants[s.left.name] = value
+    for name in assigned_names(ir.req.body) | assigned_names(ir.resp.body):
+        constants.pop(name, None)
+    return constants
+
+
+def branch_probability(
+    expr: Node, pattern: Pattern, constants: Dict[str, float]
+) -> Optional[float]:
+    """The probability of taking a match branch, for `randomf(lower, upper) < p` and the like.
+
+    Returns None if the condition is not a comparison of randomf() with literal numbers.
+    """
+    # Subclasses of Expr (identifiers, calls) are not comparisons
+    if type(expr) is not Expr or expr.op not in [
+        Operator.LT,
+        Operator.LE,
+        Operator.GT,
+        Operator.GE,
+    ]:
+        return None
+    less = expr.op in [Operator.LT, Operator.LE]
+    if isinstance(expr.lhs, RandomFunc):
+        random, threshold = expr.lhs, literal_value(expr.rhs, constants)
+    elif isinstance(expr.rhs, RandomFunc):
+        # p < randomf(...) is randomf(...) > p
+        random, threshold, less = expr.rhs, literal_value(expr.lhs, constants), not less
+    else:
+        return None
+    lower, upper = literal_value(random.lower, constants), literal_value(random.upper, constants)
+    if threshold is None or lower is None or upper is None or upper <= lower:
+        return None
+    below = min(max((threshold - lower) / (upper - lower), 0.0), 1.0)
+    probability = below if less else 1.0 - below
+    if not isinstance(pattern.value, Literal) or pattern.value.value not in ["true", "false"]:
+        return None
+    return probability if pattern.value.value == "true" else 1.0 - probability
+
+
 class Edge:
-    def __init__(self, u: int, v: int, w: Tuple[Expr, Expr] = []) -> None:
+    """A control flow edge, w is (match expression, pattern) if it enters a match branch."""
+
+    def __init__(self, u: int, v: int, w: Tuple[Expr, Expr] = (), loop: bool = False) -> None:
         self.u = u
         self.v = v
         self.w = w
+        # enters the body of a foreach (which runs any number of times)
+        self.loop = loop
 
 
 class Vertex:
@@ -39,103 +135,208 @@ class Vertex:
             self.annotation = "[" + annotation + "]" + self.node.__class__.__name__
 
 
+# A kind of code path: (calls randomf/randomi, has dropped the message, has an unknown probability)
+PathKind = Tuple[bool, bool, bool]
+
+
+class FlowFacts:
+    """What holds on the code paths from the start of a procedure to a program point.
+
+    This is the lattice of the dataflow analysis, joined where paths merge:
+        aliases  names that may hold the rpc (or a value read from it) on some path
+        sends    the most sends of the rpc on one path, up to 2 (i.e., a copy)
+        paths    the kinds of paths that reach the point, with the total probability of those
+                 whose probability is known (see branch_probability)
+    """
+
+    def __init__(
+        self,
+        aliases: FrozenSet[str] = frozenset(),
+        sends: int = 0,
+        paths: Optional[Dict[PathKind, float]] = None,
+    ) -> None:
+        self.aliases = aliases
+        self.sends = sends
+        self.paths: Dict[PathKind, float] = {} if paths is None else paths
+
+    def join(self, other: FlowFacts) -> FlowFacts:
+        paths = dict(self.paths)
+        for kind, probability in other.paths.items():
+            paths[kind] = paths.get(kind, 0.0) + probability
+        return FlowFacts(self.aliases | other.aliases, max(self.sends, other.sends), paths)
+
+    def branch(self, probability: Optional[float]) -> FlowFacts:
+        """The facts after a branch taken with probability (None if unknown)."""
+        paths: Dict[PathKind, float] = {}
+        for (random, dropped, unknown), p in self.paths.items():
+            kind = (random, dropped, unknown or probability is None)
+            p = 0.0 if kind[2] else p * probability
+            paths[kind] = paths.get(kind, 0.0) + p
+        return FlowFacts(self.aliases, self.sends, paths)
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, FlowFacts)
+            and self.aliases == other.aliases
+            and self.sends == other.sends
+            and self.paths == other.paths
+        )
+
+    def __str__(self) -> str:
+        paths = ", ".join(
+            f"{'random ' if r else ''}{'drop' if d else 'pass'}"
+            + (" (unknown)" if u else f" ({p:.4f})")
+            for (r, d, u), p in sorted(self.paths.items())
+        )
+        return f"aliases={sorted(self.aliases)} sends={self.sends} paths=[{paths}]"
+
+
 class FlowGraph:
+    """The control flow graph of a procedure and a dataflow analysis of its properties.
+
+    Each vertex is a single statement (or the condition of a match, or the collection of a
+    foreach); the branches of a match and the body of a foreach are expanded into the graph, so
+    the analysis is linear in the size of the graph instead of the number of code paths.
+    """
+
     def __init__(self) -> None:
         self.vertices: List[Vertex] = []
         self.edges: List[Edge] = []
-        self.in_deg: Dict[int, int] = {}
+        self.succs: List[List[Edge]] = []
+        self.preds: List[List[Edge]] = []
 
-    def link(self, u: int, v: int, w: Tuple[Expr, Expr] = []) -> None:
-        self.edges.append(Edge(u, v, w))
-        if v in self.in_deg:
-            self.in_deg[v] += 1
-        else:
-            self.in_deg[v] = 1
+    def add_vertex(self, node: Node, annotation: Optional[str] = None) -> int:
+        v = Vertex(node, len(self.vertices), annotation)
+        self.vertices.append(v)
+        self.succs.append([])
+        self.preds.append([])
+        return v.idx
+
+    def link(self, u: int, v: int, w: Tuple[Expr, Expr] = (), loop: bool = False) -> None:
+        e = Edge(u, v, w, loop)
+        self.edges.append(e)
+        self.succs[u].append(e)
+        self.preds[v].append(e)
 
     def handle_block(self, block: List[Statement], prev: int) -> int:
         for s in block:
             assert isinstance(s, Statement)
-            v = Vertex(s, len(self.vertices))
-            self.vertices.append(v)
-            self.link(prev, v.idx)
-            prev = v.idx
+            if type(s) is Statement and isinstance(s.stmt, (Match, Foreach)):
+                s = s.stmt
+            if isinstance(s, Match):
+                prev = self.handle_match(s, prev)
+            elif isinstance(s, Foreach):
+                prev = self.handle_foreach(s, prev)
+            else:
+                v = self.add_vertex(s)
+                self.link(prev, v)
+                prev = v
         return prev
 
-    def handle_match(self, match: Match, prev: int) -> None:
-        expr_v = Vertex(Statement(match.expr), len(self.vertices), "match_expr")
-        self.vertices.append(expr_v)
-        self.link(prev, expr_v.idx)
-        prev = expr_v.idx
+    def handle_match(self, match: Match, prev: int) -> int:
+        expr_v = self.add_vertex(Statement(match.expr), "match_expr")
+        self.link(prev, expr_v)
 
         end_points = []
         for (p, s) in match.actions:
-            match len(s):
-                case 0:
-                    head = PASS_NODE  # empty statement, do nothing
-                    rest = []
-                case 1:
-                    head = s[0]
-                    rest = []
-                case _:
-                    head = s[0]
-                    rest = s[1:]
-            head_v = Vertex(head, len(self.vertices), "match_head")
-            self.vertices.append(head_v)
-            self.link(prev, head_v.idx, (expr_v.node, p))
-
-            if len(rest) == 0:
-                end_points.append(head_v.idx)
-            else:
-                end_points.append(self.handle_block(rest, head_v.idx))
+            head_v = self.add_vertex(PASS_NODE, "match_head")
+            self.link(expr_v, head_v, (self.vertices[expr_v].node, p))
+            end_points.append(self.handle_block(s, head_v))
 
-        merge_v = Vertex(PASS_NODE, len(self.vertices), "match_merge")
-        self.vertices.append(merge_v)
+        merge_v = self.add_vertex(PASS_NODE, "match_merge")
         for ep in end_points:
-            self.link(ep, merge_v.idx)
+            self.link(ep, merge_v)
+        return merge_v
 
-        return merge_v.idx
+    def handle_foreach(self, foreach: Foreach, prev: int) -> int:
+        # The body runs any number of times: loop back to the head, and leave from it.
+        head_v = self.add_vertex(Statement(foreach.var), "foreach")
+        self.link(prev, head_v)
+        body_v = self.add_vertex(PASS_NODE, "foreach_body")
+        self.link(head_v, body_v, loop=True)
+        self.link(self.handle_block(foreach.func.body, body_v), head_v)
+        exit_v = self.add_vertex(PASS_NODE, "foreach_exit")
+        self.link(head_v, exit_v)
+        return exit_v
 
     def build_graph(self, proc: Procedure) -> None:
-        start_v = Vertex(START_NODE, 0, "start")
-        end_v = Vertex(END_NODE, 1, "end")
-        self.vertices.append(start_v)
-        self.vertices.append(end_v)
-        prev = 0
-        for body in proc.body:
-            # order matters, since match is a subclass of statement
-            if isinstance(body, Match):
-                prev = self.handle_match(body, prev)
-            elif isinstance(body, Statement):
-                prev = self.handle_block([body], prev)
+        start_v = self.add_vertex(START_NODE, "start")
+        prev = self.handle_block(proc.body, start_v)
+        end_v = self.add_vertex(END_NODE, "end")
+        self.link(prev, end_v)
+
+    def transfer(self, v: Vertex, facts: FlowFacts, rpc_name: str, direction: str) -> FlowFacts:
+        """The facts after the statement of v."""
+        aa = AliasAnalyzer(rpc_name)
+        aa.targets = sorted(facts.aliases)
+        targets = aa.visitBlock([v.node], None)
+
+        da = DropAnalyzer(targets, direction)
+        dropped = da.visitBlock([v.node], None)
+        paths: Dict[PathKind, float] = {}
+        for (random, drop, unknown), p in facts.paths.items():
+            kind = (random or da.random_included, drop or dropped, unknown)
+            paths[kind] = paths.get(kind, 0.0) + p
+
+        sends = CopyAnalyzer(targets).visitBlock([v.node], None)
+        return FlowFacts(frozenset(targets), min(facts.sends + sends, 2), paths)
+
+    def solve(
+        self, rpc_name: str, direction: str, constants: Dict[str, float]
+    ) -> List[Optional[FlowFacts]]:
+        """Compute the facts after each vertex with a worklist, None if it is unreachable.
+
+        Vertices are created in program order, so taking the smallest one first visits every
+        vertex once, except for the bodies of foreach loops until their facts are stable.
+        """
+        out: List[Optional[FlowFacts]] = [None] * len(self.vertices)
+        # The probability of each match branch, computed once
+        branch_probability_of = {
+            id(e): (None if e.loop else branch_probability(e.w[0].stmt, e.w[1], constants))
+            for e in self.edges
+            if e.loop or len(e.w) > 0
+        }
+        worklist = [0]
+        queued = {0}
+        while len(worklist) > 0:
+            u = heapq.heappop(worklist)
+            queued.remove(u)
+            if u == 0:
+                facts = FlowFacts(frozenset([rpc_name]), 0, {(False, False, False): 1.0})
             else:
-                raise Exception("build graph encountered: ", body.__class__.__name__)
-
-        self.link(prev, end_v.idx)
-
-    def extract_path(self) -> List[List[Vertex]]:
-        q = [0]
-        ret: Dict[int, List[List[Vertex]]] = {}
-        ret[0] = [[self.vertices[0]]]
-        while len(q) > 0:
-            u = q.pop()
-            for e in self.edges:
-                if e.u == u:
-                    v = self.vertices[e.v]
-                    paths = ret[u].copy()
-                    paths = [p + [v] for p in paths]
-                    if e.v not in ret:
-                        ret[e.v] = paths
-                    else:
-                        ret[e.v] = ret[e.v] + paths
-                    self.in_deg[e.v] -= 1
-                    if self.in_deg[e.v] == 0:
-                        q.append(e.v)
-        return ret[1]
-
-    def analyze(self, proc: Procedure, verbose: bool = False) -> Property:
-        # Paths represent all possible code path of this element
+                facts = None
+                for e in self.preds[u]:
+                    if out[e.u] is None:
+                        continue
+                    incoming = out[e.u]
+                    if id(e) in branch_probability_of:
+                        incoming = incoming.branch(branch_probability_of[id(e)])
+                    facts = incoming if facts is None else facts.join(incoming)
+            new_out = self.transfer(self.vertices[u], facts, rpc_name, direction)
+            if new_out != out[u]:
+                out[u] = new_out
+                for e in self.succs[u]:
+                    if e.v not in queued:
+                        heapq.heappush(worklist, e.v)
+                        queued.add(e.v)
+        return out
+
+    def analyze(
+        self,
+        proc: Procedure,
+        verbose: bool = False,
+        constants: Optional[Dict[str, float]] = None,
+    ) -> Property:
+        """Analyze the properties of a procedure over all its code paths.
+
+        Args:
+            proc: The req or resp procedure.
+            verbose: Print the facts after each statement.
+            constants: Values of the state variables that never change (see literal_constants),
+                used to compute the drop rate of random drops.
+        """
+        constants = constants or {}
         self.build_graph(proc)
-        paths = self.extract_path()
         # rpc_name = f"rpc_{proc.name}"
         rpc_name = "rpc"
 
@@ -145,59 +346,39 @@ class FlowGraph:
         elif proc.name == "resp":
             direction = "Up"
 
-        report = "Total #Path = " + str(len(paths)) + "\n"
-
+        out = self.solve(rpc_name, direction, constants)
         ret = Property()
 
-        # Visit every possible code path and take a union of the operation
-        for path in paths:
-            report += "\nFor path: \n     "
-            report += "->".join([v.annotation for v in path if v != self.vertices[-1]])
-            report += "\n\n"
-            path_nodes = [v.node for v in path]
-            aa = AliasAnalyzer(rpc_name)
-            targets = aa.visitBlock(path_nodes, None)
+        # Reads and writes of the rpc (and its aliases) by each reachable statement
+        report = "Total #Vertex = " + str(len(self.vertices)) + "\n"
+        for v, facts in zip(self.vertices, out):
+            if facts is None:
+                continue
+            report += f"{v.annotation}: {facts}\n"
+            targets = sorted(facts.aliases)
             wa = WriteAnalyzer(targets)
-            write = wa.visitBlock(path_nodes, None)
-            if write:
-                write_fields = wa.target_fields
-                report += "Write: "
-                for (k, v) in write_fields.items():
-                    for vv in v:
-                        report += f"{vv} "
-                        ret.write.append(vv[0])
-                report += "\n"
-
+            if wa.visitBlock([v.node], None):
+                for fields in wa.target_fields.values():
+                    ret.write.extend(field[0] for field in fields)
             ra = ReadAnalyzer(targets)
-            read = ra.visitBlock(path_nodes, None)
-
-            if read:
-                read_fields = ra.target_fields
-                report += "Read: "
-                for (k, v) in read_fields.items():
-                    for vv in v:
-                        report += f"({vv}) "
-                        ret.read.append(vv)
-                report += "\n"
-
-            da = DropAnalyzer(targets, direction)
-            may_drop = da.visitBlock(path_nodes, None)
-            random_drop = da.random_included and may_drop
-
-            if random_drop:
-                report += "Random Drop(Block)\n"
-                ret.block = True
-            else:
-                report += "No Drop" if may_drop else "Possible Drop"
-                ret.drop = ret.drop or may_drop
-                report += "\n"
+            if ra.visitBlock([v.node], None):
+                for fields in ra.target_fields.values():
+                    ret.read.extend(fields)
 
-            ca = CopyAnalyzer(targets)
-            copy = ca.visitBlock(path_nodes, None)
-            ret.copy = ret.copy or (copy > 1)
-            report += f"Copy #={copy}" if copy > 1 else "No Copy"
-            report += "\n"
+        end = out[-1]
+        if end is not None:
+            # Drops on paths that call randomf()/randomi() are random, i.e., blocks
+            ret.block = any(random and dropped for random, dropped, _ in end.paths)
+            ret.drop = any(not random and dropped for random, dropped, _ in end.paths)
+            ret.copy = end.sends > 1
+            if any(dropped and unknown for _, dropped, unknown in end.paths):
+                ret.drop_rate = None
+            else:
+                drop_rate = sum((p for (_, dropped, _), p in end.paths.items() if dropped), 0.0)
+                ret.drop_rate = min(drop_rate, 1.0)
 
         if verbose:
+            rate = "unknown" if ret.drop_rate is None else f"{ret.drop_rate:.4f}"
+            report += f"Drop rate: {rate}\n"
             print(report)
         return ret
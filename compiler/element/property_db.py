@@ -0,0 +1,174 @@
+"""
+Persistent store of element properties (`--property_db PATH`).
+
+The optimizer only needs the properties of each element (read/write/record fields,
+drop/block/copy, drop rate, state consistency, combiner and dependence), not its sources.
+The store keeps them in a yaml file, keyed by the hash of the element sources and name:
+
+    version: 1
+    elements:
+      <source hash>:
+        name: [ratelimit]
+        paths: [/path/to/ratelimit.appnet]
+        analyzer: <compiler version>            # absent in hand-written entries
+        properties: {state: {...}, request: {...}, response: {...}}
+        override: {request: {drop_rate: 0.02}}  # optional, hand-curated
+
+Entries written by the analysis record the version of the analysis code (see
+compiler_version()), and are analyzed again when it changes, keeping their override (which
+also applies to the new analysis).
+Entries without an analyzer are hand-written and used as is. The override of an entry
+is merged into its properties key by key, so analyzed and curated properties coexist.
+
+Elements whose sources are not available are looked up by name and paths (the latest
+entry wins), so that the optimizer can run on a machine without the `.appnet` files.
+"""
+import hashlib
+import os
+import tempfile
+from copy import deepcopy
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from compiler.element.cache import compiler_version
+from compiler.element.logger import ELEMENT_LOG as LOG
+
+PROPERTY_DB_VERSION = 1
+
+
+def source_hash(paths: List[str], name: List[str]) -> str:
+    """Hash the contents of the element sources together with the element name.
+
+    Unlike source_digest(), the hash does not depend on the compiler version, so that
+    entries outlive changes of the analysis code.
+    """
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    h.update(b"\0" + str(list(name)).encode())
+    return h.hexdigest()
+
+
+def merge_properties(prop: Dict, override: Dict) -> Dict:
+    """Merge an override into properties, recursively for nested sections."""
+    merged = deepcopy(prop)
+    for k, v in override.items():
+        if isinstance(v, dict) and isinstance(merged.get(k), dict):
+            merged[k] = merge_properties(merged[k], v)
+        else:
+            merged[k] = deepcopy(v)
+    return merged
+
+
+class PropertyDB:
+    """Element properties by source hash, loaded from and saved to a yaml file (see above)."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, path: Optional[str] = None):
+        """Forget all entries, then load the database at path (if it exists)."""
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.dirty = False
+        if path is None or not os.path.exists(path):
+            return
+        with open(path, "r") as f:
+            db = yaml.safe_load(f) or {}
+        version = db.get("version", PROPERTY_DB_VERSION)
+        if version != PROPERTY_DB_VERSION:
+            raise ValueError(f"{path}: unsupported property database version {version}")
+        self.entries = db.get("elements") or {}
+        for key, entry in self.entries.items():
+            if "name" not in entry or "paths" not in entry:
+                raise ValueError(f"{path}: entry {key} must have a name and paths")
+        LOG.info(f"Loaded the properties of {len(self.entries)} elements from {path}")
+
+    def find(
+        self, name: List[str], paths: List[str]
+    ) -> Tuple[Optional[str], Optional[Dict]]:
+        """The (key, entry) of an element, or (key, None) if it is not in the database.
+
+        The key is None if the sources of the element are not available.
+        """
+        if all(os.path.exists(path) for path in paths):
+            key = source_hash(paths, name)
+            return key, self.entries.get(key)
+        for entry in reversed(list(self.entries.values())):
+            if list(entry["name"]) == list(name) and list(entry["paths"]) == list(
+                paths
+            ):
+                return None, entry
+        return None, None
+
+    def is_stale(self, entry: Dict) -> bool:
+        return "analyzer" in entry and entry["analyzer"] != compiler_version()
+
+    def lookup(self, name: List[str], paths: List[str]) -> Optional[Dict]:
+        """The properties of an element with its override, or None if it must be analyzed.
+
+        Stale entries are only used when the sources are not available.
+        """
+        key, entry = self.find(name, paths)
+        if entry is None or (key is not None and self.is_stale(entry)):
+            return None
+        if key is None and self.is_stale(entry):
+            LOG.warning(
+                f"Using properties of {'+'.join(name)} analyzed by another compiler version "
+                "(sources not available)"
+            )
+        return merge_properties(
+            entry.get("properties") or {}, entry.get("override") or {}
+        )
+
+    def apply_override(self, name: List[str], paths: List[str], prop: Dict) -> Dict:
+        """Analyzed properties of an element with the override of its entry (stale or not)."""
+        _, entry = self.find(name, paths)
+        if entry is None or not entry.get("override"):
+            return prop
+        return merge_properties(prop, entry["override"])
+
+    def add(self, name: List[str], paths: List[str], prop: Dict):
+        """Record the analyzed properties of an element, unless it has an up-to-date entry.
+
+        prop must not include the override (see apply_override()), which is kept as is.
+        """
+        key, entry = self.find(name, paths)
+        if key is None or (entry is not None and not self.is_stale(entry)):
+            return
+        new_entry = {
+            "name": list(name),
+            "paths": list(paths),
+            "analyzer": compiler_version(),
+            "properties": deepcopy(prop),
+        }
+        if entry is not None and "override" in entry:
+            new_entry["override"] = entry["override"]
+        self.entries[key] = new_entry
+        self.dirty = True
+
+    def save(self, path: Optional[str] = None):
+        """Write the database to path (default: where it was loaded from)."""
+        path = path or self.path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Write to a temporary file first, so an interrupted run keeps the old database.
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp"
+        )
+        with os.fdopen(fd, "w") as f:
+            yaml.safe_dump(
+                {"version": PROPERTY_DB_VERSION, "elements": self.entries},
+                f,
+                default_flow_style=False,
+                sort_keys=False,
+            )
+        # mkstemp() creates the file readable by its owner only.
+        os.chmod(tmp_path, os.stat(path).st_mode if os.path.exists(path) else 0o644)
+        os.replace(tmp_path, path)
+        self.dirty = False
+        LOG.info(f"Saved the properties of {len(self.entries)} elements to {path}")
+
+
+PROPERTY_DB = PropertyDB()
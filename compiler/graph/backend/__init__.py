@@ -17,6 +17,7 @@ from compiler.graph.backend.utils import (
     get_node_names,
 )
 from compiler.graph.ir import GraphIR
+from compiler.graph.ir.cost_model import REPLICAS
 from compiler.graph.logger import GRAPH_BACKEND_LOG
 
 backends = ["grpc", "sidecar", "ambient", "arpc"]
@@ -64,10 +65,8 @@ def attach_volumes_and_adjust_replica(app_manifest_file: str) -> list[any]:
         # Find the corresponding service in the manifest
         target_service_yml = find_target_yml(yml_list, service)
 
-        # Adjust replica count if SERVICE_REPLICA exists
-        replica = os.getenv("SERVICE_REPLICA")
-        if replica is not None:
-            target_service_yml["spec"]["replicas"] = int(replica)
+        # Adjust replica count
+        target_service_yml["spec"]["replicas"] = REPLICAS.deployed(service)
 
         # Attach the element to the sidecar using volumes
         if "volumes" not in target_service_yml["spec"]["template"]["spec"]:
@@ -3,7 +3,7 @@ from __future__ import annotations
 import argparse
 import os
 from copy import deepcopy
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import yaml
 
@@ -13,49 +13,27 @@ from compiler.graph.backend.boilerplate import (
     attach_yml_ambient_native,
     attach_yml_ambient_wasm,
 )
+from compiler.graph.backend.cargo import build_wasm_elements
 from compiler.graph.backend.imagehub import HUB_NAME
 from compiler.graph.backend.utils import *
 from compiler.graph.ir import GraphIR
 from compiler.graph.logger import GRAPH_BACKEND_LOG
+from compiler.graph.profiler import PROFILER
 
 
-def compile_wasm_elements(girs: Dict[str, GraphIR]):
+def compile_wasm_elements(girs: Dict[str, GraphIR], jobs: Optional[int] = None):
     global wasm_not_empty
     wasm_not_empty = False
-    compiled_elements = set()
+    crates = dict()
     for gir in girs.values():
         for element in gir.elements["ambient"]:
-            if (
-                element.lib_name not in compiled_elements
-                and element.target == "ambient_wasm"
-            ):
+            if element.lib_name not in crates and element.target == "ambient_wasm":
                 wasm_not_empty = True
-                compiled_elements.add(element.lib_name)
-                impl_dir = os.path.join(
+                crates[element.lib_name] = os.path.join(
                     local_gen_dir, f"{element.lib_name}_{element.target}"
                 )
-                # Compile
-                execute_local(
-                    [
-                        "cargo",
-                        "build",
-                        "--target=wasm32-wasi",
-                        "--manifest-path",
-                        os.path.join(impl_dir, "Cargo.toml"),
-                        "--release",
-                    ]
-                )
-                # copy binary to /tmp/appnet
-                execute_local(
-                    [
-                        "cp",
-                        os.path.join(
-                            impl_dir,
-                            f"target/wasm32-wasi/release/{element.lib_name}.wasm",
-                        ),
-                        "/tmp/appnet",
-                    ]
-                )
+    # Compile and copy binaries to /tmp/appnet
+    build_wasm_elements(crates, "/tmp/appnet", jobs)
 
 
 def generate_native_element_image(girs: Dict[str, GraphIR]):
@@ -251,7 +229,8 @@ def scriptgen_ambient(
 
     GRAPH_BACKEND_LOG.info("Compiling elements for ambient. This might take a while...")
     # Compile wasm elements
-    compile_wasm_elements(girs)
+    with PROFILER.span("build", "ambient wasm elements (cargo)", GRAPH_BACKEND_LOG):
+        compile_wasm_elements(girs, args.build_jobs)
 
     # Copy the istio-proxy source code to the generated directory
     global generated_istio_proxy_path
@@ -274,7 +253,10 @@ def scriptgen_ambient(
     )
     generate_native_element_image(girs)
     if native_not_empty:
-        compile_native_image()
+        with PROFILER.span(
+            "build", "ambient istio proxy image (bazel)", GRAPH_BACKEND_LOG
+        ):
+            compile_native_image()
 
     with open(app_install_file, "r") as f:
         yml_list_istio = list(yaml.safe_load_all(f))
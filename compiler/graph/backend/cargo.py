@@ -0,0 +1,114 @@
+"""
+Build scheduler for the generated wasm elements.
+
+All crates of a backend are built by a single cargo invocation over a temporary
+workspace, so that cargo compiles them in parallel (bounded by the job limit) and
+the shared dependencies (proxy-wasm, prost, serde_json, ...) are compiled once.
+The target directory is shared across backends and runs.
+"""
+import hashlib
+import os
+from typing import Dict, Optional
+
+from compiler import cache_base_dir
+from compiler.graph.backend.utils import execute_local
+from compiler.graph.logger import GRAPH_BACKEND_LOG
+
+WASM_TARGET = "wasm32-wasip1"
+
+# Generated files that determine the compiled binary of an element crate.
+_CRATE_SOURCES = ["Cargo.toml", "build.rs", "src/lib.rs"]
+
+# lib_name -> digest of the crate that was built (and installed) in this run.
+_built_crates: Dict[str, str] = {}
+
+
+def cargo_target_dir() -> str:
+    """The target directory shared by all wasm builds (CARGO_TARGET_DIR if set)."""
+    return os.getenv("CARGO_TARGET_DIR", os.path.join(cache_base_dir, "cargo-target"))
+
+
+def crate_digest(impl_dir: str) -> str:
+    h = hashlib.sha256()
+    for name in sorted(os.listdir(impl_dir)):
+        # The proto file is copied next to the manifest by the element backend.
+        if name.endswith(".proto"):
+            h.update(name.encode())
+            with open(os.path.join(impl_dir, name), "rb") as f:
+                h.update(f.read())
+    for rel in _CRATE_SOURCES:
+        h.update(rel.encode())
+        with open(os.path.join(impl_dir, rel), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def build_wasm_elements(
+    crates: Dict[str, str], install_dir: str, jobs: Optional[int] = None
+):
+    """Build the given wasm crates and copy the binaries into install_dir.
+
+    Crates that were already built in this run with identical sources (e.g., by the
+    sidecar backend before the ambient backend) are skipped.
+
+    Args:
+        crates: A dictionary mapping the lib_name of an element to its crate directory.
+            All crates must live in the same parent directory.
+        install_dir: Where the .wasm binaries are copied to.
+        jobs: The maximum number of parallel cargo jobs (default: number of CPUs).
+    """
+    digests = {lib_name: crate_digest(d) for lib_name, d in crates.items()}
+    pending = {
+        lib_name: impl_dir
+        for lib_name, impl_dir in crates.items()
+        if _built_crates.get(lib_name) != digests[lib_name]
+    }
+    for lib_name in [lib_name for lib_name in crates if lib_name not in pending]:
+        GRAPH_BACKEND_LOG.info(f"{lib_name}.wasm is already built, skip.")
+    if len(pending) == 0:
+        return
+
+    gen_dir = os.path.dirname(next(iter(pending.values())))
+    assert all(
+        os.path.dirname(impl_dir) == gen_dir for impl_dir in pending.values()
+    ), "wasm crates must share the same parent directory"
+    workspace_manifest = os.path.join(gen_dir, "Cargo.toml")
+    workspace_lock = os.path.join(gen_dir, "Cargo.lock")
+    members = ", ".join(
+        f'"{os.path.basename(impl_dir)}"' for impl_dir in sorted(pending.values())
+    )
+    with open(workspace_manifest, "w") as f:
+        f.write(f'[workspace]\nresolver = "2"\nmembers = [{members}]\n')
+
+    target_dir = cargo_target_dir()
+    cmd = [
+        "cargo",
+        "build",
+        f"--target={WASM_TARGET}",
+        "--manifest-path",
+        workspace_manifest,
+        "--release",
+    ]
+    if jobs is not None:
+        cmd.append(f"--jobs={jobs}")
+    GRAPH_BACKEND_LOG.info(
+        f"Building {len(pending)} wasm element(s) with target directory {target_dir}..."
+    )
+    try:
+        execute_local(cmd, env={"CARGO_TARGET_DIR": target_dir})
+    finally:
+        # The workspace only exists for this build, standalone builds of the crates
+        # (e.g., via build.sh) must not pick it up.
+        for path in [workspace_manifest, workspace_lock]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    for lib_name in pending:
+        execute_local(
+            [
+                "cp",
+                os.path.join(target_dir, WASM_TARGET, "release", f"{lib_name}.wasm"),
+                install_dir,
+            ]
+        )
+        _built_crates[lib_name] = digests[lib_name]
@@ -14,6 +14,7 @@ from compiler.graph.backend import BACKEND_CONFIG_DIR
 from compiler.graph.backend.boilerplate import attach_yml_native
 from compiler.graph.backend.utils import *
 from compiler.graph.ir import GraphIR
+from compiler.graph.ir.cost_model import REPLICAS
 from compiler.graph.logger import GRAPH_BACKEND_LOG
 
 
@@ -439,11 +440,9 @@ def scriptgen_envoy_native(
     #     pass
 
     # Adjust replica count
-    replica = os.getenv("SERVICE_REPLICA")
-    if replica is not None:
-        for sname in services:
-            target_yml = find_target_yml(yml_list_istio, sname)
-            target_yml["spec"]["replicas"] = int(replica)
+    for sname in services:
+        target_yml = find_target_yml(yml_list_istio, sname)
+        target_yml["spec"]["replicas"] = REPLICAS.deployed(sname)
 
     # Dump the final manifest file (somehow there is a None)
     yml_list_istio = [yml for yml in yml_list_istio if yml is not None]
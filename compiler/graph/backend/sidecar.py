@@ -3,7 +3,7 @@ from __future__ import annotations
 import argparse
 import os
 from copy import deepcopy
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import yaml
 
@@ -13,49 +13,28 @@ from compiler.graph.backend.boilerplate import (
     attach_yml_sidecar_native,
     attach_yml_sidecar_wasm,
 )
+from compiler.graph.backend.cargo import build_wasm_elements
 from compiler.graph.backend.imagehub import HUB_NAME
 from compiler.graph.backend.utils import *
 from compiler.graph.ir import GraphIR
+from compiler.graph.ir.bypass import sidecar_bypass
 from compiler.graph.logger import GRAPH_BACKEND_LOG
+from compiler.graph.profiler import PROFILER
 
 
-def compile_wasm_elements(girs: Dict[str, GraphIR]):
+def compile_wasm_elements(girs: Dict[str, GraphIR], jobs: Optional[int] = None):
     global wasm_not_empty
     wasm_not_empty = False
-    compiled_elements = set()
+    crates = dict()
     for gir in girs.values():
         for element in gir.elements["client_sidecar"] + gir.elements["server_sidecar"]:
-            if (
-                element.lib_name not in compiled_elements
-                and element.target == "sidecar_wasm"
-            ):
+            if element.lib_name not in crates and element.target == "sidecar_wasm":
                 wasm_not_empty = True
-                compiled_elements.add(element.lib_name)
-                impl_dir = os.path.join(
+                crates[element.lib_name] = os.path.join(
                     local_gen_dir, f"{element.lib_name}_{element.target}"
                 )
-                # Compile
-                execute_local(
-                    [
-                        "cargo",
-                        "build",
-                        "--target=wasm32-wasip1",
-                        "--manifest-path",
-                        os.path.join(impl_dir, "Cargo.toml"),
-                        "--release",
-                    ]
-                )
-                # copy binary to /tmp/appnet
-                execute_local(
-                    [
-                        "cp",
-                        os.path.join(
-                            impl_dir,
-                            f"target/wasm32-wasip1/release/{element.lib_name}.wasm",
-                        ),
-                        "/tmp/appnet",
-                    ]
-                )
+    # Compile and copy binaries to /tmp/appnet
+    build_wasm_elements(crates, "/tmp/appnet", jobs)
 
 
 def generate_native_element_image(girs: Dict[str, GraphIR]):
@@ -252,7 +231,8 @@ def scriptgen_sidecar(
 
     GRAPH_BACKEND_LOG.info("Compiling elements for sidecar. This might take a while...")
     # Compile wasm elements
-    compile_wasm_elements(girs)
+    with PROFILER.span("build", "sidecar wasm elements (cargo)", GRAPH_BACKEND_LOG):
+        compile_wasm_elements(girs, args.build_jobs)
 
     # Copy the istio-proxy source code to the generated directory
     global generated_istio_proxy_path
@@ -275,7 +255,10 @@ def scriptgen_sidecar(
     )
     generate_native_element_image(girs)
     if native_not_empty:
-        compile_native_image()
+        with PROFILER.span(
+            "build", "sidecar istio proxy image (bazel)", GRAPH_BACKEND_LOG
+        ):
+            compile_native_image()
 
     # for file_or_dir in os.listdir(app_manifest_dir):
     #     if app_name not in file_or_dir:
@@ -324,11 +307,11 @@ def scriptgen_sidecar(
             yml_list = list(yaml.safe_load_all(f))
             for obj_yml in yml_list:
                 if obj_yml and "kind" in obj_yml and obj_yml["kind"] == "Deployment":
-                    
+
                     # Skip the jaeger deployment
                     if obj_yml["metadata"]["name"] == "jaeger":
                         continue
-                    
+
                     for container_yaml in (
                         obj_yml["spec"]["template"]["spec"]["containers"]
                         + obj_yml["spec"]["template"]["spec"]["initContainers"]
@@ -363,23 +346,13 @@ def scriptgen_sidecar(
         )
     )
 
-    whitelist_port, blacklist_port = {}, {}
-    for sname in services_all:
-        whitelist_port[(sname, "C")] = set()
-        whitelist_port[(sname, "S")] = set()
-        blacklist_port[(sname, "C")] = []
-        blacklist_port[(sname, "S")] = []
-
-    # Generate webdis configs and collect bypass info
+    # Generate webdis configs
     webdis_configs = []
     for gir in girs.values():
         elist = [(e, gir.client) for e in gir.elements["client_sidecar"]] + [
             (e, gir.server) for e in gir.elements["server_sidecar"]
         ]
         for (element, sname) in elist:
-            placement = "C" if sname == gir.client else "S"
-            whitelist_port[(sname, placement)].add(service_to_port_number[gir.server])
-
             # If the element is stateful and requires strong consistency, deploy a webdis instance
             if (
                 # hasattr(element, "_prop") and
@@ -418,16 +391,10 @@ def scriptgen_sidecar(
 
     if os.getenv("APPNET_NO_OPTIMIZE") != "1":
         # has optimization: exclude ports that has no element attached to
-        for client, server in app_edges:
-            port_number = service_to_port_number[server]
-            if port_number not in whitelist_port[(client, "C")]:
-                blacklist_port[(client, "C")].append(port_number)
-            if port_number not in whitelist_port[(server, "S")]:
-                blacklist_port[(server, "S")].append(port_number)
-        # bypass frontend ingress sidecar
-        if "frontend" in services:
-            blacklist_port[("frontend", "S")].append(service_to_port_number["frontend"])
-        for (sname, placement), portlist in blacklist_port.items():
+        for (sname, placement), peers in sidecar_bypass(
+            girs, app_edges, services
+        ).items():
+            portlist = [service_to_port_number[peer] for peer in peers]
             if portlist != []:
                 annotation_name = (
                     "traffic.sidecar.istio.io/excludeOutboundPorts"
@@ -1,13 +1,20 @@
 from __future__ import annotations
 
 from copy import deepcopy
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 
 from rich import box
 from rich.panel import Panel
 
 from compiler.graph.ir.element import AbsElement
-from compiler.graph.ir.optimization import cost_chain_optimize, basic_heuristics
+from compiler.graph.ir.local_search import anytime_chain_placement
+from compiler.graph.ir.mip import MIP_TIME_LIMIT, mip_chain_placement
+from compiler.graph.ir.optimization import (
+    basic_heuristics,
+    consolidate_subchains,
+    cost_chain_placement,
+)
+from compiler.graph.ir.placement import dp_chain_placement
 
 
 def make_service_rich(name: str) -> Panel:
@@ -28,9 +35,12 @@ def make_service_rich(name: str) -> Panel:
     )
 
 def get_initial_target(current_mode: str, processor: List[str]) -> str:
+    """The first of the processors in current_mode, or the mode itself if the element does not
+    declare one (AbsElement then picks the implementation)."""
     for p in processor:
         if current_mode in p:
             return p
+    return current_mode
 
 
 class GraphIR:
@@ -84,6 +94,7 @@ class GraphIR:
                     AbsElement(
                         chain[i],
                         server=server,
+                        client=client,
                         initial_position="ambient",
                         initial_target="ambient_wasm",
                     )
@@ -107,8 +118,9 @@ class GraphIR:
                 AbsElement(
                     element,
                     server=server,
+                    client=client,
                     initial_position="client",
-                    initial_target=get_initial_target(current_mode, element["processor"]),
+                    initial_target=get_initial_target(current_mode, element.get("processor", [])),
                 ),
             )
         current_mode = "sidecar"
@@ -125,8 +137,9 @@ class GraphIR:
                 AbsElement(
                     element,
                     server=server,
+                    client=client,
                     initial_position="server",
-                    initial_target=get_initial_target(current_mode, element["processor"]),
+                    initial_target=get_initial_target(current_mode, element.get("processor", [])),
                 )
             )
 
@@ -153,6 +166,7 @@ class GraphIR:
                     edict1,
                     partner=pdict["name2"],
                     server=server,
+                    client=client,
                     initial_position="client",
                     initial_target="sidecar_wasm",
                 )
@@ -163,6 +177,7 @@ class GraphIR:
                     edict2,
                     partner=pdict["name1"],
                     server=server,
+                    client=client,
                     initial_position="server",
                     initial_target="sidecar_wasm",
                 ),
@@ -229,19 +244,52 @@ class GraphIR:
             + self.elements["server_grpc"]
         )
 
-    def optimize(self, opt_level: str, algorithm: str, dump_property: bool):
-        """Run optimization algorithm on the graphir."""
-        if algorithm == "cost":
-            elements = cost_chain_optimize(
+    def optimize(
+        self,
+        opt_level: str,
+        algorithm: str,
+        mip_time_limit: float = MIP_TIME_LIMIT,
+        jobs: int = 1,
+        timeout: Optional[float] = None,
+    ):
+        """Run optimization algorithm on the graphir.
+
+        With a timeout (in seconds), cost returns the best placement found within it (see
+        local_search.py) and mip stops the solver at the timeout if it is shorter than its limit.
+        """
+        if algorithm == "heuristics":
+            assert opt_level != "no", "conflicting optimization configs"
+            self.elements = basic_heuristics(self.elements)
+            return
+        chain = self.place(opt_level, algorithm, mip_time_limit, jobs, timeout)
+        if opt_level != "no":
+            self.elements = consolidate_subchains(chain)
+
+    def place(
+        self,
+        opt_level: str,
+        algorithm: str,
+        mip_time_limit: float = MIP_TIME_LIMIT,
+        jobs: int = 1,
+        timeout: Optional[float] = None,
+    ) -> List[AbsElement]:
+        """The complete chain placed by an optimization algorithm (see optimize()), before
+        adjacent elements on the same target are fused. Its cost() is the cost the algorithm
+        minimized, which fusing the elements changes."""
+        if algorithm == "cost" and timeout is not None:
+            return anytime_chain_placement(
+                self.complete_chain(), "both", opt_level, timeout, jobs
+            )
+        elif algorithm == "cost":
+            return cost_chain_placement(self.complete_chain(), "both", opt_level, jobs)
+        elif algorithm == "dp":
+            return dp_chain_placement(self.complete_chain(), "both", opt_level)
+        elif algorithm == "mip":
+            return mip_chain_placement(
                 self.complete_chain(),
-                "request",
+                "both",
                 opt_level,
-                dump_property,
+                mip_time_limit if timeout is None else min(mip_time_limit, timeout),
             )
-            if opt_level != "no":
-                self.elements = elements
-        elif algorithm == "heuristics":
-            assert opt_level != "no", "conflicting optimization configs"
-            self.elements = basic_heuristics(self.elements)
         else:
             raise NotImplementedError(f"Unrecognized optimization algorithm {algorithm}")
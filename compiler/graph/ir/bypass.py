@@ -0,0 +1,64 @@
+"""
+Sidecar bypass: which traffic is excluded from the interception of the sidecars.
+
+Shared by the sidecar backend, which generates the exclusion annotations, and the
+whole-application optimization, which switches off the sidecars no edge needs.
+"""
+from typing import Dict, List, Tuple
+
+from compiler.graph.ir import GraphIR
+
+
+def always_bypassed(services: List[str]) -> List[Tuple[str, str]]:
+    """The sidecars (service, "C"/"S") whose traffic always bypasses them."""
+    # bypass frontend ingress sidecar
+    return [("frontend", "S")] if "frontend" in services else []
+
+
+def sidecar_bypass(
+    girs: Dict[str, GraphIR], app_edges: List[Tuple[str, str]], services: List[str]
+) -> Dict[Tuple[str, str], List[str]]:
+    """Decide which traffic bypasses the sidecars, given the optimized graph IRs.
+
+    The outbound traffic of a client to a server bypasses the client sidecar if the edge has
+    no client_sidecar element, and the inbound traffic of a server bypasses its sidecar if
+    none of its incoming edges has a server_sidecar element.
+
+    Returns:
+        A dictionary mapping each (service, "C"/"S") to the servers whose port is excluded
+        from the outbound ("C") or inbound ("S") interception of the service's sidecar.
+    """
+    whitelist, blacklist = {}, {}
+    for client, server in app_edges:
+        for key in [(client, "C"), (server, "S")]:
+            whitelist.setdefault(key, set())
+            blacklist.setdefault(key, [])
+    for gir in girs.values():
+        if len(gir.elements["client_sidecar"]) > 0:
+            whitelist.setdefault((gir.client, "C"), set()).add(gir.server)
+        if len(gir.elements["server_sidecar"]) > 0:
+            whitelist.setdefault((gir.server, "S"), set()).add(gir.server)
+    for client, server in app_edges:
+        if server not in whitelist[(client, "C")]:
+            blacklist[(client, "C")].append(server)
+        if server not in whitelist[(server, "S")]:
+            blacklist[(server, "S")].append(server)
+    for sname, placement in always_bypassed(services):
+        blacklist.setdefault((sname, placement), []).append(sname)
+    return blacklist
+
+
+def bypassed_sidecars(
+    girs: Dict[str, GraphIR], app_edges: List[Tuple[str, str]], services: List[str]
+) -> List[str]:
+    """The services whose sidecar is bypassed by all their traffic, i.e., can be switched off."""
+    blacklist = sidecar_bypass(girs, app_edges, services)
+    bypassed = []
+    for sname in services:
+        outbound = [server for client, server in app_edges if client == sname]
+        inbound = [server for _, server in app_edges if server == sname]
+        if all(server in blacklist[(sname, "C")] for server in outbound) and all(
+            server in blacklist[(sname, "S")] for server in inbound
+        ):
+            bypassed.append(sname)
+    return bypassed
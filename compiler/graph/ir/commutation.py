@@ -0,0 +1,144 @@
+"""
+Pairwise commutation analysis of element chains.
+
+equivalent() compares the dependency tables of two whole chains. Since a field's dependency
+only changes when a reader and a writer (or two ordered writers) of that field swap, the
+equivalent reorderings of a chain are exactly the linear extensions of the partial order
+formed by its conflicting pairs. The matrix is computed once per chain, after which
+reorderings are checked and enumerated with bitset operations.
+
+Responses traverse the chain in reverse order, so reordering two elements swaps them on both
+paths: with path "both", a pair commutes only if it commutes on the request and response path.
+"""
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from compiler.graph.ir.element import AbsElement
+
+TRACE_FIELDS = {"droptrace", "blocktrace", "copytrace"}
+
+
+def analyzed_paths(path: str) -> List[str]:
+    """The paths to analyze for path ("request", "response" or "both")."""
+    if path == "both":
+        return ["request", "response"]
+    assert path in ["request", "response"], f"path = {path} not exist"
+    return [path]
+
+
+class CommutationMatrix:
+    """Which elements of a chain can swap without breaking equivalence.
+
+    init_dependency() must have been called on the chain (for the same path), so that
+    drop/block/copy show up as writes to the traces.
+
+    Attributes:
+        swappable: swappable[i][j] is True if elements i and j commute.
+        preds: For each element, a bitmask of the elements that must stay before it.
+    """
+
+    def __init__(self, chain: List[AbsElement], path: str, opt_level: str):
+        n = len(chain)
+        self.length = n
+        self.swappable = [[True] * n for _ in range(n)]
+        self.preds = [0] * n
+        if opt_level == "ignore":
+            return
+        if opt_level not in ["weak", "strong"]:
+            raise ValueError(f"Unexpected optimization level {opt_level}")
+        for p in analyzed_paths(path):
+            access = []
+            for element in chain:
+                reads = set(element.get_prop(p, "read"))
+                # weak only preserves what each element reads, strong also what it records
+                if opt_level == "strong":
+                    reads |= set(element.get_prop(p, "record"))
+                access.append((reads, set(element.get_prop(p, "write"))))
+            for j in range(n):
+                for i in range(j):
+                    (ri, wi), (rj, wj) = access[i], access[j]
+                    # Traces are sets, so the order of their writers does not matter,
+                    # unless partners cancel each other's writes.
+                    ordered_writes = wi & wj
+                    if chain[i].partner == "" and chain[j].partner == "":
+                        ordered_writes -= TRACE_FIELDS
+                    if (wi & rj) or (ri & wj) or ordered_writes:
+                        self.swappable[i][j] = self.swappable[j][i] = False
+                        self.preds[j] |= 1 << i
+
+    def can_swap(self, i: int, j: int) -> bool:
+        return self.swappable[i][j]
+
+    def is_valid(self, order: Tuple[int, ...]) -> bool:
+        """Whether the reordering (a permutation of element indices) is equivalent."""
+        mask = 0
+        for x in order:
+            if self.preds[x] & mask != self.preds[x]:
+                return False
+            mask |= 1 << x
+        return True
+
+    def linear_extensions(
+        self,
+        prefix: Sequence[int] = (),
+        prune: Optional[Callable[[List[int]], bool]] = None,
+    ) -> Iterator[Tuple[int, ...]]:
+        """Enumerate the equivalent reorderings in lexicographic order (like permutations()).
+
+        Args:
+            prefix: Only enumerate the reorderings starting with prefix (see prefixes()).
+            prune: If given, skip all reorderings starting with order when prune(order) is True.
+        """
+        n, order = self.length, list(prefix)
+
+        def extend(mask: int) -> Iterator[Tuple[int, ...]]:
+            if len(order) == n:
+                yield tuple(order)
+                return
+            for x in range(n):
+                if not mask >> x & 1 and self.preds[x] & mask == self.preds[x]:
+                    order.append(x)
+                    if prune is None or not prune(order):
+                        yield from extend(mask | 1 << x)
+                    order.pop()
+
+        mask = 0
+        for x in prefix:
+            mask |= 1 << x
+        yield from extend(mask)
+
+    def prefixes(self, count: int) -> List[Tuple[int, ...]]:
+        """Split the equivalent reorderings by their first elements into at least count groups.
+
+        Returns the shortest prefixes (all of the same length) that give at least count groups,
+        or all reorderings if there are fewer. Enumerating the linear extensions of each prefix
+        in the returned order is the same as enumerating all of them.
+        """
+        layer: List[Tuple[int, ...]] = [()]
+        for _ in range(self.length):
+            if len(layer) >= count:
+                break
+            next_layer = []
+            for prefix in layer:
+                mask = 0
+                for x in prefix:
+                    mask |= 1 << x
+                for x in range(self.length):
+                    if not mask >> x & 1 and self.preds[x] & mask == self.preds[x]:
+                        next_layer.append(prefix + (x,))
+            layer = next_layer
+        return layer
+
+    def count_downsets(self, limit: int) -> int:
+        """Count the possible prefixes of equivalent reorderings, stopping once the count exceeds limit."""
+        total, layer = 1, {0}
+        while len(layer) > 0:
+            next_layer = set()
+            for mask in layer:
+                for x, p in enumerate(self.preds):
+                    if not mask >> x & 1 and p & mask == p:
+                        next_layer.add(mask | 1 << x)
+            total += len(next_layer)
+            if total > limit:
+                return total
+            layer = next_layer
+        return total
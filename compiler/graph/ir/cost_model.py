@@ -0,0 +1,619 @@
+"""
+The cost model of chain placements on a compact, integer-indexed representation.
+
+A chain is placed by giving each element a segment (see SEGMENTS) and a target. The cost of
+a placement is the same as optimization.cost(), but is computed from small per-element
+tables instead of the AbsElement objects, which are never modified.
+
+Requests traverse the chain in order and responses in reverse order. An element works on the
+requests that reach it and on their responses, minus those dropped by the elements after it on
+the response path, so its cost is the element overhead times a mix of both workloads, weighted
+by the share of its work done on responses (see response_share()).
+
+The numbers below are the default parameters of the model. They can be replaced by measured
+ones with a cost profile (see CostProfile and `--cost_profile`), which all optimizers read
+through COST_PROFILE. The state sync overhead also depends on the number of replicas of the
+services (see ReplicaConfig and `--replica`), read through REPLICAS.
+"""
+import hashlib
+import json
+from copy import deepcopy
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import yaml
+
+from compiler.graph.ir.element import AbsElement
+
+ELEMENT_OVERHEAD = {
+    "grpc": 1.0,
+    "interceptor_arpc": 1.0,
+    "sidecar_native": 1.0,
+    "sidecar_wasm": 3.0,
+    "sidecar_arpc": 1.0,
+    "ambient_native": 1.0,
+    "ambient_wasm": 3.0,
+}
+BASIC_OVERHEAD = {
+    "client_grpc": 0.5,
+    "client_sidecar": 5.0,
+    "ambient": 5.0,
+    "server_sidecar": 5.0,
+    "server_grpc": 0.5,
+}
+TRANSMISSION_OVERHEAD = {
+    "ipc": 0.8,
+    "network": 1,
+}
+STATE_SYNC_OVERHEAD = {
+    "strong": {
+        "client_grpc": 5.0,
+        "client_sidecar": 5.0,
+        "ambient": 2.0,
+        "server_sidecar": 5.0,
+        "server_grpc": 5.0,
+    },
+    "weak": {
+        "client_grpc": 1.0,
+        "client_sidecar": 1.0,
+        "ambient": 1.0,
+        "server_sidecar": 1.0,
+        "server_grpc": 1.0,
+    },
+}
+DROP_RATE = 0.1
+WASM_INVOCATION_OVERHEAD = 0.5
+# Cost of running the sidecar of a service, used instead of the per-edge basic overhead of
+# client_sidecar/server_sidecar when all edges of an application are optimized together.
+SIDECAR_OVERHEAD = 5.0
+
+
+class CostProfile:
+    """The parameters of the cost model: the defaults above, overridden by a profile file.
+
+    A profile is a yaml file with any of the following sections, in the unit of the cost model
+    (i.e., relative to the cost of one element on grpc, see compiler/calibrate_cost_profile.py):
+
+        backends: {target: cost of an element}                 # ELEMENT_OVERHEAD
+        processors: {segment: cost of using the segment}       # BASIC_OVERHEAD
+        transmission: {ipc: ..., network: ...}                 # TRANSMISSION_OVERHEAD
+        state_sync: {strong: {segment: ...}, weak: {...}}      # STATE_SYNC_OVERHEAD
+        drop_rate: ...                                         # DROP_RATE
+        wasm_invocation: ...                                   # WASM_INVOCATION_OVERHEAD
+        sidecar: ...                                           # SIDECAR_OVERHEAD
+        elements:
+          <element name>: {cost: {target: ...}, drop_rate: ..., response_share: ...}
+        metric: what was measured (e.g., cpu), only used in explanations
+
+    Every number read from the file is recorded in self.measured by its key (e.g.,
+    "backends.sidecar_wasm" or "elements.fault.drop_rate"), so that decisions can be explained.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, path: Optional[str] = None):
+        """Go back to the default parameters, then load the profile at path (if any)."""
+        self.path = path
+        self.metric = "cost"
+        self.element_overhead = dict(ELEMENT_OVERHEAD)
+        self.basic_overhead = dict(BASIC_OVERHEAD)
+        self.transmission_overhead = dict(TRANSMISSION_OVERHEAD)
+        self.state_sync_overhead = deepcopy(STATE_SYNC_OVERHEAD)
+        self.drop_rate = DROP_RATE
+        self.wasm_invocation_overhead = WASM_INVOCATION_OVERHEAD
+        self.sidecar_overhead = SIDECAR_OVERHEAD
+        # Per element name: the cost on each measured target and the measured drop rate
+        self.element_costs: Dict[str, Dict[str, float]] = {}
+        self.element_drop_rates: Dict[str, float] = {}
+        self.element_response_shares: Dict[str, float] = {}
+        self.measured: Set[str] = set()
+        if path is None:
+            return
+        with open(path, "r") as f:
+            profile = yaml.safe_load(f) or {}
+
+        def update(key: str, section: Dict, defaults: Dict, values: Dict):
+            for name, value in values.items():
+                if name not in defaults:
+                    raise ValueError(
+                        f"{path}: unknown {key} {name}, expected one of {list(defaults)}"
+                    )
+                section[name] = float(value)
+                self.measured.add(f"{key}.{name}")
+
+        for key, value in profile.items():
+            if key == "backends":
+                update(key, self.element_overhead, ELEMENT_OVERHEAD, value)
+            elif key == "processors":
+                update(key, self.basic_overhead, BASIC_OVERHEAD, value)
+            elif key == "transmission":
+                update(key, self.transmission_overhead, TRANSMISSION_OVERHEAD, value)
+            elif key == "state_sync":
+                for level, values in value.items():
+                    if level not in STATE_SYNC_OVERHEAD:
+                        raise ValueError(f"{path}: unknown state_sync level {level}")
+                    update(
+                        f"state_sync.{level}",
+                        self.state_sync_overhead[level],
+                        STATE_SYNC_OVERHEAD[level],
+                        values,
+                    )
+            elif key in ["drop_rate", "wasm_invocation", "sidecar"]:
+                attr = {
+                    "drop_rate": "drop_rate",
+                    "wasm_invocation": "wasm_invocation_overhead",
+                    "sidecar": "sidecar_overhead",
+                }[key]
+                setattr(self, attr, float(value))
+                self.measured.add(key)
+            elif key == "elements":
+                for name, measurements in value.items():
+                    costs = measurements.get("cost", {})
+                    for target in costs:
+                        if target not in ELEMENT_OVERHEAD:
+                            raise ValueError(
+                                f"{path}: unknown target {target} of element {name}"
+                            )
+                        self.measured.add(f"elements.{name}.cost.{target}")
+                    self.element_costs[name] = {t: float(c) for t, c in costs.items()}
+                    if "drop_rate" in measurements:
+                        self.element_drop_rates[name] = float(measurements["drop_rate"])
+                        self.measured.add(f"elements.{name}.drop_rate")
+                    if "response_share" in measurements:
+                        self.element_response_shares[name] = float(
+                            measurements["response_share"]
+                        )
+                        self.measured.add(f"elements.{name}.response_share")
+            elif key == "metric":
+                self.metric = str(value)
+            elif key != "source":
+                raise ValueError(f"{path}: unknown section {key}")
+        for name, rate in [("drop_rate", self.drop_rate)] + list(
+            self.element_drop_rates.items()
+        ):
+            if not 0.0 <= rate < 1.0:
+                raise ValueError(f"{path}: the drop rate of {name} must be in [0, 1)")
+
+    def element_cost_key(self, name: str, target: str) -> str:
+        """The key of the number used as the cost of element name on target."""
+        if target in self.element_costs.get(name, {}):
+            return f"elements.{name}.cost.{target}"
+        return f"backends.{target}"
+
+    def element_cost(self, name: str, target: str) -> float:
+        return self.element_costs.get(name, {}).get(
+            target, self.element_overhead[target]
+        )
+
+    def drop_rate_key(self, name: str) -> str:
+        return (
+            f"elements.{name}.drop_rate"
+            if name in self.element_drop_rates
+            else "drop_rate"
+        )
+
+    def element_drop_rate(self, name: str) -> float:
+        """The fraction of requests dropped (or blocked) by a drop/block element."""
+        return self.element_drop_rates.get(name, self.drop_rate)
+
+    def response_share_key(self, name: str) -> Optional[str]:
+        if name in self.element_response_shares:
+            return f"elements.{name}.response_share"
+        return None
+
+    def digest(self) -> str:
+        """A fingerprint of all parameters, for caching results of the optimizers."""
+        parameters = {k: v for k, v in self.__dict__.items() if k != "path"}
+        parameters["measured"] = sorted(self.measured)
+        return hashlib.sha256(
+            json.dumps(parameters, sort_keys=True).encode()
+        ).hexdigest()
+
+    def source(self, key: str) -> str:
+        return f"measured {key}" if key in self.measured else "default"
+
+
+COST_PROFILE = CostProfile()
+
+
+class ReplicaConfig:
+    """The number of replicas of each service (`--replica`).
+
+    The spec is a count for all services ("3"), optionally followed by counts of single services
+    ("3,frontend=1,search=10"), or only the latter ("frontend=1"). Services without a count are
+    deployed with one replica, but the cost model does not rely on it: their state is assumed to
+    be shared by several replicas, so that they can be scaled up without recompiling.
+
+    State kept by the elements of a client (server) segment is shared by the replicas of the
+    client (server) service. With R replicas, a share 1 - 1/R of the state accesses goes to
+    another replica, so the state sync overhead is scaled by that share (none for 1 replica,
+    whose state is local). State kept in ambient does not depend on the replicas of services.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, spec: Optional[str] = None):
+        self.spec = spec
+        self.default: Optional[int] = None
+        self.services: Dict[str, int] = {}
+        if spec is None:
+            return
+        for i, item in enumerate(spec.split(",")):
+            service, _, count = item.rpartition("=")
+            if service == "" and i > 0:
+                raise ValueError(
+                    f"--replica {spec}: expected service=count after the first count"
+                )
+            if not count.strip().isdigit() or int(count) < 1:
+                raise ValueError(
+                    f"--replica {spec}: {count} is not a positive number of replicas"
+                )
+            if service == "":
+                self.default = int(count)
+            else:
+                self.services[service.strip()] = int(count)
+
+    def count(self, service: Optional[str]) -> Optional[int]:
+        """The number of replicas of service, or None if not given."""
+        if service is None:
+            return None
+        return self.services.get(service, self.default)
+
+    def deployed(self, service: str) -> int:
+        """The number of replicas service is deployed with."""
+        count = self.count(service)
+        return 1 if count is None else count
+
+    def sync_factor(self, service: Optional[str]) -> float:
+        """The factor of the state sync overhead of state shared by the replicas of service."""
+        count = self.count(service)
+        if count is None:
+            return 1.0
+        return 1.0 - 1.0 / count
+
+
+REPLICAS = ReplicaConfig()
+
+
+# The segments of an edge, in the order requests traverse them.
+SEGMENTS = ["client_grpc", "client_sidecar", "ambient", "server_sidecar", "server_grpc"]
+SEGMENT_POSITION = ["client", "client", "ambient", "server", "server"]
+SEGMENT_PROCESSOR = ["grpc", "sidecar", "ambient", "sidecar", "grpc"]
+SYNC_LEVELS = ["no", "weak", "strong"]
+
+
+def element_type(element: AbsElement) -> str:
+    """The name an element is looked up by in the cost profile."""
+    return "+".join(element.name)
+
+
+def response_share(element: AbsElement) -> float:
+    """The share of the cost of an element spent on responses.
+
+    Measured in the cost profile, or else split evenly between the paths the element has
+    properties on (and between both paths if it has none).
+    """
+    name = element_type(element)
+    if name in COST_PROFILE.element_response_shares:
+        return COST_PROFILE.element_response_shares[name]
+    active = [
+        any(element.get_prop(path, p) for p in ["read", "write", "record"])
+        or element.has_prop(path, "drop", "block", "copy")
+        for path in ["request", "response"]
+    ]
+    if active == [True, False]:
+        return 0.0
+    if active == [False, True]:
+        return 1.0
+    return 0.5
+
+
+def drop_rate_source(element: AbsElement, path: str = "request") -> str:
+    """Where the drop rate of element on path comes from, in order of precedence:
+
+    "spec" (the selectivity of the element in the spec, only for requests), the measured
+    elements.<name>.drop_rate of the cost profile, "analysis" (literal probabilities found by
+    the property analysis, e.g., of fault injection), or the key of the default drop rate.
+    """
+    name = element_type(element)
+    if path == "request" and element.selectivity is not None:
+        return "spec"
+    measured = name in COST_PROFILE.element_drop_rates
+    if not measured and element.prop[path].get("drop_rate") is not None:
+        return "analysis"
+    return COST_PROFILE.drop_rate_key(name)
+
+
+def drop_rate(element: AbsElement, path: str = "request") -> float:
+    """The fraction of requests (or responses) dropped or blocked by element, 0 if it never does."""
+    if not element.has_prop(path, "drop", "block"):
+        return 0.0
+    source = drop_rate_source(element, path)
+    if source == "spec":
+        return 1.0 - element.selectivity
+    if source == "analysis":
+        return element.prop[path]["drop_rate"]
+    return COST_PROFILE.element_drop_rate(element_type(element))
+
+
+def element_workload(
+    share: float,
+    request_workload: float,
+    responses_kept: float,
+    responses_kept_before: float,
+    response_factor: float,
+) -> float:
+    """The workload of an element, mixing the requests that reach it and their responses.
+
+    Args:
+        share: The response share of the element.
+        request_workload: The fraction of requests that reach the element.
+        responses_kept: The fraction of responses kept by the whole chain.
+        responses_kept_before: The fraction kept by the elements before this one.
+        response_factor: The fraction kept by this element.
+    """
+    if share == 0.0 or responses_kept == 1.0:
+        return request_workload
+    response_workload = (
+        request_workload * responses_kept / (responses_kept_before * response_factor)
+    )
+    return (1.0 - share) * request_workload + share * response_workload
+
+
+def in_nonlocal_position(element: AbsElement, pos: str) -> bool:
+    state_dependence = element.prop["state"]["state_dependence"]
+    if "client" in pos and state_dependence == ["client_service"]:
+        return False
+    if "server" in pos and state_dependence == ["server_service"]:
+        return False
+    if pos == "ambient" and (
+        "client_service" in state_dependence or "server_service" in state_dependence
+    ):
+        return False
+    return True
+
+
+def segment_service(element: AbsElement, pos: str) -> Optional[str]:
+    """The service whose replicas share the state of element in pos (None for ambient)."""
+    if "client" in pos:
+        return element.client
+    if "server" in pos:
+        return element.server
+    return None
+
+
+def sync_factor(element: AbsElement, pos: str) -> float:
+    """The factor of the state sync overhead of element in pos, 0 if its state is local."""
+    if not in_nonlocal_position(element, pos):
+        return 0.0
+    return REPLICAS.sync_factor(segment_service(element, pos))
+
+
+class ChainModel:
+    """An integer-indexed view of a chain for the cost model.
+
+    Targets are referred to by their index in self.targets, segments by their index in SEGMENTS.
+
+    Args:
+        chain: The elements of the chain.
+        excluded: Segments that must not be used (e.g., a sidecar that is switched off).
+        shared: Segments whose processor overhead is not charged to this chain (e.g., a sidecar
+            that is paid for once per service).
+    """
+
+    def __init__(
+        self,
+        chain: List[AbsElement],
+        excluded: Sequence[int] = (),
+        shared: Sequence[int] = (),
+    ):
+        self.length = len(chain)
+        self.names = [element_type(element) for element in chain]
+        self.targets: List[str] = []
+        # options[i][s]: the targets element i can use in segment s (empty if not placeable)
+        self.options: List[List[List[int]]] = []
+        # sync[i][s]: the sync level (index in SYNC_LEVELS) of element i in segment s
+        self.sync: List[List[int]] = []
+        # factor[i]: the workload left after element i
+        self.factor: List[float] = []
+        # response_factor[i]: the responses left after element i (on the response path)
+        self.response_factor: List[float] = []
+        self.response_share: List[float] = []
+        for name, element in zip(self.names, chain):
+            if (
+                any("arpc" in p for p in element.processor)
+                and len(element.processor) != 1
+            ):
+                raise ValueError(
+                    f"{element.name}: aRPC should be the only choice for processor"
+                )
+            self.options.append(
+                [
+                    [] if s in excluded else self._segment_options(element, s)
+                    for s in range(len(SEGMENTS))
+                ]
+            )
+            consistency = element.prop["state"]["consistency"]
+            level = SYNC_LEVELS.index(consistency) if consistency in SYNC_LEVELS else 0
+            self.sync.append(
+                [level if sync_factor(element, pos) > 0.0 else 0 for pos in SEGMENTS]
+            )
+            self.factor.append(1.0 - drop_rate(element, "request"))
+            self.response_factor.append(1.0 - drop_rate(element, "response"))
+            self.response_share.append(response_share(element))
+        self.responses_kept = 1.0
+        for f in self.response_factor:
+            self.responses_kept *= f
+        # element_cost[i][t]: the cost of element i on target t (under full workload)
+        self.element_cost = [
+            [COST_PROFILE.element_cost(name, t) for t in self.targets]
+            for name in self.names
+        ]
+        self.is_wasm = ["wasm" in t for t in self.targets]
+        # Cost of using a segment at all: processor, ipc and the extra network hop of ambient.
+        self.enter_cost = [
+            0.0 if s in shared else COST_PROFILE.basic_overhead[pos]
+            for s, pos in enumerate(SEGMENTS)
+        ]
+        self.enter_cost[1] += COST_PROFILE.transmission_overhead["ipc"]
+        self.enter_cost[3] += COST_PROFILE.transmission_overhead["ipc"]
+        self.enter_cost[2] += COST_PROFILE.transmission_overhead["network"]
+        # All elements of a chain are on the same edge, i.e., share the same services.
+        factors = [
+            REPLICAS.sync_factor(segment_service(chain[0], pos))
+            if len(chain) > 0
+            else 1.0
+            for pos in SEGMENTS
+        ]
+        self.sync_cost = [
+            [0.0]
+            + [
+                COST_PROFILE.state_sync_overhead[level][pos] * f
+                for level in SYNC_LEVELS[1:]
+            ]
+            for pos, f in zip(SEGMENTS, factors)
+        ]
+
+    def workload(
+        self, x: int, request_workload: float, responses_kept_before: float
+    ) -> float:
+        """The workload of element x (see element_workload)."""
+        return element_workload(
+            self.response_share[x],
+            request_workload,
+            self.responses_kept,
+            responses_kept_before,
+            self.response_factor[x],
+        )
+
+    def _target_index(self, target: str) -> int:
+        if target not in self.targets:
+            self.targets.append(target)
+        return self.targets.index(target)
+
+    def _segment_options(self, element: AbsElement, s: int) -> List[int]:
+        # aRPC elements must use their only processor, other elements in a sidecar or
+        # ambient segment can use wasm unless native is required and vice versa.
+        position, processor = SEGMENT_POSITION[s], SEGMENT_PROCESSOR[s]
+        if element.position != "any" and element.position != position:
+            return []
+        if not any(processor in p for p in element.processor):
+            return []
+        if any("arpc" in p for p in element.processor):
+            options = [element.processor[0]]
+        elif processor == "grpc":
+            options = ["grpc"]
+        else:
+            options = []
+            if element.upgrade in ["yes", "any"]:
+                options.append(processor + "_wasm")
+            if element.upgrade in ["any", "no"]:
+                options.append(processor + "_native")
+        return [self._target_index(t) for t in options]
+
+    def evaluate(
+        self, order: List[int], segments: List[int], targets: List[int]
+    ) -> float:
+        """The cost() of the chain with the given order and placement.
+
+        Args:
+            order: Element indices in chain order.
+            segments, targets: Segment and target index of each element (indexed by element).
+        """
+        c, workload, kept = COST_PROFILE.transmission_overhead["network"], 1.0, 1.0
+        seg, tgt, sync = -1, -1, 0
+        for x in order:
+            s, t = segments[x], targets[x]
+            c += self.element_cost[x][t] * self.workload(x, workload, kept)
+            workload *= self.factor[x]
+            kept *= self.response_factor[x]
+            if s == seg and t == tgt:
+                sync = max(sync, self.sync[x][s])
+                continue
+            if seg >= 0:
+                c += self.sync_cost[seg][sync]
+            if s != seg:
+                c += self.enter_cost[s]
+            if self.is_wasm[t] and SEGMENT_PROCESSOR[s] != "grpc":
+                c += COST_PROFILE.wasm_invocation_overhead
+            seg, tgt, sync = s, t, self.sync[x][s]
+        if seg >= 0:
+            c += self.sync_cost[seg][sync]
+        return c
+
+    def segment_table(
+        self, order: Sequence[int]
+    ) -> List[List[List[Tuple[float, Tuple[int, ...]]]]]:
+        """The cheapest placement of every range of the ordered chain within every segment.
+
+        table[s][a][b] is (cost, targets) for placing order[a:b] in segment s, where the cost
+        includes the element, processor, ipc/network, sync and wasm invocation overhead of the
+        segment (inf if an element of the range cannot be placed in s). Ranges starting at the
+        same element are computed incrementally, by extending the range one element at a time.
+        """
+        n = len(order)
+        workload, request_workload, kept = [], 1.0, 1.0
+        for x in order:
+            workload.append(self.workload(x, request_workload, kept))
+            request_workload *= self.factor[x]
+            kept *= self.response_factor[x]
+        infeasible = (float("inf"), ())
+        table = []
+        for s in range(len(SEGMENTS)):
+            invocation = [
+                COST_PROFILE.wasm_invocation_overhead
+                if w and SEGMENT_PROCESSOR[s] != "grpc"
+                else 0.0
+                for w in self.is_wasm
+            ]
+            rows = []
+            for a in range(n + 1):
+                row = [infeasible] * (n + 1)
+                row[a] = (0.0, ())
+                # (target, sync level of the current run) -> (cost without closing the run, targets)
+                states = {}
+                for b in range(a, n):
+                    x = order[b]
+                    if len(self.options[x][s]) == 0:
+                        break
+                    e, level = workload[b], self.sync[x][s]
+                    new_states = {}
+                    for t in self.options[x][s]:
+                        candidates = []
+                        if b == a:
+                            candidates.append((invocation[t], level, ()))
+                        for (tgt, sync), (c, targets) in states.items():
+                            if tgt == t:
+                                candidates.append((c, max(sync, level), targets))
+                            else:
+                                c += self.sync_cost[s][sync] + invocation[t]
+                                candidates.append((c, level, targets))
+                        for c, sync, targets in candidates:
+                            c += self.element_cost[x][t] * e
+                            if c < new_states.get((t, sync), infeasible)[0]:
+                                new_states[(t, sync)] = (c, targets + (t,))
+                    states = new_states
+                    for (t, sync), (c, targets) in states.items():
+                        c += self.enter_cost[s] + self.sync_cost[s][sync]
+                        if c < row[b + 1][0]:
+                            row[b + 1] = (c, targets)
+                rows.append(row)
+            table.append(rows)
+        return table
+
+    def apply(
+        self,
+        chain: List[AbsElement],
+        order: List[int],
+        segments: List[int],
+        targets: List[int],
+    ) -> List[AbsElement]:
+        """Reorder the chain and set the target and final position of each element."""
+        new_chain = []
+        for x in order:
+            element = chain[x]
+            element.target = self.targets[targets[x]]
+            element.final_position = SEGMENT_POSITION[segments[x]]
+            new_chain.append(element)
+        return new_chain
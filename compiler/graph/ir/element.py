@@ -1,12 +1,22 @@
 from __future__ import annotations
 
 import os
+from copy import deepcopy
 from typing import Any, Dict, List, Optional, Union
+
 from rich.panel import Panel
 
-from compiler.element import compile_element_property, ElementCompiler, consolidate
-from compiler.element.node import Program
+from compiler.element import (
+    compile_element_property,
+    consolidate,
+    parse_element,
+    resolve_element_property,
+)
+from compiler.element.ir.props.flow import combine_drop_rates
 from compiler.element.ir.type_inference import TypeAnalyzer, TypeContext
+from compiler.element.node import Program
+from compiler.element.property_db import PROPERTY_DB
+from compiler.graph.logger import GRAPH_LOG
 from compiler.proto import Proto
 
 global_element_id = 0
@@ -22,13 +32,15 @@ def fetch_global_id() -> str:
 class AbsElement:
     """
     Args:
-        info(dict): basic element information, including name, config, proto, method, etc.
+        info(dict): basic element information, including name, config, proto, method,
+            selectivity (the fraction of requests that pass the element), etc.
         proto_path(str): the path to the proto file
         proto_mod_name(str): the name of the proto module
         proto_mod_location(str): the location of the proto module
         partner(str): the name of its partner, used for optimization
         server(str): used for generating unique element name
             consider "cache" on both A->B and A->C
+        client(str): the client side of the edge, whose replicas share client-side state
         initial_position(str): "client" or "server" or "ambient"
         initial_target(str): "grpc" or ["sidecar", "ambient"] * ["wasm", "native"]
         compile_dir(str): the directory where the compiled element code is stored
@@ -41,6 +53,7 @@ class AbsElement:
         server: str = "",
         initial_position: str = "",
         initial_target: str = "",
+        client: str = "",
     ):
         if info == "NETWORK" or info == "IPC":
             self.name = info
@@ -50,6 +63,7 @@ class AbsElement:
             self.name: List[str] = [info["name"]]
             self.path: List[str] = [info["path"]]
             self.server = server  # the server side of the edge, used for generating unique file name
+            self.client = client
             self.config = info["config"] if "config" in info else []
             self.position = info["position"] if "position" in info else "any"
             self.processor = (
@@ -64,6 +78,9 @@ class AbsElement:
             else:
                 self.upgrade = "any"
             self.target = initial_target
+            if self.target in ["sidecar", "ambient"]:
+                # the processors do not name an implementation, WebAssembly by default
+                self.target += "_wasm"
             if self.upgrade == "yes":
                 self.target = self.target.replace("native", "wasm")
             elif self.upgrade == "no":
@@ -79,8 +96,18 @@ class AbsElement:
                 info["proto_mod_location"] if "proto_mod_location" in info else ""
             )
             self.partner = partner
+            # fraction of the requests that pass the element, if given in the spec
+            self.selectivity: Optional[float] = None
+            if "selectivity" in info:
+                self.selectivity = float(info["selectivity"])
+                if not 0.0 < self.selectivity <= 1.0:
+                    raise ValueError(f"{info['name']}: selectivity must be in (0, 1]")
             self.compile_dir = ""
             self.ir: Optional[Program] = None
+            # take the properties from the property database only (see --pseudo_property)
+            self.pseudo_property = False
+            # properties analyzed by analyze() for the property database, without override
+            self.analyzed_prop: Optional[Dict] = None
 
     @property
     def desc(self) -> str:
@@ -129,19 +156,32 @@ class AbsElement:
         self.pseudo_property = pseudo_property
     
     def analyze(self):
-        eirs: List[Program] = []
-        for path in self.path:
-            with open(path, "r") as f:
-                spec = f.read()
-                eirs.append(ElementCompiler().parse_and_transform(spec))
-        self.ir = consolidate(eirs)
-        # type inference
-        if os.getenv("ENABLE_TYPE_INFERENCE") is not None:
-            type_analyzer = TypeAnalyzer()
-            type_ctx = TypeContext(self.proto, self.method)
-            self.ir.accept(type_analyzer, type_ctx)
+        if all(os.path.exists(path) for path in self.path):
+            eirs: List[Program] = [parse_element(path) for path in self.path]
+            self.ir = consolidate(eirs)
+            # type inference
+            if os.getenv("ENABLE_TYPE_INFERENCE") is not None:
+                type_analyzer = TypeAnalyzer()
+                type_ctx = TypeContext(self.proto, self.method)
+                self.ir.accept(type_analyzer, type_ctx)
+        else:
+            # The optimizer only needs the properties, code cannot be generated.
+            GRAPH_LOG.warning(
+                f"Sources of {'+'.join(self.name)} not found, using the property database"
+            )
+            self.ir = None
         # compile property
-        self._prop = compile_element_property(self.name, self.path)
+        if self.pseudo_property or self.ir is None:
+            self._prop = PROPERTY_DB.lookup(self.name, self.path)
+            if self._prop is None:
+                raise ValueError(f"{'+'.join(self.name)}: no entry in the property database")
+        else:
+            self._prop, self.analyzed_prop = resolve_element_property(self.name, self.path)
+
+    def set_analysis(self, ir: Program, prop: Dict):
+        """Take the results of analyze() on an identical element (e.g., in a worker process)."""
+        self.ir = deepcopy(ir)
+        self._prop = deepcopy(prop)
 
     @property
     def prop(self):
@@ -231,8 +271,22 @@ class AbsElement:
             if len(self.position) < len(other.position)
             else other.position
         )
-        # Consolidate IRs
-        self.ir = consolidate([self.ir, other.ir])
+        # Fuse selectivities, only known if they are known for all parts that drop requests
+        if self.selectivity is not None or other.selectivity is not None:
+            rate = combine_drop_rates(
+                *[
+                    1.0 - e.selectivity
+                    if e.selectivity is not None
+                    else (None if e.has_prop("request", "drop", "block") else 0.0)
+                    for e in [self, other]
+                ]
+            )
+            self.selectivity = None if rate is None else 1.0 - rate
+        # Consolidate IRs (unless only the properties are known)
+        if self.ir is not None and other.ir is not None:
+            self.ir = consolidate([self.ir, other.ir])
+        else:
+            self.ir = None
         # Fuse properties
         self.prop["state"]["stateful"] |= other.prop["state"]["stateful"]
         if other.prop["state"]["consistency"] == "strong":
@@ -244,6 +298,9 @@ class AbsElement:
             self.prop[k]["drop"] |= other.prop[k]["drop"]
             self.prop[k]["block"] |= other.prop[k]["block"]
             self.prop[k]["copy"] |= other.prop[k]["copy"]
+            self.prop[k]["drop_rate"] = combine_drop_rates(
+                self.prop[k].get("drop_rate"), other.prop[k].get("drop_rate")
+            )
             self.prop[k]["read"] = list(set(self.prop[k]["read"]))
             self.prop[k]["record"] = list(set(self.prop[k]["record"]))
             self.prop[k]["write"] = list(set(self.prop[k]["write"]))
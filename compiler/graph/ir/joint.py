@@ -0,0 +1,205 @@
+"""
+Whole-application optimization (`--opt_scope app`).
+
+When each edge is optimized on its own, every edge that places an element in a sidecar pays
+the basic overhead of that sidecar, although the sidecar of a service is shared by all edges
+from and to it. Here the sidecar overhead is charged once per service whose sidecar is used,
+and sidecars that no edge needs can be switched off entirely (all their traffic is excluded
+from interception, see sidecar_bypass in bypass.py).
+
+Each edge only depends on the sidecars of its client and server, so it is optimized once for
+each of the four combinations of them being on or off. The combination of sidecars for the
+whole application is then chosen exhaustively for up to MAX_EXHAUSTIVE_SERVICES services that
+could run a sidecar, and by greedily switching sidecars off for larger applications.
+"""
+from copy import deepcopy
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+from compiler.graph.ir import GraphIR
+from compiler.graph.ir.bypass import always_bypassed, bypassed_sidecars
+from compiler.graph.ir.commutation import CommutationMatrix
+from compiler.graph.ir.cost_model import COST_PROFILE, SEGMENTS, ChainModel
+from compiler.graph.ir.local_search import anytime_search
+from compiler.graph.ir.optimization import (
+    consolidate_subchains,
+    init_dependency,
+    search_placement,
+)
+from compiler.graph.ir.placement import dp_search
+from compiler.graph.logger import GRAPH_LOG
+
+CLIENT_SIDECAR, SERVER_SIDECAR = SEGMENTS.index("client_sidecar"), SEGMENTS.index(
+    "server_sidecar"
+)
+
+MAX_EXHAUSTIVE_SERVICES = 16
+
+SEARCHES: Dict[str, Callable] = {
+    "cost": search_placement,
+    "dp": dp_search,
+}
+
+
+class EdgeVariants:
+    """The optimized placements of an edge for each on/off combination of its sidecars."""
+
+    def __init__(
+        self,
+        gir: GraphIR,
+        opt_level: str,
+        algorithm: str,
+        ingress_bypassed: bool,
+        jobs: int = 1,
+        timeout: Optional[float] = None,
+    ):
+        self.gir = gir
+        self.chain = gir.complete_chain()
+        init_dependency(self.chain, "both")
+        commutation = CommutationMatrix(self.chain, "both", opt_level)
+        if algorithm == "cost" and timeout is not None:
+            # The four combinations share the time budget of the edge.
+            def search(model, commutation):
+                return anytime_search(
+                    self.chain, model, commutation, timeout / 4, jobs
+                )[0]
+
+        elif algorithm == "cost":
+            search = partial(search_placement, jobs=jobs)
+        else:
+            search = SEARCHES[algorithm]
+        # (client sidecar on, server sidecar on) -> (model, search result)
+        self.results: Dict[Tuple[bool, bool], Tuple[ChainModel, Optional[Tuple]]] = {}
+        for client_on in [False, True]:
+            for server_on in [False, True]:
+                excluded = []
+                if not client_on:
+                    excluded.append(CLIENT_SIDECAR)
+                if not server_on or ingress_bypassed:
+                    excluded.append(SERVER_SIDECAR)
+                model = ChainModel(
+                    self.chain,
+                    excluded=excluded,
+                    shared=[CLIENT_SIDECAR, SERVER_SIDECAR],
+                )
+                self.results[(client_on, server_on)] = (
+                    model,
+                    search(model, commutation),
+                )
+
+    @property
+    def feasible(self) -> bool:
+        return self.results[(True, True)][1] is not None
+
+    def cost(self, client_on: bool, server_on: bool) -> float:
+        result = self.results[(client_on, server_on)][1]
+        return float("inf") if result is None else result[0]
+
+    def apply(self, client_on: bool, server_on: bool):
+        model, (_, order, segments, targets) = self.results[(client_on, server_on)]
+        self.gir.elements = consolidate_subchains(
+            model.apply(deepcopy(self.chain), order, segments, targets)
+        )
+
+
+def choose_sidecars(
+    candidates: List[str], forced: set, total_cost: Callable[[set], float]
+) -> Tuple[set, float]:
+    """The services (forced and some of the candidates) whose sidecar minimizes total_cost,
+    exhaustively for up to MAX_EXHAUSTIVE_SERVICES candidates and greedily beyond."""
+    if len(candidates) <= MAX_EXHAUSTIVE_SERVICES:
+        best, min_cost = None, float("inf")
+        # Prefer fewer sidecars on ties
+        for mask in sorted(
+            range(1 << len(candidates)), key=lambda m: bin(m).count("1")
+        ):
+            enabled = forced | {s for i, s in enumerate(candidates) if mask >> i & 1}
+            c = total_cost(enabled)
+            if c < min_cost:
+                best, min_cost = enabled, c
+    else:
+        best = forced | set(candidates)
+        min_cost = total_cost(best)
+        improved = True
+        while improved:
+            improved = False
+            for s in sorted(best - forced):
+                c = total_cost(best - {s})
+                if c <= min_cost:
+                    best, min_cost, improved = best - {s}, c, True
+
+    return best, min_cost
+
+
+def joint_optimize(
+    graphirs: Dict[str, GraphIR],
+    app_edges: List[Tuple[str, str]],
+    opt_level: str,
+    algorithm: str,
+    jobs: int = 1,
+    timeout: Optional[float] = None,
+):
+    """Optimize all graph IRs of an application together, sharing the sidecar overhead per service."""
+    if algorithm not in SEARCHES:
+        raise ValueError(
+            f"Optimization algorithm {algorithm} does not support --opt_scope app"
+        )
+    services = sorted({s for edge in app_edges for s in edge})
+    ingress = always_bypassed(services)
+
+    edges: List[EdgeVariants] = []
+    # Sidecars used by edges that cannot be optimized (kept as is)
+    forced = set()
+    for gir in graphirs.values():
+        variants = EdgeVariants(
+            gir, opt_level, algorithm, (gir.server, "S") in ingress, jobs, timeout
+        )
+        if variants.feasible:
+            edges.append(variants)
+            continue
+        GRAPH_LOG.warning(f"No valid placement for {gir.name}, keeping it unchanged.")
+        if len(gir.elements["client_sidecar"]) > 0:
+            forced.add(gir.client)
+        if len(gir.elements["server_sidecar"]) > 0:
+            forced.add(gir.server)
+
+    def total_cost(enabled: set) -> float:
+        c = COST_PROFILE.sidecar_overhead * len(enabled)
+        for e in edges:
+            c += e.cost(e.gir.client in enabled, e.gir.server in enabled)
+        return c
+
+    # Only services with an edge that benefits from a sidecar are worth considering.
+    candidates = sorted(
+        (
+            {
+                e.gir.client
+                for e in edges
+                if e.cost(True, False) < e.cost(False, False)
+                or e.cost(True, True) < e.cost(False, True)
+            }
+            | {
+                e.gir.server
+                for e in edges
+                if e.cost(False, True) < e.cost(False, False)
+                or e.cost(True, True) < e.cost(True, False)
+            }
+        )
+        - forced
+    )
+    best, min_cost = choose_sidecars(candidates, forced, total_cost)
+
+    for e in edges:
+        e.apply(e.gir.client in best, e.gir.server in best)
+
+    per_edge = COST_PROFILE.sidecar_overhead * (
+        sum(1 for e in edges if len(e.gir.elements["client_sidecar"]) > 0)
+        + sum(1 for e in edges if len(e.gir.elements["server_sidecar"]) > 0)
+    )
+    GRAPH_LOG.info(
+        f"Application-wide cost {min_cost:.2f} with sidecars on {sorted(best) or 'no service'} "
+        f"(sidecar overhead {COST_PROFILE.sidecar_overhead * len(best):.1f} instead of {per_edge:.1f} per edge)"
+    )
+    off = bypassed_sidecars(graphirs, app_edges, services)
+    if len(off) > 0:
+        GRAPH_LOG.info(f"Sidecars bypassed by all traffic (can be switched off): {off}")
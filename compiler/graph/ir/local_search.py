@@ -0,0 +1,230 @@
+"""
+Chain optimization within a time budget (`--opt_timeout SECONDS`).
+
+The exhaustive search of cost_chain_placement() grows with the number of equivalent orders, which
+is exponential in the length of the chain. With a time budget, the chain starts from the
+basic_heuristics() placement (or segment_order(), if that placement is not valid) and is improved
+by local search until no move lowers the cost or the budget expires:
+    swap      an element with its neighbor, repeatedly in the same direction, while they
+              commute, i.e., the reordered chain stays equivalent (see CommutationMatrix);
+    boundary  move the boundaries between segments (e.g., client sidecar ~ ambient).
+Each segment holds a range of the ordered chain, whose cheapest targets come from
+ChainModel.segment_table(), so a placement is an order and 4 boundaries. After each swap, the
+boundaries are moved to their best positions for the new order (place_boundaries()), which is
+cheaper than building the table of the order.
+
+The remaining budget goes to the exhaustive search, bounded by the local optimum, so short
+chains still get the optimal placement. When the budget expires, the best placement found so
+far is returned.
+"""
+import time
+from copy import deepcopy
+from typing import Iterator, List, Optional, Tuple
+
+from compiler.graph.ir.commutation import CommutationMatrix
+from compiler.graph.ir.cost_model import COST_PROFILE, SEGMENTS, ChainModel
+from compiler.graph.ir.element import AbsElement
+from compiler.graph.ir.memo import cache_placement, cached_placement, chain_signature
+from compiler.graph.ir.optimization import (
+    bounds_placement,
+    cost,
+    heuristic_placement,
+    init_dependency,
+    search_placement,
+)
+from compiler.graph.logger import GRAPH_LOG
+
+# Relative improvement below which a move is not taken, so that rounding errors cannot loop.
+MIN_IMPROVEMENT = 1e-9
+
+
+def place_boundaries(table, length: int) -> Tuple[float, List[int]]:
+    """The cheapest boundaries of the segments for the order of table (see bounds_placement).
+
+    Same result as the enumeration of find_min_cost(), in O(length^2) per segment: best[b] is
+    the cheapest placement of the first b elements in the segments so far.
+    """
+    best = [table[0][0][b][0] for b in range(length + 1)]
+    choice = []
+    for s in range(1, len(SEGMENTS)):
+        new_best, starts = [], []
+        for b in range(length + 1):
+            a = min(range(b + 1), key=lambda a: best[a] + table[s][a][b][0])
+            new_best.append(best[a] + table[s][a][b][0])
+            starts.append(a)
+        best = new_best
+        choice.append(starts)
+    bounds = [length]
+    for starts in reversed(choice):
+        bounds.append(starts[bounds[-1]])
+    bounds.append(0)
+    bounds.reverse()
+    return COST_PROFILE.transmission_overhead["network"] + best[length], bounds
+
+
+def segment_order(model: ChainModel, commutation: CommutationMatrix) -> List[int]:
+    """An equivalent order that can usually be placed: each step takes the element that can run
+    in the earliest segment not before the current one (e.g., client-only elements first)."""
+    n = len(SEGMENTS)
+    order, mask, segment = [], 0, 0
+    for _ in range(model.length):
+        available = [
+            x
+            for x in range(model.length)
+            if not mask >> x & 1 and commutation.preds[x] & mask == commutation.preds[x]
+        ]
+
+        def earliest(x: int) -> int:
+            return min(
+                (s for s in range(segment, n) if len(model.options[x][s]) > 0),
+                default=n,
+            )
+
+        x = min(available, key=lambda x: (earliest(x), x))
+        segment = min(max(segment, earliest(x)), n - 1)
+        order.append(x)
+        mask |= 1 << x
+    return order
+
+
+def swapped_orders(
+    commutation: CommutationMatrix, order: List[int]
+) -> Iterator[List[int]]:
+    """The orders reached by swapping an element with its neighbor, repeatedly in one direction.
+
+    A drop element often only pays off once it has moved over several others, so each step of
+    the same element is a move of its own.
+    """
+    for k in range(len(order)):
+        x = order[k]
+        # forward, then backward
+        j = k
+        while j + 1 < len(order) and commutation.can_swap(x, order[j + 1]):
+            j += 1
+            yield order[:k] + order[k + 1 : j + 1] + [x] + order[j + 1 :]
+        j = k
+        while j > 0 and commutation.can_swap(x, order[j - 1]):
+            j -= 1
+            yield order[:j] + [x] + order[j:k] + order[k + 1 :]
+
+
+def local_search(
+    model: ChainModel,
+    commutation: CommutationMatrix,
+    order: List[int],
+    deadline: float,
+) -> Tuple[float, List[int], List[int]]:
+    """Improve an order by swap moves (see above) until none helps or the deadline passes.
+
+    Returns:
+        (cost, order, bounds) of the best placement found.
+    """
+    min_cost, bounds = place_boundaries(model.segment_table(order), len(order))
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for new_order in swapped_orders(commutation, order):
+            if time.monotonic() >= deadline:
+                break
+            new_cost, new_bounds = place_boundaries(
+                model.segment_table(new_order), len(order)
+            )
+            if new_cost < min_cost - MIN_IMPROVEMENT * (1.0 + abs(min_cost)):
+                min_cost, order, bounds, improved = (
+                    new_cost,
+                    new_order,
+                    new_bounds,
+                    True,
+                )
+                break
+    return min_cost, order, bounds
+
+
+def local_optimum(
+    model: ChainModel,
+    commutation: CommutationMatrix,
+    order: List[int],
+    deadline: float = float("inf"),
+) -> Optional[Tuple[float, List[int], List[int], List[int]]]:
+    """The placement found by local search from order, like search_placement(), or None if
+    the chain cannot be placed."""
+    min_cost, order, bounds = local_search(model, commutation, order, deadline)
+    if min_cost == float("inf"):
+        return None
+    segments, targets = bounds_placement(
+        model, model.segment_table(order), order, bounds
+    )
+    return min_cost, order, segments, targets
+
+
+def anytime_search(
+    chain: List[AbsElement],
+    model: ChainModel,
+    commutation: CommutationMatrix,
+    timeout: float,
+    jobs: int = 1,
+) -> Tuple[Optional[Tuple[float, List[int], List[int], List[int]]], bool]:
+    """Find the cheapest order and placement of a chain within timeout seconds.
+
+    Returns:
+        (result, complete), where result is (cost, order, segments, targets) like
+        search_placement(), or None if no placement was found, and complete tells whether the
+        exhaustive search finished, i.e., the result is optimal.
+    """
+    deadline = time.monotonic() + timeout
+    start = heuristic_placement(chain, model)
+    if start is not None and commutation.is_valid(tuple(start[0])):
+        order = start[0]
+    else:
+        order = segment_order(model, commutation)
+
+    best = local_optimum(model, commutation, order, deadline)
+    upper_bound = float("inf") if best is None else best[0]
+
+    exhaustive = search_placement(
+        model, commutation, jobs, deadline, upper_bound=upper_bound
+    )
+    complete = time.monotonic() < deadline
+    # A complete search finds the same placement as search_placement() without bound.
+    if exhaustive is not None and (complete or best is None or exhaustive[0] < best[0]):
+        best = exhaustive
+    return best, complete
+
+
+def anytime_chain_placement(
+    chain: List[AbsElement],
+    path: str,
+    opt_level: str,
+    timeout: float,
+    jobs: int = 1,
+) -> List[AbsElement]:
+    """Place a chain within timeout seconds, same interface and output as cost_chain_placement().
+
+    Placements found before the budget expired are optimal and cached like those of
+    cost_chain_placement(), the others are not cached.
+    """
+    signature = chain_signature(chain, path, opt_level, "cost")
+    init_dependency(chain, path)
+
+    final_chain = deepcopy(chain)
+    if opt_level != "no" and len(chain) > 0:
+        cached = cached_placement(signature, chain)
+        if cached is not None:
+            final_chain = cached
+        else:
+            model = ChainModel(chain)
+            result, complete = anytime_search(
+                chain, model, CommutationMatrix(chain, path, opt_level), timeout, jobs
+            )
+            if result is not None and result[0] < cost(chain):
+                _, order, segments, targets = result
+                final_chain = model.apply(final_chain, order, segments, targets)
+            if complete:
+                cache_placement(signature, chain, final_chain)
+            else:
+                GRAPH_LOG.info(
+                    f"Optimization of a chain of {len(chain)} elements stopped after {timeout}s, "
+                    f"using the best placement found (cost {cost(final_chain):.2f})."
+                )
+
+    return final_chain
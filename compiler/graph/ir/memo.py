@@ -0,0 +1,148 @@
+"""
+Memoized chain placements.
+
+The same element list is often attached to many edges (e.g., the ingress/egress elements of
+a service are expanded into every edge of it), and optimizing it again gives the same result.
+Placements are cached in memory and on disk (under `.appnet_cache/graph`, see ElementCache),
+keyed by a canonical signature of the chain: the properties, constraints and current placement
+of its elements, the optimization level and algorithm, the cost profile and a fingerprint of
+the optimizer code. A cached placement is the new order of the chain (as indices into the
+original chain) with the target and final position of each element.
+"""
+import hashlib
+import json
+import os
+from copy import deepcopy
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from compiler import cache_base_dir
+from compiler.element.cache import ElementCache
+from compiler.graph.ir.cost_model import COST_PROFILE, REPLICAS, element_type
+from compiler.graph.ir.element import AbsElement
+from compiler.graph.logger import GRAPH_LOG
+
+_IR_DIR = Path(__file__).parent
+# Sources whose behavior determines the optimized placements.
+_VERSION_SOURCES = [
+    "bypass.py",
+    "commutation.py",
+    "cost_model.py",
+    "joint.py",
+    "local_search.py",
+    "memo.py",
+    "mip.py",
+    "optimization.py",
+    "placement.py",
+]
+
+_optimizer_version: Optional[str] = None
+
+# (index in the original chain, target, final position) of each element, in the new order
+Placement = List[Tuple[int, str, str]]
+
+
+class PlacementCache(ElementCache):
+    @property
+    def disk_dir(self) -> str:
+        return os.path.join(cache_base_dir, "graph", self.namespace)
+
+
+PLACEMENT_CACHE = PlacementCache("placement")
+
+
+def optimizer_version() -> str:
+    """Fingerprint of the optimizer code."""
+    global _optimizer_version
+    if _optimizer_version is None:
+        h = hashlib.sha256()
+        for rel in _VERSION_SOURCES:
+            h.update(rel.encode())
+            h.update((_IR_DIR / rel).read_bytes())
+        _optimizer_version = h.hexdigest()
+    return _optimizer_version
+
+
+def element_vector(element: AbsElement, chain: List[AbsElement]) -> Dict[str, Any]:
+    """The properties and constraints of an element that the optimizers depend on."""
+    partner = element.partner
+    for i, other in enumerate(chain):
+        if partner != "" and partner in [other.lib_name, "".join(other.name)]:
+            partner = i
+            break
+    vector = {
+        "name": element_type(element),
+        "position": element.position,
+        "processor": element.processor,
+        "upgrade": element.upgrade,
+        "target": element.target,
+        "final_position": element.final_position,
+        "partner": partner,
+        "selectivity": element.selectivity,
+        "state": element.prop["state"],
+        "sensitivity": element.prop.get("sensitivity"),
+        "replicas": [REPLICAS.count(element.client), REPLICAS.count(element.server)],
+    }
+    for path in ["request", "response"]:
+        vector[path] = {
+            p: sorted(set(v)) if isinstance(v, list) else v
+            for p, v in sorted(element.prop[path].items())
+        }
+    return vector
+
+
+def chain_signature(
+    chain: List[AbsElement], path: str, opt_level: str, algorithm: str, *extra
+) -> str:
+    """The canonical signature of optimizing a chain, computed before init_dependency()."""
+    signature = {
+        "optimizer": optimizer_version(),
+        "profile": COST_PROFILE.digest(),
+        "path": path,
+        "opt_level": opt_level,
+        "algorithm": algorithm,
+        "extra": [str(e) for e in extra],
+        "chain": [element_vector(element, chain) for element in chain],
+    }
+    return hashlib.sha256(
+        json.dumps(signature, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def chain_placement(chain: List[AbsElement], new_chain: List[AbsElement]) -> Placement:
+    """The placement of new_chain, an optimized copy of chain."""
+    index = {element.id: i for i, element in enumerate(chain)}
+    return [
+        (index[element.id], element.target, element.final_position)
+        for element in new_chain
+    ]
+
+
+def apply_placement(chain: List[AbsElement], placement: Placement) -> List[AbsElement]:
+    """Reorder (a copy of) chain and set the target and final position of each element."""
+    new_chain = []
+    for i, target, final_position in placement:
+        element = chain[i]
+        element.target = target
+        element.final_position = final_position
+        new_chain.append(element)
+    return new_chain
+
+
+def cached_placement(
+    signature: str, chain: List[AbsElement]
+) -> Optional[List[AbsElement]]:
+    """The cached optimized copy of chain, or None if the signature is not cached."""
+    placement = PLACEMENT_CACHE.get(signature)
+    if placement is None:
+        return None
+    GRAPH_LOG.info(
+        f"Reusing the optimized placement of an identical chain ({signature[:12]})"
+    )
+    return apply_placement(deepcopy(chain), placement)
+
+
+def cache_placement(
+    signature: str, chain: List[AbsElement], new_chain: List[AbsElement]
+):
+    PLACEMENT_CACHE.put(signature, chain_placement(chain, new_chain))
@@ -1,153 +1,396 @@
-import gurobipy as gp
-from gurobipy import GRB
-
-def optimize(dreqi, drespi, si, ri, Bj, Ereqi, Erespi, Sstrong, Srelaxed, Pij, Oij):
-    elements = list(dreqi.keys())
-    locations = list(Bj.keys())
-    orders = list(range(len(elements)))
-
-    m = gp.Model("AppNet_Optimization")
-
-    # Decision variables
-    x = m.addVars(elements, locations, vtype=GRB.BINARY, name="x")
-    y = m.addVars(elements, orders, vtype=GRB.BINARY, name="y")
-    max_strong_sync = m.addVars(locations, vtype=GRB.CONTINUOUS, name="max_strong_sync")
-    max_relaxed_sync = m.addVars(locations, vtype=GRB.CONTINUOUS, name="max_relaxed_sync")
-    location_active = m.addVars(locations, vtype=GRB.BINARY, name="location_active")
-
-    # Objective function
-    m.setObjective(
-        gp.quicksum(
-            gp.quicksum(
-                (Ereqi[i] * (1 - dreqi[i]) + Erespi[i] * (1 - drespi[i])) * x[i, j]
-                for i in elements
+"""
+Chain placement as a mixed-integer linear program (`--opt_algorithm mip`).
+
+The program is solved with HiGHS (`pip install highspy`) within a time limit, starting from the
+basic_heuristics() placement. Variables:
+    a[i, s, t]  element i is placed in segment s with target t
+    q[i, j]     element i runs before element j (i < j); fixed for conflicting elements
+    u[j, m]     m drop/block elements run before element j
+    w[j, m, t]  u[j, m] and element j uses target t (the element overhead under workload (1-d)^m)
+    on[s]       segment s is used (processor, ipc and network overhead)
+and one indicator per (segment, target) group for the wasm invocation and the state sync
+overhead. The program requires the elements of a segment with the same target to be adjacent
+(one run per group), so the order found by the solver is placed again with find_min_cost(),
+which may split runs. With different drop rates per element (see drop_rate()), the workload is
+approximated with the geometric mean of the drop rates, and responses dropped by the elements
+after an element are not modeled.
+"""
+import math
+from copy import deepcopy
+from typing import Dict, List, Optional, Tuple
+
+from compiler.graph.ir.commutation import CommutationMatrix
+from compiler.graph.ir.cost_model import (
+    COST_PROFILE,
+    SEGMENT_PROCESSOR,
+    SEGMENTS,
+    ChainModel,
+)
+from compiler.graph.ir.element import AbsElement
+from compiler.graph.ir.memo import cache_placement, cached_placement, chain_signature
+from compiler.graph.ir.optimization import (
+    cost,
+    find_min_cost,
+    heuristic_placement,
+    init_dependency,
+)
+from compiler.graph.logger import GRAPH_LOG
+
+# Default time limit of the solver (seconds), see --mip_time_limit
+MIP_TIME_LIMIT = 10.0
+
+INF = float("inf")
+
+
+class LinearProgram:
+    """A minimal builder for sparse (mixed-integer) linear programs."""
+
+    def __init__(self):
+        self.cost: List[float] = []
+        self.lower: List[float] = []
+        self.upper: List[float] = []
+        self.integer: List[bool] = []
+        self.rows: List[Tuple[Dict[int, float], float, float]] = []
+
+    def var(
+        self,
+        cost: float = 0.0,
+        integer: bool = True,
+        lower: float = 0.0,
+        upper: float = 1.0,
+    ) -> int:
+        self.cost.append(cost)
+        self.lower.append(lower)
+        self.upper.append(upper)
+        self.integer.append(integer)
+        return len(self.cost) - 1
+
+    def row(self, coefs: Dict[int, float], lower: float, upper: float):
+        self.rows.append((coefs, lower, upper))
+
+    def solve(
+        self, time_limit: float, start: Optional[List[float]] = None
+    ) -> Optional[List[float]]:
+        """Minimize the program, returning the values of the variables (None if no solution was found)."""
+        try:
+            import highspy
+        except ImportError:
+            raise ImportError(
+                "--opt_algorithm mip requires HiGHS, install it with `pip install highspy`"
             )
-            + max_strong_sync[j]
-            + max_relaxed_sync[j]
-            + Bj[j] * location_active[j]
-            for j in locations
-        ),
-        GRB.MINIMIZE
-    )
 
-    # Element Placement Constraint
-    m.addConstrs((gp.quicksum(x[i, j] for j in locations) == 1 for i in elements), name="placement")
-
-    # Execution Order Constraint
-    m.addConstrs((gp.quicksum(y[i, k] for k in orders) == 1 for i in elements), name="order")
-
-    # Unique Position Constraint
-    m.addConstrs((gp.quicksum(y[i, k] for i in elements) <= 1 for k in orders), name="unique_position")
-
-    # Allowed Location Constraint
-    m.addConstrs((x[i, j] <= Pij[i, j] for i in elements for j in locations), name="allowed_location")
-
-    # Allowed Ordering Constraint
-    m.addConstrs((y[i, k] <= y[j, k + 1] for i in elements for j in elements for k in range(len(orders) - 1) if i != j and Oij.get((i, j), 0) == 1), name="allowed_ordering")
-
-    # Strong synchronization constraints
-    m.addConstrs((max_strong_sync[j] >= si[i] * x[i, j] * Sstrong[i, j] for i in elements for j in locations), name="strong_sync")
-
-    # Relaxed synchronization constraints
-    m.addConstrs((max_relaxed_sync[j] >= ri[i] * x[i, j] * Srelaxed[i, j] for i in elements for j in locations), name="relaxed_sync")
-
-    # Location active constraint
-    m.addConstrs((location_active[j] >= x[i, j] for i in elements for j in locations), name="location_active")
-
-    # Optimize model
-    m.optimize()
-
-    if m.status == GRB.OPTIMAL:
-        placement = m.getAttr('x', x)
-        order = m.getAttr('x', y)
-        optimal_placement = {i: j for i in elements for j in locations if placement[i, j] > 0.5}
-        optimal_order = {i: k for i in elements for k in orders if order[i, k] > 0.5}
-        return optimal_placement, optimal_order
-    else:
-        print("No optimal solution found.")
-        return None, None
-
-# Test cases
-dreqi = {'A': 0, 'B': 0}
-drespi = {'A': 0, 'B': 0}
-si = {'A': 0, 'B': 0}
-ri = {'A': 0, 'B': 0}
-Bj = {'L1': 5, 'L2': 5}
-Ereqi = {'A': 1, 'B': 1}
-Erespi = {'A': 1, 'B': 1}
-Sstrong = {('A', 'L1'): 1, ('A', 'L2'): 1, ('B', 'L1'): 1, ('B', 'L2'): 1}
-Srelaxed = {('A', 'L1'): 1, ('A', 'L2'): 1, ('B', 'L1'): 1, ('B', 'L2'): 1}
-Pij = {('A', 'L1'): 1, ('A', 'L2'): 1, ('B', 'L1'): 1, ('B', 'L2'): 1}
-Oij = {('A', 'B'): 0, ('B', 'A'): 0}
-
-optimal_placement, optimal_order = optimize(dreqi, drespi, si, ri, Bj, Ereqi, Erespi, Sstrong, Srelaxed, Pij, Oij)
-
-print("Optimal Placement:")
-for elem, loc in optimal_placement.items():
-    print(f"Element {elem} is placed at location {loc}")
-
-print("\nOptimal Order:")
-for elem, ord in optimal_order.items():
-    print(f"Element {elem} is executed in order {ord}")
-# import random
-# import time
-
-# def generate_test_case(num_elements, num_locations):
-#     # Generate random test data
-#     elements = [f"E{i}" for i in range(num_elements)]
-#     locations = [f"L{j}" for j in range(num_locations)]
-    
-#     dreqi = {elem: random.uniform(0, 0.3) for elem in elements}
-#     drespi = {elem: random.uniform(0, 0.2) for elem in elements}
-#     si = {elem: random.choice([0, 1]) for elem in elements}
-#     ri = {elem: random.choice([0, 1]) for elem in elements}
-#     Bj = {loc: random.uniform(1, 10) for loc in locations}
-#     Ereqi = {elem: random.uniform(1, 5) for elem in elements}
-#     Erespi = {elem: random.uniform(1, 5) for elem in elements}
-#     Sstrong = {(elem, loc): random.uniform(1, 3) for elem in elements for loc in locations}
-#     Srelaxed = {(elem, loc): random.uniform(1, 3) for elem in elements for loc in locations}
-#     Pij = {(elem, loc): random.choice([0, 1]) for elem in elements for loc in locations}
-    
-#     # Ensure at least one valid placement
-#     for elem in elements:
-#         if all(Pij[(elem, loc)] == 0 for loc in locations):
-#             Pij[(elem, random.choice(locations))] = 1
-    
-#     Oij = {(elem1, elem2): random.choice([0, 1]) for elem1 in elements for elem2 in elements if elem1 != elem2}
-    
-#     return dreqi, drespi, si, ri, Bj, Ereqi, Erespi, Sstrong, Srelaxed, Pij, Oij
-
-# def test_scalability():
-#     sizes = [(5, 5), (10, 5), (20, 5), (30, 5), (40, 5), (100, 5)]
-#     results = []
-    
-#     for num_elements, num_locations in sizes:
-#         dreqi, drespi, si, ri, Bj, Ereqi, Erespi, Sstrong, Srelaxed, Pij, Oij = generate_test_case(num_elements, num_locations)
-        
-#         start_time = time.time()
-#         optimal_placement, optimal_order = optimize(dreqi, drespi, si, ri, Bj, Ereqi, Erespi, Sstrong, Srelaxed, Pij, Oij)
-#         end_time = time.time()
-        
-#         results.append({
-#             "num_elements": num_elements,
-#             "num_locations": num_locations,
-#             "execution_time": end_time - start_time,
-#             "optimal_placement": optimal_placement,
-#             "optimal_order": optimal_order
-#         })
-        
-#         print(f"Test case with {num_elements} elements and {num_locations} locations executed in {end_time - start_time:.2f} seconds.")
-    
-#     return results
-
-# # Run the scalability test
-# scalability_results = test_scalability()
-
-# # Print results
-# for result in scalability_results:
-#     print(f"Elements: {result['num_elements']}, Locations: {result['num_locations']}, Execution Time: {result['execution_time']:.2f} seconds")
-
-# # Optional: You can save the results to a file for further analysis
-# import json
-# with open('scalability_results.json', 'w') as f:
-#     json.dump(scalability_results, f, indent=4)
+        lp = highspy.HighsLp()
+        lp.num_col_, lp.num_row_ = len(self.cost), len(self.rows)
+        lp.col_cost_, lp.col_lower_, lp.col_upper_ = self.cost, self.lower, self.upper
+        lp.row_lower_ = [lower for _, lower, _ in self.rows]
+        lp.row_upper_ = [upper for _, _, upper in self.rows]
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+        start_, index_, value_ = [0], [], []
+        for coefs, _, _ in self.rows:
+            for col, value in coefs.items():
+                index_.append(col)
+                value_.append(value)
+            start_.append(len(index_))
+        lp.a_matrix_.start_, lp.a_matrix_.index_, lp.a_matrix_.value_ = (
+            start_,
+            index_,
+            value_,
+        )
+        lp.integrality_ = [
+            highspy.HighsVarType.kInteger
+            if integer
+            else highspy.HighsVarType.kContinuous
+            for integer in self.integer
+        ]
+
+        h = highspy.Highs()
+        h.setOptionValue("output_flag", False)
+        h.setOptionValue("time_limit", float(time_limit))
+        # Keep the solution reproducible
+        h.setOptionValue("threads", 1)
+        h.passModel(lp)
+        if start is not None:
+            solution = highspy.HighsSolution()
+            solution.col_value = start
+            h.setSolution(solution)
+        h.run()
+        status = h.getModelStatus()
+        if status == highspy.HighsModelStatus.kTimeLimit:
+            GRAPH_LOG.info(
+                f"The MIP solver hit the time limit of {time_limit}s, using the best solution found."
+            )
+        if (
+            h.getInfo().primal_solution_status
+            != highspy.SolutionStatus.kSolutionStatusFeasible
+        ):
+            return None
+        return list(h.getSolution().col_value)
+
+
+class PlacementProgram:
+    """The placement and ordering program of a chain."""
+
+    def __init__(
+        self, model: ChainModel, commutation: CommutationMatrix, drop: List[bool]
+    ):
+        self.model = model
+        n = model.length
+        lp = LinearProgram()
+        self.lp = lp
+
+        # a[i, s, t]
+        self.a: Dict[Tuple[int, int, int], int] = {}
+        for i in range(n):
+            for s in range(len(SEGMENTS)):
+                for t in model.options[i][s]:
+                    self.a[(i, s, t)] = lp.var()
+            lp.row({v: 1.0 for (x, _, _), v in self.a.items() if x == i}, 1.0, 1.0)
+
+        # q[i, j] for i < j, before(i, j) = q[i, j] or 1 - q[j, i]
+        self.q: Dict[Tuple[int, int], int] = {}
+        for j in range(n):
+            for i in range(j):
+                fixed = commutation.preds[j] >> i & 1
+                self.q[(i, j)] = lp.var(lower=1.0 if fixed else 0.0)
+        # transitivity
+        for i in range(n):
+            for j in range(i + 1, n):
+                for k in range(j + 1, n):
+                    lp.row(
+                        {
+                            self.q[(i, j)]: 1.0,
+                            self.q[(j, k)]: 1.0,
+                            self.q[(i, k)]: -1.0,
+                        },
+                        0.0,
+                        1.0,
+                    )
+        # Segments are visited in order: before(i, j) => segment(i) <= segment(j)
+        segment = lambda i, sign: {
+            v: sign * s for (x, s, _), v in self.a.items() if x == i
+        }
+        big_m = len(SEGMENTS) - 1
+        for i in range(n):
+            for j in range(n):
+                if i == j:
+                    continue
+                coefs = segment(i, 1.0)
+                for v, c in segment(j, -1.0).items():
+                    coefs[v] = coefs.get(v, 0.0) + c
+                if i < j:
+                    # seg(i) - seg(j) + M q[i, j] <= M
+                    coefs[self.q[(i, j)]] = big_m
+                    lp.row(coefs, -INF, big_m)
+                else:
+                    # seg(i) - seg(j) - M q[j, i] <= 0
+                    coefs[self.q[(j, i)]] = -big_m
+                    lp.row(coefs, -INF, 0.0)
+
+        # Elements of a segment with the same target are adjacent (one run per group):
+        # not (i and j use t, k uses another target of s, and i before k before j)
+        before = (
+            lambda i, j: ({self.q[(i, j)]: 1.0}, 0.0)
+            if i < j
+            else ({self.q[(j, i)]: -1.0}, 1.0)
+        )
+        for s in range(len(SEGMENTS)):
+            targets = sorted({t for (_, ss, t) in self.a if ss == s})
+            if len(targets) < 2:
+                continue
+            for t in targets:
+                for i in range(n):
+                    for j in range(n):
+                        if i == j or (i, s, t) not in self.a or (j, s, t) not in self.a:
+                            continue
+                        for k in range(n):
+                            others = [
+                                self.a[(k, s, tt)]
+                                for tt in targets
+                                if tt != t and (k, s, tt) in self.a
+                            ]
+                            if k in (i, j) or len(others) == 0:
+                                continue
+                            coefs = {self.a[(i, s, t)]: 1.0, self.a[(j, s, t)]: 1.0}
+                            for v in others:
+                                coefs[v] = 1.0
+                            constant = 0.0
+                            for x, y in [(i, k), (k, j)]:
+                                c, const = before(x, y)
+                                for v, value in c.items():
+                                    coefs[v] = coefs.get(v, 0.0) + value
+                                constant += const
+                            lp.row(coefs, -INF, 4.0 - constant)
+
+        # Workload: u[j, m] and w[j, m, t]. The program only counts drop/block elements, so
+        # different drop rates (from a cost profile) are replaced by their geometric mean.
+        factors = [model.factor[i] for i in range(n) if drop[i]] or [1.0]
+        keep = (
+            factors[0]
+            if len(set(factors)) == 1
+            else math.prod(factors) ** (1.0 / len(factors))
+        )
+        self.u: Dict[Tuple[int, int], int] = {}
+        self.w: Dict[Tuple[int, int, int], int] = {}
+        for j in range(n):
+            droppers = [i for i in range(n) if i != j and drop[i]]
+            targets = sorted({t for (x, _, t) in self.a if x == j})
+            for m in range(len(droppers) + 1):
+                self.u[(j, m)] = lp.var()
+                for t in targets:
+                    w = lp.var(
+                        model.element_cost[j][t] * keep**m, integer=False, upper=INF
+                    )
+                    self.w[(j, m, t)] = w
+                    coefs = {w: 1.0, self.u[(j, m)]: -1.0}
+                    for (x, _, tt), v in self.a.items():
+                        if x == j and tt == t:
+                            coefs[v] = -1.0
+                    lp.row(coefs, -1.0, INF)
+            lp.row({self.u[(j, m)]: 1.0 for m in range(len(droppers) + 1)}, 1.0, 1.0)
+            # sum_m m u[j, m] = sum_i before(i, j)
+            coefs = {self.u[(j, m)]: float(m) for m in range(1, len(droppers) + 1)}
+            constant = 0.0
+            for i in droppers:
+                if i < j:
+                    coefs[self.q[(i, j)]] = -1.0
+                else:
+                    coefs[self.q[(j, i)]] = 1.0
+                    constant += 1.0
+            lp.row(coefs, constant, constant)
+
+        # Segment and (segment, target) group overhead
+        self.on: Dict[int, int] = {}
+        self.groups: List[Tuple[int, int, int, float]] = []
+        for s in range(len(SEGMENTS)):
+            members = [(i, t, v) for (i, ss, t), v in self.a.items() if ss == s]
+            if len(members) == 0:
+                continue
+            self.on[s] = lp.var(model.enter_cost[s])
+            for _, _, v in members:
+                lp.row({self.on[s]: 1.0, v: -1.0}, 0.0, INF)
+            for t in sorted({t for _, t, _ in members}):
+                overheads = []
+                if model.is_wasm[t] and SEGMENT_PROCESSOR[s] != "grpc":
+                    overheads.append((0, COST_PROFILE.wasm_invocation_overhead))
+                overheads.append((1, model.sync_cost[s][1]))
+                overheads.append((2, model.sync_cost[s][2] - model.sync_cost[s][1]))
+                for level, c in overheads:
+                    if c <= 0:
+                        continue
+                    g = lp.var(c)
+                    self.groups.append((s, t, level, g))
+                    for i, tt, v in members:
+                        if tt == t and model.sync[i][s] >= level:
+                            lp.row({g: 1.0, v: -1.0}, 0.0, INF)
+        self.drop = drop
+
+    def values(
+        self, order: List[int], segments: List[int], targets: List[int]
+    ) -> List[float]:
+        """The values of all variables for a given placement (used as the starting solution)."""
+        model, lp = self.model, self.lp
+        x = [0.0] * len(lp.cost)
+        position = {e: k for k, e in enumerate(order)}
+        for (i, s, t), v in self.a.items():
+            x[v] = 1.0 if (segments[i], targets[i]) == (s, t) else 0.0
+        for (i, j), v in self.q.items():
+            x[v] = 1.0 if position[i] < position[j] else 0.0
+        for j in range(model.length):
+            m = sum(
+                1
+                for i in range(model.length)
+                if self.drop[i] and position[i] < position[j]
+            )
+            x[self.u[(j, m)]] = 1.0
+        for (j, m, t), v in self.w.items():
+            x[v] = x[self.u[(j, m)]] if targets[j] == t else 0.0
+        for s, v in self.on.items():
+            x[v] = 1.0 if s in segments else 0.0
+        for s, t, level, g in self.groups:
+            x[g] = (
+                1.0
+                if any(
+                    segments[i] == s
+                    and targets[i] == t
+                    and (level == 0 or model.sync[i][s] >= level)
+                    for i in range(model.length)
+                )
+                else 0.0
+            )
+        return x
+
+    def decode(self, x: List[float]) -> Tuple[List[int], List[int], List[int]]:
+        n = self.model.length
+        segments, targets = [0] * n, [0] * n
+        for (i, s, t), v in self.a.items():
+            if x[v] > 0.5:
+                segments[i], targets[i] = s, t
+        predecessors = [0] * n
+        for (i, j), v in self.q.items():
+            if x[v] > 0.5:
+                predecessors[j] += 1
+            else:
+                predecessors[i] += 1
+        order = sorted(range(n), key=lambda i: predecessors[i])
+        return order, segments, targets
+
+
+def mip_chain_placement(
+    chain: List[AbsElement],
+    path: str,
+    opt_level: str,
+    time_limit: float = MIP_TIME_LIMIT,
+) -> List[AbsElement]:
+    """Place a chain with the MIP, same interface and output as cost_chain_placement()."""
+    signature = chain_signature(chain, path, opt_level, "mip", time_limit)
+    init_dependency(chain, path)
+
+    final_chain = deepcopy(chain)
+    if opt_level != "no" and len(chain) > 0:
+        cached = cached_placement(signature, chain)
+        if cached is not None:
+            final_chain = cached
+        else:
+            model = ChainModel(chain)
+            best = mip_search(
+                chain, model, CommutationMatrix(chain, path, opt_level), time_limit
+            )
+            if best is not None and best[0] < cost(chain):
+                _, order, segments, targets = best
+                final_chain = model.apply(final_chain, order, segments, targets)
+            cache_placement(signature, chain, final_chain)
+
+    return final_chain
+
+
+def mip_search(
+    chain: List[AbsElement],
+    model: ChainModel,
+    commutation: CommutationMatrix,
+    time_limit: float,
+) -> Optional[Tuple[float, List[int], List[int], List[int]]]:
+    """The best of the heuristic placement, the MIP solution and the exact placement of its order."""
+    program = PlacementProgram(
+        model,
+        commutation,
+        [element.has_prop("request", "drop", "block") for element in chain],
+    )
+    start = heuristic_placement(chain, model)
+    candidates = []
+    if start is not None and commutation.is_valid(tuple(start[0])):
+        candidates.append((model.evaluate(*start), *start))
+    x = program.lp.solve(
+        time_limit, program.values(*start) if len(candidates) > 0 else None
+    )
+    if x is not None:
+        order, segments, targets = program.decode(x)
+        candidates.append(
+            (model.evaluate(order, segments, targets), order, segments, targets)
+        )
+        # The program assumes one run per target and segment, place the order exactly.
+        c, segments, targets = find_min_cost(model, order)
+        if len(segments) > 0:
+            candidates.append((c, order, segments, targets))
+    if len(candidates) == 0:
+        return None
+    return min(candidates, key=lambda candidate: candidate[0])
@@ -1,22 +1,52 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
-from itertools import permutations, product
 from pprint import pprint
-from typing import Dict, List, Tuple
-import os, yaml
-
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from compiler.element.frontend.sensitivity_analysis import CONSERVATIVE
+from compiler.graph.ir.commutation import CommutationMatrix, analyzed_paths
+from compiler.graph.ir.cost_model import (
+    COST_PROFILE,
+    REPLICAS,
+    SEGMENT_PROCESSOR,
+    SEGMENTS,
+    ChainModel,
+    drop_rate,
+    drop_rate_source,
+    element_type,
+    element_workload,
+    response_share,
+    segment_service,
+    sync_factor,
+)
 from compiler.graph.ir.element import AbsElement
-from compiler import graph_base_dir
+from compiler.graph.ir.memo import cache_placement, cached_placement, chain_signature
+from compiler.graph.logger import GRAPH_LOG
+
 
 def init_dependency(chain: List[AbsElement], path: str):
-    for element in chain:
-        if element.has_prop(path, "record"):
-            element.add_prop(path, "record", ["droptrace", "blocktrace", "copytrace"])
-        if element.has_prop(path, "drop"):
-            element.add_prop(path, "write", "droptrace")
-        if element.has_prop(path, "block"):
-            element.add_prop(path, "write", "blocktrace")
-        if element.has_prop(path, "copy"):
-            element.add_prop(path, "write", "copytrace")
+    for p in analyzed_paths(path):
+        for element in chain:
+            # With strong equivalence, the drops, blocks and copies before an element must not
+            # change what it records or its state: drops matter to an element that requires all
+            # RPCs, copies (duplicates) to one that is not idempotent, or ordering-sensitive since
+            # a later duplicate (e.g., a retry) also reorders the RPCs it sees.
+            if len(element.get_prop(p, "record")) > 0:
+                element.add_prop(p, "record", ["droptrace", "blocktrace", "copytrace"])
+            else:
+                sensitivity = element.prop.get("sensitivity", CONSERVATIVE)
+                if sensitivity["requires_all_rpcs"]:
+                    element.add_prop(p, "record", ["droptrace", "blocktrace"])
+                if not sensitivity["idempotent"] or sensitivity["ordering_sensitive"]:
+                    element.add_prop(p, "record", "copytrace")
+            if element.has_prop(p, "drop"):
+                element.add_prop(p, "write", "droptrace")
+            if element.has_prop(p, "block"):
+                element.add_prop(p, "write", "blocktrace")
+            if element.has_prop(p, "copy"):
+                element.add_prop(p, "write", "copytrace")
 
 
 def gen_dependency(chain: List[AbsElement], path: str):
@@ -80,14 +110,21 @@ def equivalent(
 ) -> bool:
     if opt_level == "ignore":
         return True
-    dep, new_dep = gen_dependency(chain, path), gen_dependency(new_chain, path)
-    if opt_level == "weak":
-        return dep["read"] == new_dep["read"]
-    elif opt_level == "strong":
-        return dep == new_dep
-    else:
-        raise ValueError(f"Unexpected optimization level {opt_level}")
-    # return dep == new_dep
+    for p in analyzed_paths(path):
+        # responses traverse the chain in reverse order
+        if p == "response":
+            dep, new_dep = gen_dependency(chain[::-1], p), gen_dependency(new_chain[::-1], p)
+        else:
+            dep, new_dep = gen_dependency(chain, p), gen_dependency(new_chain, p)
+        if opt_level == "weak":
+            if dep["read"] != new_dep["read"]:
+                return False
+        elif opt_level == "strong":
+            if dep != new_dep:
+                return False
+        else:
+            raise ValueError(f"Unexpected optimization level {opt_level}")
+    return True
 
 
 class OptimizedLabel(Exception):
@@ -305,84 +342,61 @@ def split_chain(chain: List[AbsElement]) -> Dict[str, List[AbsElement]]:
     return subchains
 
 
-def in_nonlocal_position(element: AbsElement, pos: str) -> bool:
-    state_dependence = element.prop["state"]["state_dependence"]
-    if "client" in pos and state_dependence == ["client_service"]:
-        return False
-    if "server" in pos and state_dependence == ["server_service"]:
-        return False
-    if pos == "ambient" and (
-        "client_service" in state_dependence or "server_service" in state_dependence
-    ):
-        return False
-    return True
-
-
 def cost(chain: List[AbsElement]) -> float:
     c = 0
-    element_overhead_config = {
-        "grpc": 1.0,
-        "interceptor_arpc": 1.0,
-        "sidecar_native": 1.0,
-        "sidecar_wasm": 3.0,
-        "sidecar_arpc": 1.0,
-        "ambient_native": 1.0,
-        "ambient_wasm": 3.0,
-    }
-    basic_overhead_config = {
-        "client_grpc": 0.5,
-        "client_sidecar": 5.0,
-        "ambient": 5.0,
-        "server_sidecar": 5.0,
-        "server_grpc": 0.5,
-    }
-    transmission_overhead_config = {
-        "ipc": 0.8,
-        "network": 1,
-    }
-    state_sync_config = {
-        "strong": {
-            "client_grpc": 5.0,
-            "client_sidecar": 5.0,
-            "ambient": 2.0,
-            "server_sidecar": 5.0,
-            "server_grpc": 5.0,
-        },
-        "weak": {
-            "client_grpc": 1.0,
-            "client_sidecar": 1.0,
-            "ambient": 1.0,
-            "server_sidecar": 1.0,
-            "server_grpc": 1.0,
-        },
-    }
-    d = 0.1
-    wasm_invocation = 0.5
+    for _, amount, _ in cost_terms(chain):
+        c += amount
+    return c
+
+
+def cost_terms(chain: List[AbsElement]) -> Iterator[Tuple[str, float, str]]:
+    """The terms that add up to cost(chain), as (description, amount, profile key).
+
+    The profile key names the number of COST_PROFILE the term is computed from.
+    """
+    element_overhead_config = COST_PROFILE.element_cost
+    basic_overhead_config = COST_PROFILE.basic_overhead
+    transmission_overhead_config = COST_PROFILE.transmission_overhead
+    state_sync_config = COST_PROFILE.state_sync_overhead
+    wasm_invocation = COST_PROFILE.wasm_invocation_overhead
 
-    workload = 1.0
+    # fraction of the responses kept by each element
+    response_factors = [1.0 - drop_rate(element, "response") for element in chain]
+    responses_kept = 1.0
+    for f in response_factors:
+        responses_kept *= f
+    workload, kept = 1.0, 1.0
 
-    # element overhead
+    # element overhead (on requests and responses)
     for i, element in enumerate(chain):
-        e = element_overhead_config[element.target]
-        c += e * workload
-        if element.has_prop("request", "drop", "block"):
-            workload *= 1.0 - d
+        name = element_type(element)
+        e = element_overhead_config(name, element.target)
+        load = element_workload(
+            response_share(element), workload, responses_kept, kept, response_factors[i]
+        )
+        yield (
+            f"{name} on {element.target} at workload {load:.2f}",
+            e * load,
+            COST_PROFILE.element_cost_key(name, element.target),
+        )
+        workload *= 1.0 - drop_rate(element, "request")
+        kept *= response_factors[i]
 
     subchains = split_chain(chain)
 
     # network overhead
     if len(subchains["ambient"]) > 0:
-        c += transmission_overhead_config["network"] * 2
+        yield "network (through ambient)", transmission_overhead_config["network"] * 2, "transmission.network"
     else:
-        c += transmission_overhead_config["network"]
+        yield "network", transmission_overhead_config["network"], "transmission.network"
     if len(subchains["client_sidecar"]) > 0:
-        c += transmission_overhead_config["ipc"]
+        yield "ipc to client_sidecar", transmission_overhead_config["ipc"], "transmission.ipc"
     if len(subchains["server_sidecar"]) > 0:
-        c += transmission_overhead_config["ipc"]
+        yield "ipc to server_sidecar", transmission_overhead_config["ipc"], "transmission.ipc"
     for pos, subchain in subchains.items():
         # basic processor overhead
         if len(subchain) > 0:
-            c += basic_overhead_config[pos]
+            yield f"{pos} processor", basic_overhead_config[pos], f"processors.{pos}"
         # state sync overhead
         l_pt, r_pt = 0, 0
         while l_pt < len(subchain):
@@ -395,13 +409,20 @@ def cost(chain: List[AbsElement]) -> float:
             sync_level = "no"
             for i in range(l_pt, r_pt + 1):
                 consistency = subchain[i].prop["state"]["consistency"]
-                if in_nonlocal_position(subchain[i], pos):
+                if sync_factor(subchain[i], pos) > 0.0:
                     if consistency == "strong":
                         sync_level = "strong"
                     elif consistency == "weak" and sync_level != "strong":
                         sync_level = "weak"
             if sync_level in ["strong", "weak"]:
-                c += state_sync_config[sync_level][pos]
+                service = segment_service(subchain[l_pt], pos)
+                replicas = REPLICAS.count(service)
+                yield (
+                    f"{sync_level} state sync in {pos}"
+                    + (f" ({replicas} replicas of {service})" if replicas is not None else ""),
+                    state_sync_config[sync_level][pos] * REPLICAS.sync_factor(service),
+                    f"state_sync.{sync_level}.{pos}",
+                )
             l_pt = r_pt + 1
         # wasm invocation overhead
         if "sidecar" in pos or "ambient" in pos:
@@ -409,145 +430,316 @@ def cost(chain: List[AbsElement]) -> float:
                 if "wasm" in element.target and (
                     i == 0 or "wasm" not in subchain[i - 1].target
                 ):
-                    c += wasm_invocation
-
-    return c
-
-
-def find_min_cost(chain: List[AbsElement]):
-    class InvalidConfigLabel(Exception):
-        pass
-
-    def get_processor_and_position(
-        index: int, ipc1: int, network1: int, network2: int, ipc2: int
-    ) -> str:
-        if index < ipc1:
-            return "client", "grpc"
-        elif ipc1 <= index < network1:
-            return "client", "sidecar"
-        elif network1 <= index < network2:
-            return "ambient", "ambient"
-        elif network2 <= index < ipc2:
-            return "server", "sidecar"
-        else:
-            return "server", "grpc"
-
-    length = len(chain)
-    min_cost = 1000000
-    best_processor_list, best_position_list = [], []
+                    yield f"wasm invocation in {pos}", wasm_invocation, "wasm_invocation"
+
+
+def explain_placement(chain: List[AbsElement]) -> List[str]:
+    """Explain the cost of a placed chain by the (measured or default) numbers it comes from.
+
+    Besides the terms of cost(), the alternatives of each element (the costs of the other
+    targets it could use) and the drop rates that decide how early drop/block elements run are
+    listed.
+    """
+    terms = list(cost_terms(chain))
+    total = sum(amount for _, amount, _ in terms)
+    measured = sum(amount for _, amount, key in terms if key in COST_PROFILE.measured)
+    lines = [
+        f"Cost {total:.2f} ({COST_PROFILE.metric}, {measured:.2f} from measured numbers) of "
+        f"{' -> '.join(element_type(element) for element in chain)}:"
+    ]
+    for description, amount, key in sorted(terms, key=lambda term: -term[1]):
+        lines.append(f"  {description}: {amount:.2f} [{COST_PROFILE.source(key)}]")
+    for element in chain:
+        name = element_type(element)
+        alternatives = []
+        for t in ChainModel([element]).targets:
+            if t != element.target:
+                source = COST_PROFILE.source(COST_PROFILE.element_cost_key(name, t))
+                alternatives.append(f"{t} {COST_PROFILE.element_cost(name, t):.2f} [{source}]")
+        if len(alternatives) > 0:
+            lines.append(f"  {name} on {element.target} instead of {', '.join(alternatives)}")
+        for p in ["request", "response"]:
+            if element.has_prop(p, "drop", "block"):
+                source = drop_rate_source(element, p)
+                if source == "spec":
+                    source = "selectivity in the spec"
+                elif source == "analysis":
+                    source = "literal probability in the element"
+                else:
+                    source = COST_PROFILE.source(source)
+                lines.append(f"  {name} drops {drop_rate(element, p):.1%} of {p}s [{source}]")
+        key = COST_PROFILE.response_share_key(name)
+        if key is not None:
+            share = response_share(element)
+            lines.append(f"  {name} spends {share:.0%} on responses [{COST_PROFILE.source(key)}]")
+    return lines
+
+
+def find_min_cost(
+    model: ChainModel, order: Sequence[int]
+) -> Tuple[float, List[int], List[int]]:
+    """Find the cheapest placement of the chain in the given order.
+
+    Returns:
+        (cost, segments, targets), the segment and target index of each element (see
+        ChainModel.evaluate), or (inf, [], []) if the chain cannot be placed in this order.
+    """
+    length = len(order)
+    table = model.segment_table(order)
+    network = COST_PROFILE.transmission_overhead["network"]
+    min_cost = float("inf")
+    best_bounds = None
     # Enumerate positions of ipc_client/server and network_client/server
     # * ipc_client: client application ~ client sidecar
     # * network_client: client sidecar ~ ambient
     # * network_server: ambient ~ server sidecar
     # * ipc_server: server_sidecar ~ server application
+    # Moving one boundary only changes the cost of the two segments next to it.
     for ipc_client in range(length + 1):
+        c0 = network + table[0][0][ipc_client][0]
         for network_client in range(ipc_client, length + 1):
+            c1 = c0 + table[1][ipc_client][network_client][0]
             for network_server in range(network_client, length + 1):
+                c2 = c1 + table[2][network_client][network_server][0]
                 for ipc_server in range(network_server, length + 1):
-                    options_list = []
-                    position_list = []
-                    try:
-                        for i in range(length):
-                            position, processor = get_processor_and_position(
-                                i,
-                                ipc_client,
-                                network_client,
-                                network_server,
-                                ipc_server,
-                            )
-                            position_list.append(position)
-                            if (
-                                chain[i].position != "any"
-                                and chain[i].position != position
-                            ):
-                                raise InvalidConfigLabel()
-                            if not any(processor in p for p in chain[i].processor):
-                                raise InvalidConfigLabel()
-                            options = []
-                            if len(chain[i].processor) > 0 and any("arpc" in p for p in chain[i].processor): 
-                                if len(chain[i].processor) != 1:
-                                    raise ValueError(f"{chain[i].name}: aRPC should be the only choice for processor")
-                                options.append(chain[i].processor[0])
-                            elif processor == "grpc":
-                                options.append("grpc")
-                            else:
-                                if (
-                                    chain[i].upgrade == "yes"
-                                    or chain[i].upgrade == "any"
-                                ):
-                                    options.append(processor + "_wasm")
-                                if (
-                                    chain[i].upgrade == "any"
-                                    or chain[i].upgrade == "no"
-                                ):
-                                    options.append(processor + "_native")
-                            options_list.append(options)
-                    except InvalidConfigLabel:
-                        continue
-                    for processor_list in list(product(*options_list)):
-                        for i, element in enumerate(chain):
-                            element.target = processor_list[i]
-                            element.final_position = position_list[i]
-                        new_cost = cost(chain)
-                        if new_cost < min_cost:
-                            min_cost = new_cost
-                            best_processor_list = deepcopy(processor_list)
-                            best_position_list = deepcopy(position_list)
-
-    if best_processor_list != []:
-        for i in range(length):
-            chain[i].target = best_processor_list[i]
-            chain[i].final_position = best_position_list[i]
-
-    return min_cost
-
-
-def cost_chain_optimize(chain: List[AbsElement], path: str, opt_level: str, dump_property: bool):
+                    new_cost = (
+                        c2
+                        + table[3][network_server][ipc_server][0]
+                        + table[4][ipc_server][length][0]
+                    )
+                    if new_cost < min_cost:
+                        min_cost = new_cost
+                        best_bounds = (0, ipc_client, network_client, network_server, ipc_server, length)
+
+    if best_bounds is None:
+        return min_cost, [], []
+    segments, targets = bounds_placement(model, table, order, best_bounds)
+    return min_cost, segments, targets
+
+
+def bounds_placement(
+    model: ChainModel, table, order: Sequence[int], bounds: Sequence[int]
+) -> Tuple[List[int], List[int]]:
+    """The segment and target of each element when segment s holds order[bounds[s]:bounds[s + 1]].
+
+    table is model.segment_table(order), which gives the cheapest targets of each range.
+    """
+    segments, targets = [0] * model.length, [0] * model.length
+    for seg in range(len(SEGMENTS)):
+        start, end = bounds[seg], bounds[seg + 1]
+        for k, t in zip(range(start, end), table[seg][start][end][1]):
+            segments[order[k]], targets[order[k]] = seg, t
+    return segments, targets
+
+
+def cost_chain_optimize(
+    chain: List[AbsElement], path: str, opt_level: str, jobs: int = 1
+) -> Dict[str, List[AbsElement]]:
+    return consolidate_subchains(cost_chain_placement(chain, path, opt_level, jobs))
+
+
+def cost_chain_placement(
+    chain: List[AbsElement], path: str, opt_level: str, jobs: int = 1
+) -> List[AbsElement]:
+    """Place a chain with the exhaustive search, before adjacent elements on the same target are
+    fused: its cost() is the cost the search minimized."""
+    signature = chain_signature(chain, path, opt_level, "cost")
     init_dependency(chain, path)
-    if dump_property:
-        properties = []
-        for element in chain:
-            properties.append({
-                "name": element.lib_name,
-                "partner": element.partner,
-                "position": element.position,
-                "processor": element.processor,
-                "upgrade": element.upgrade,
-                "read": element.get_prop("request", "read"),
-                "write": element.get_prop("request", "write"),
-                "record": element.get_prop("request", "record"),
-                "drop_or_block": element.has_prop("request", "drop", "block"),
-                "state_consistency": element.prop["state"]["consistency"],
-                "state_dependency": element.prop["state"]["state_dependence"],
-            })
-        # translate partner name into index
-        for d in properties:
-            if d["partner"] != "":
-                for i, element in enumerate(chain):
-                    if element.lib_name == d["partner"]:
-                        d["partner"] = i
-                        break
-            else:
-                d["partner"] = -1
-            assert isinstance(d["partner"], int)
-        gen_dir = os.path.join(graph_base_dir, "generated")
-        os.makedirs(gen_dir, exist_ok=True)
-        with open(os.path.join(gen_dir, "properties.yaml"), "w") as f:
-            yaml.safe_dump(properties, f, default_flow_style=False, indent=4)
-
-    min_cost = cost(chain)
+
     final_chain = deepcopy(chain)
-    if opt_level != "no" and not dump_property:
-        for new_chain in permutations(chain):
-            if equivalent(chain, new_chain, path, opt_level):
-                new_chain = deepcopy(new_chain)
-                new_min_cost = find_min_cost(new_chain)
-                if new_min_cost < min_cost:
-                    min_cost = new_min_cost
-                    final_chain = new_chain
+    if opt_level != "no":
+        cached = cached_placement(signature, chain)
+        if cached is not None:
+            final_chain = cached
+        else:
+            model = ChainModel(chain)
+            result = search_placement(model, CommutationMatrix(chain, path, opt_level), jobs)
+            if result is not None and result[0] < cost(chain):
+                _, order, segments, targets = result
+                final_chain = model.apply(final_chain, order, segments, targets)
+            cache_placement(signature, chain, final_chain)
+
+    return final_chain
+
+
+# Chains shorter than this are searched in the calling process, whatever the number of jobs.
+MIN_PARALLEL_LENGTH = 8
+# The number of prefixes (tasks) per job, for load balancing.
+PREFIXES_PER_JOB = 8
+
+
+class PlacementBound:
+    """A lower bound on the cost of the placements of a chain whose order starts with a prefix.
+
+    Each element is counted at its cheapest target, and the chain pays the network and at least
+    the cheapest segment (with wasm invocation) of the element whose cheapest one is the most
+    expensive. All other overheads are non-negative. The elements after the prefix are counted
+    in the order that minimizes their total cost regardless of dependencies: by increasing cost
+    over the fraction of requests they drop. Responses are counted as if every response drop
+    happened before each element. Prefixes that cannot be placed (an element must run in an
+    earlier segment than one before it) are bounded by inf.
+    """
+
+    def __init__(self, model: ChainModel):
+        self.model = model
+        n = model.length
+        self.min_cost, self.min_enter = [], []
+        # the first and last segment each element can be placed in
+        self.first, self.last = [], []
+        for x in range(n):
+            options = [(s, t) for s in range(len(SEGMENTS)) for t in model.options[x][s]]
+            self.first.append(min((s for s, _ in options), default=len(SEGMENTS)))
+            self.last.append(max((s for s, _ in options), default=-1))
+            self.min_cost.append(
+                min((model.element_cost[x][t] for _, t in options), default=float("inf"))
+            )
+            enter = []
+            for s, t in options:
+                enter.append(model.enter_cost[s])
+                if model.is_wasm[t] and SEGMENT_PROCESSOR[s] != "grpc":
+                    enter[-1] += COST_PROFILE.wasm_invocation_overhead
+            self.min_enter.append(min(enter, default=float("inf")))
+        self.order = sorted(
+            range(n),
+            key=lambda x: (
+                self.min_cost[x] / (1.0 - model.factor[x]) if model.factor[x] < 1.0 else float("inf")
+            ),
+        )
+        self.base = COST_PROFILE.transmission_overhead["network"] + max(self.min_enter, default=0.0)
+
+    def __call__(self, prefix: Sequence[int]) -> float:
+        model = self.model
+        c, workload, segment = 0.0, 1.0, 0
+        placed = set(prefix)
+        for x in prefix:
+            segment = max(segment, self.first[x])
+            if self.last[x] < segment:
+                return float("inf")
+            c += self.min_cost[x] * workload
+            workload *= model.factor[x]
+        for x in self.order:
+            if x not in placed:
+                if self.last[x] < segment:
+                    return float("inf")
+                c += self.min_cost[x] * workload
+                workload *= model.factor[x]
+        return self.base + c * model.responses_kept
+
+
+def search_placement(
+    model: ChainModel,
+    commutation: CommutationMatrix,
+    jobs: int = 1,
+    deadline: Optional[float] = None,
+    upper_bound: float = float("inf"),
+) -> Optional[Tuple[float, Tuple[int, ...], List[int], List[int]]]:
+    """Find the cheapest order and placement by trying every equivalent order.
+
+    Orders whose lower bound (see PlacementBound) exceeds the best cost found so far are
+    skipped. With jobs > 1, the orders are split by prefix across a process pool whose workers
+    share the best cost. The first of the cheapest orders (in lexicographic order) is returned
+    in any case, so the result does not depend on the number of jobs.
+
+    Args:
+        deadline: If given (a time.monotonic() value), stop searching at the deadline and
+            return the best placement found so far.
+        upper_bound: Only look for placements that cost at most upper_bound, e.g., the cost of
+            a known placement.
+
+    Returns:
+        (cost, order, segments, targets), or None if the chain cannot be placed (within the
+        upper bound and the deadline).
+    """
+    if jobs <= 1 or model.length < MIN_PARALLEL_LENGTH:
+        return search_prefix(
+            model, commutation, (), PlacementBound(model), deadline=deadline, upper_bound=upper_bound
+        )
+    prefixes = commutation.prefixes(jobs * PREFIXES_PER_JOB)
+    shared_cost = multiprocessing.Value("d", upper_bound)
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=init_search_worker,
+        initargs=(model, commutation, COST_PROFILE, shared_cost, deadline),
+    ) as executor:
+        results = list(executor.map(search_worker, prefixes))
+    best = None
+    # Results come in the order of the prefixes, keep the first on ties
+    for result in results:
+        if result is not None and (best is None or result[0] < best[0]):
+            best = result
+    return best
+
+
+def search_prefix(
+    model: ChainModel,
+    commutation: CommutationMatrix,
+    prefix: Tuple[int, ...],
+    bound: PlacementBound,
+    shared_cost=None,
+    deadline: Optional[float] = None,
+    upper_bound: float = float("inf"),
+) -> Optional[Tuple[float, Tuple[int, ...], List[int], List[int]]]:
+    """Find the first cheapest order starting with prefix (see search_placement)."""
+    min_cost, best = float("inf"), None
+
+    def prune(order: List[int]) -> bool:
+        # Skipping everything unwinds the enumeration once the deadline has passed.
+        if deadline is not None and time.monotonic() > deadline:
+            return True
+        limit = min(min_cost, upper_bound)
+        if shared_cost is not None:
+            limit = min(limit, shared_cost.value)
+        # Only skip orders that are strictly worse, ties must be found to keep the first one.
+        lower = bound(order)
+        return lower == float("inf") or lower > limit + 1e-9 * (1.0 + abs(limit))
+
+    # Only the reorderings that are equivalent to the original chain
+    for order in commutation.linear_extensions(prefix, prune):
+        new_min_cost, segments, targets = find_min_cost(model, order)
+        if new_min_cost < min_cost:
+            min_cost = new_min_cost
+            best = (min_cost, order, segments, targets)
+            if shared_cost is not None:
+                with shared_cost.get_lock():
+                    if min_cost < shared_cost.value:
+                        shared_cost.value = min_cost
+    return best
+
+
+# State of a search_placement() worker process
+search_state = {}
+
+
+def init_search_worker(model, commutation, profile, shared_cost, deadline=None):
+    COST_PROFILE.__dict__.update(profile.__dict__)
+    search_state.update(
+        model=model,
+        commutation=commutation,
+        bound=PlacementBound(model),
+        shared_cost=shared_cost,
+        deadline=deadline,
+    )
+
+
+def search_worker(prefix: Tuple[int, ...]):
+    return search_prefix(
+        search_state["model"],
+        search_state["commutation"],
+        prefix,
+        search_state["bound"],
+        search_state["shared_cost"],
+        search_state["deadline"],
+    )
+
+
+def consolidate_subchains(chain: List[AbsElement]) -> Dict[str, List[AbsElement]]:
+    """Split an optimized chain by processor and fuse adjacent elements with the same target."""
+    if COST_PROFILE.path is not None:
+        for line in explain_placement(chain):
+            GRAPH_LOG.info(line)
 
     # split and consolidate
-    subchains = split_chain(final_chain)
+    subchains = split_chain(chain)
 
     # modify ambient element sync level
     # modify sync level of element w/ correct state dependency - position
@@ -579,7 +771,7 @@ def modify_sync_level(subchains: Dict[str, List[AbsElement]]) -> Dict[str, List[
             if element.prop["state"]["consistency"] in [
                 "strong",
                 "weak",
-            ] and not in_nonlocal_position(element, pos):
+            ] and sync_factor(element, pos) == 0.0:
                 element.name = list(map(replace_strong_weak, element.name))
                 element.path = list(map(replace_strong_weak, element.path)) 
     return subchains
@@ -606,7 +798,7 @@ def state_dependency_optimization(subchains: Dict[str, List[AbsElement]], target
         if element.prop["state"]["consistency"] in ["strong", "weak"] and element.position == "any" and element.prop["state"]["state_dependence"] == ["client_service"]:
             incorrect_state_dependency = i
     if incorrect_state_dependency >= 0:
-        c1, c2 = subchains[f"server_{target}"][:incorrect_state_dependency + 1], subchains[f"server_{target}"][incorrect_state_dependency + 1]
+        c1, c2 = subchains[f"server_{target}"][:incorrect_state_dependency + 1], subchains[f"server_{target}"][incorrect_state_dependency + 1:]
         subchains[f"client_{target}"], subchains[f"server_{target}"] = (subchains[f"client_{target}"] + c1), c2 
     
     return subchains
@@ -643,4 +835,24 @@ def basic_heuristics(subchains: Dict[str, List[AbsElement]]) -> Dict[str, List[A
     
     subchains = modify_sync_level(subchains)
 
-    return subchains
\ No newline at end of file
+    return subchains
+
+
+def heuristic_placement(
+    chain: List[AbsElement], model: ChainModel
+) -> Optional[Tuple[List[int], List[int], List[int]]]:
+    """The placement chosen by basic_heuristics(), or None if it is not valid in the model."""
+    subchains = basic_heuristics(split_chain(deepcopy(chain)))
+    index = {element.id: i for i, element in enumerate(chain)}
+    order, segments, targets = [], [0] * len(chain), [0] * len(chain)
+    for s, pos in enumerate(SEGMENTS):
+        for element in subchains[pos]:
+            i = index[element.id]
+            if element.target not in model.targets:
+                return None
+            t = model.targets.index(element.target)
+            if t not in model.options[i][s]:
+                return None
+            order.append(i)
+            segments[i], targets[i] = s, t
+    return order, segments, targets
@@ -0,0 +1,174 @@
+"""
+Exact chain placement by dynamic programming (`--opt_algorithm dp`).
+
+The cost model of optimization.cost() only depends on the order of the elements through
+(1) the workload seen by each element, i.e., the set of drop/block elements before it (which
+also determines the responses dropped after it), and
+(2) the target of its predecessor (processor, sync and wasm invocation overhead).
+Instead of enumerating every permutation and every split of the chain, the DP walks over the
+downsets of the dependency partial order (the sets of elements that can form a prefix of an
+equivalent chain) and, for each downset, keeps the cheapest placement of that prefix for every
+(segment, target, sync level) of its last element.
+
+The number of downsets is polynomial in the chain length for a bounded number of mutually
+independent elements. When a chain has too many of them (e.g., with --opt_level ignore),
+the DP only places the original order, and local search (see local_search.py) reorders the
+chain from there.
+"""
+import time
+from copy import deepcopy
+from typing import Dict, List, Optional, Tuple
+
+from compiler.graph.ir.commutation import CommutationMatrix
+from compiler.graph.ir.cost_model import (
+    COST_PROFILE,
+    SEGMENT_PROCESSOR,
+    SEGMENTS,
+    ChainModel,
+)
+from compiler.graph.ir.element import AbsElement
+from compiler.graph.ir.local_search import local_optimum
+from compiler.graph.ir.memo import cache_placement, cached_placement, chain_signature
+from compiler.graph.ir.optimization import cost, init_dependency
+from compiler.graph.logger import GRAPH_LOG
+
+# Above this number of downsets (about 1.5s of DP), the order is found by local search.
+MAX_DOWNSETS = 1 << 13
+# Time budget (seconds) of that local search, which stops at a local optimum otherwise.
+LOCAL_SEARCH_TIMEOUT = 10.0
+
+
+def dp_placement(
+    model: ChainModel, preds: List[int]
+) -> Optional[Tuple[float, List[int], List[int], List[int]]]:
+    """Find the cheapest order (a linear extension of preds) and placement of a chain.
+
+    Returns:
+        (cost, order, segments, targets) as accepted by ChainModel.evaluate(), or None if
+        the chain cannot be placed at all.
+    """
+    n = model.length
+    full = (1 << n) - 1
+    start = (-1, -1, 0)
+    # A state is (segment, target, sync level of the current run) of the last element.
+    layer: Dict[int, Dict[Tuple[int, int, int], float]] = {0: {start: 0.0}}
+    # mask -> (fraction of requests that pass the elements of mask, and of responses)
+    workload = {0: (1.0, 1.0)}
+    # (mask, state) -> (previous mask, previous state, element)
+    parent: Dict[
+        Tuple[int, Tuple[int, int, int]], Tuple[int, Tuple[int, int, int], int]
+    ] = {}
+    for _ in range(n):
+        next_layer: Dict[int, Dict[Tuple[int, int, int], float]] = {}
+        for mask, states in layer.items():
+            w, kept = workload[mask]
+            available = [
+                x for x in range(n) if not mask >> x & 1 and preds[x] & mask == preds[x]
+            ]
+            loads = {x: model.workload(x, w, kept) for x in available}
+            for (seg, tgt, sync), c in states.items():
+                closed = c + model.sync_cost[seg][sync] if seg >= 0 else c
+                for x in available:
+                    new_mask = mask | 1 << x
+                    if new_mask not in workload:
+                        workload[new_mask] = (
+                            w * model.factor[x],
+                            kept * model.response_factor[x],
+                        )
+                    new_states = next_layer.setdefault(new_mask, {})
+                    # Like find_min_cost(), prefer the server side on ties.
+                    for s in reversed(range(max(seg, 0), len(SEGMENTS))):
+                        for t in model.options[x][s]:
+                            new_cost = model.element_cost[x][t] * loads[x]
+                            if s == seg and t == tgt:
+                                new_cost += c
+                                new_state = (s, t, max(sync, model.sync[x][s]))
+                            else:
+                                new_cost += closed
+                                if s != seg:
+                                    new_cost += model.enter_cost[s]
+                                if model.is_wasm[t] and SEGMENT_PROCESSOR[s] != "grpc":
+                                    new_cost += COST_PROFILE.wasm_invocation_overhead
+                                new_state = (s, t, model.sync[x][s])
+                            if new_cost < new_states.get(new_state, float("inf")):
+                                new_states[new_state] = new_cost
+                                parent[(new_mask, new_state)] = (
+                                    mask,
+                                    (seg, tgt, sync),
+                                    x,
+                                )
+        # A run with a higher sync level is never better than one with a lower level and cost.
+        for states in next_layer.values():
+            for seg, tgt, sync in list(states.keys()):
+                if any(
+                    states.get((seg, tgt, lower), float("inf"))
+                    <= states[(seg, tgt, sync)]
+                    for lower in range(sync)
+                ):
+                    del states[(seg, tgt, sync)]
+        layer = next_layer
+
+    if full not in layer or len(layer[full]) == 0:
+        return None
+    best_state, best_cost = None, float("inf")
+    for state, c in layer[full].items():
+        c += (
+            model.sync_cost[state[0]][state[2]]
+            + COST_PROFILE.transmission_overhead["network"]
+        )
+        if c < best_cost:
+            best_state, best_cost = state, c
+
+    order, segments, targets = [], [0] * n, [0] * n
+    mask, state = full, best_state
+    while mask != 0:
+        prev_mask, prev_state, x = parent[(mask, state)]
+        order.append(x)
+        segments[x], targets[x] = state[0], state[1]
+        mask, state = prev_mask, prev_state
+    order.reverse()
+    return best_cost, order, segments, targets
+
+
+def dp_chain_placement(
+    chain: List[AbsElement], path: str, opt_level: str
+) -> List[AbsElement]:
+    """Place a chain with the DP, same interface and output as cost_chain_placement()."""
+    signature = chain_signature(chain, path, opt_level, "dp")
+    init_dependency(chain, path)
+
+    final_chain = deepcopy(chain)
+    if opt_level != "no" and len(chain) > 0:
+        cached = cached_placement(signature, chain)
+        if cached is not None:
+            final_chain = cached
+        else:
+            model = ChainModel(chain)
+            result = dp_search(model, CommutationMatrix(chain, path, opt_level))
+            if result is not None and result[0] < cost(chain):
+                _, order, segments, targets = result
+                final_chain = model.apply(final_chain, order, segments, targets)
+            cache_placement(signature, chain, final_chain)
+
+    return final_chain
+
+
+def dp_search(
+    model: ChainModel, commutation: CommutationMatrix
+) -> Optional[Tuple[float, List[int], List[int], List[int]]]:
+    """Run the DP over the equivalent orders of a chain (see dp_placement)."""
+    if commutation.count_downsets(MAX_DOWNSETS) <= MAX_DOWNSETS:
+        return dp_placement(model, commutation.preds)
+    GRAPH_LOG.warning(
+        f"Too many equivalent orders for a chain of {model.length} elements, "
+        "reordering it by local search."
+    )
+    original = list(range(model.length))
+    results = [
+        dp_placement(model, [(1 << j) - 1 for j in range(model.length)]),
+        local_optimum(
+            model, commutation, original, time.monotonic() + LOCAL_SEARCH_TIMEOUT
+        ),
+    ]
+    results = [result for result in results if result is not None]
+    return min(results, key=lambda result: result[0], default=None)
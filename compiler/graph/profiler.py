@@ -0,0 +1,151 @@
+"""
+Timing spans for the compiler pipeline (enabled by `compiler/main.py --profile`).
+
+Stages (parse, analyze, optimize, codegen, scriptgen, ...) are profiled with cProfile
+and dumped to `<output_dir>/<stage>.prof`; finer-grained spans (an element's analysis
+or code generation, an edge's optimization, a cargo/bazel build) are only timed. Every span
+is logged through the given logger, and `summary()` renders the slowest ones.
+"""
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from rich.console import Console
+from rich.table import Table
+
+from compiler.graph.logger import GRAPH_LOG
+
+
+class Profiler:
+    def __init__(self):
+        self.reset(False)
+
+    def reset(self, enabled: bool, output_dir: Optional[str] = None):
+        """Drop all collected spans and enable (or disable) profiling."""
+        self.enabled = enabled
+        self.output_dir = output_dir
+        # Finished spans as dicts of kind, name and seconds, in completion order.
+        self.spans: List[Dict] = []
+        self.stage_profiles: Dict[str, cProfile.Profile] = {}
+
+    def record(
+        self,
+        kind: str,
+        name: str,
+        seconds: float,
+        logger: logging.Logger,
+        stacklevel: int,
+    ):
+        self.spans.append({"kind": kind, "name": name, "seconds": seconds})
+        # stacklevel points the log record at the code enclosed by the span
+        logger.info(
+            f"[profile] {kind} {name} took {seconds:.3f}s", stacklevel=stacklevel + 1
+        )
+
+    @contextlib.contextmanager
+    def span(self, kind: str, name: str, logger: logging.Logger = GRAPH_LOG):
+        """Time the enclosed block as a span, e.g., span("analysis", "ping/fault")."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(kind, name, time.perf_counter() - start, logger, stacklevel=3)
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Time a pipeline stage and collect its cProfile statistics.
+
+        Stages must not nest, as only one cProfile profiler can be active at a time.
+        """
+        if not self.enabled:
+            yield
+            return
+        profile = self.stage_profiles.setdefault(name, cProfile.Profile())
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.record(
+                "stage", name, time.perf_counter() - start, GRAPH_LOG, stacklevel=3
+            )
+
+    def take_spans(self) -> List[Dict]:
+        """Return and clear the finished spans (used to ship spans out of worker processes)."""
+        spans, self.spans = self.spans, []
+        return spans
+
+    def merge(self, spans: List[Dict]):
+        self.spans.extend(spans)
+
+    def total(self, kind: str) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            if span["kind"] == kind:
+                totals[span["name"]] = totals.get(span["name"], 0.0) + span["seconds"]
+        return totals
+
+    def dump(self):
+        """Write the cProfile output of every stage and all spans into output_dir."""
+        if not self.enabled:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        for name, profile in self.stage_profiles.items():
+            profile.dump_stats(os.path.join(self.output_dir, f"{name}.prof"))
+        with open(os.path.join(self.output_dir, "spans.json"), "w") as f:
+            json.dump(self.spans, f, indent=2)
+        GRAPH_LOG.info(
+            f"Profiling results written to {self.output_dir} (inspect *.prof with `python -m pstats` or snakeviz)"
+        )
+
+    def summary(self, top_n: int = 10):
+        """Print the stage breakdown and the top-N slowest elements, edges and builds."""
+        if not self.enabled:
+            return
+        console = Console()
+
+        table = Table(title="Stages")
+        table.add_column("Stage")
+        table.add_column("Time (s)", justify="right")
+        for name, seconds in self.total("stage").items():
+            table.add_row(name, f"{seconds:.3f}")
+        console.print(table)
+
+        analysis, codegen = self.total("analysis"), self.total("codegen")
+        elements = {
+            name: (analysis.get(name, 0.0), codegen.get(name, 0.0))
+            for name in list(analysis) + list(codegen)
+        }
+        if len(elements) > 0:
+            table = Table(title=f"Top {top_n} slowest elements")
+            table.add_column("Element")
+            table.add_column("Analysis (s)", justify="right")
+            table.add_column("Codegen (s)", justify="right")
+            table.add_column("Total (s)", justify="right")
+            rows = sorted(elements.items(), key=lambda row: sum(row[1]), reverse=True)
+            for name, (a, c) in rows[:top_n]:
+                table.add_row(name, f"{a:.3f}", f"{c:.3f}", f"{a + c:.3f}")
+            console.print(table)
+
+        for kind, title in [("edge", "edges"), ("build", "builds")]:
+            totals = self.total(kind)
+            if len(totals) == 0:
+                continue
+            table = Table(title=f"Top {top_n} slowest {title}")
+            table.add_column(kind.capitalize())
+            table.add_column("Time (s)", justify="right")
+            rows = sorted(totals.items(), key=lambda row: row[1], reverse=True)
+            for name, seconds in rows[:top_n]:
+                table.add_row(name, f"{seconds:.3f}")
+            console.print(table)
+
+
+PROFILER = Profiler()
@@ -1,9 +1,15 @@
 import argparse
+import contextlib
+import hashlib
+import json
+import logging
 import os
 import shutil
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import yaml
 from rich.columns import Columns
@@ -15,18 +21,25 @@ sys.path.append(str(Path(__file__).parent.absolute()))
 
 from compiler import *
 from compiler.element import gen_code
+from compiler.element.backend.istio_native.finalizer import prepare_template
+from compiler.element.cache import backend_version, source_digest
+from compiler.element.node import Program
+from compiler.element.property_db import PROPERTY_DB
 from compiler.graph.backend import scriptgen
 from compiler.graph.frontend import GraphParser
 from compiler.graph.ir import GraphIR
+from compiler.graph.ir.cost_model import COST_PROFILE, REPLICAS
 from compiler.graph.ir.element import AbsElement
-from compiler.graph.logger import GRAPH_LOG, init_logging
-from compiler.proto import Proto
+from compiler.graph.ir.joint import joint_optimize
+from compiler.graph.logger import ELEMETN_LOG, GRAPH_LOG, init_logging, loggers
+from compiler.graph.profiler import PROFILER
+from compiler.proto import Proto, load_proto
 
 console = Console()
 gir_summary = dict()
 
 
-def parse_args():
+def parse_args(argv: Optional[List[str]] = None):
     # Parse command line arguments
     parser = argparse.ArgumentParser()
 
@@ -52,8 +65,8 @@ def parse_args():
     parser.add_argument(
         "--replica",
         type=str,
-        help="the number of replicas for each service, default is 1.",
-        default="1",
+        help="the number of replicas for each service (e.g., 3), optionally followed by the number for single services (e.g., 3,frontend=1), default is 1. Given replica counts are also used by the optimizer: the state of services with one replica is kept locally, and state sync costs more with more replicas.",
+        default=None,
     )
     parser.add_argument(
         "-t",
@@ -82,7 +95,7 @@ def parse_args():
     )
     parser.add_argument(
         "--pseudo_property",
-        help="[Dev] If added, use hand-coded properties instead of auto-generated ones.",
+        help="[Dev] If added, take all element properties from the property database (--property_db) instead of analyzing the elements.",
         action="store_true",
     )
     parser.add_argument(
@@ -100,21 +113,93 @@ def parse_args():
         help="[Dev] If added, the compilation terminates after element implementations are generated (i.e., no deployment scriptgen).",
         action="store_true",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="The number of elements analyzed and generated in parallel, default is 1 (elements are analyzed one by one with aRPC).",
+        default=1,
+    )
+    parser.add_argument(
+        "--build_jobs",
+        type=int,
+        help="The maximum number of parallel cargo jobs when compiling wasm elements, default is the number of CPUs.",
+        default=None,
+    )
+    parser.add_argument(
+        "--incremental",
+        help="[Dev] If added, keep the generated directory and only regenerate elements whose inputs changed since the last run.",
+        action="store_true",
+    )
     parser.add_argument(
         "--dump_property",
-        help="[Dev] If added, dump the properties of each element in yaml format.",
+        help="[Dev] If added, dump the properties of each element into the property database (--property_db, default is .appnet_cache/properties.yaml).",
         action="store_true",
-    ) 
+    )
+    parser.add_argument(
+        "--property_db",
+        type=str,
+        help="Path to the element property database (yaml). Elements whose sources are unchanged take their properties from it, new and changed elements are analyzed and added to it.",
+        default=None,
+    )
     parser.add_argument(
         "--opt_algorithm",
         type=str,
-        help="[Dev] Optimization algorithm, default is cost. If heuristics is chosen, only intra-element optimizations (i.e., placement and processor changes) will be applied.",
-        choices=["cost", "heuristics"],
+        help="[Dev] Optimization algorithm, default is cost. dp finds the same optimum as cost in polynomial time for long chains. mip solves a mixed-integer program with HiGHS (requires highspy). If heuristics is chosen, only intra-element optimizations (i.e., placement and processor changes) will be applied.",
+        choices=["cost", "dp", "mip", "heuristics"],
         default="cost",
     )
+    parser.add_argument(
+        "--sensitivity_timeout",
+        type=int,
+        help="[Dev] Solver timeout (in milliseconds) of each query of the element sensitivity analysis (idempotence, ordering, dropped RPCs), default is 1000. 0 skips the analysis and assumes the worst.",
+        default=None,
+    )
+    parser.add_argument(
+        "--mip_time_limit",
+        type=float,
+        help="[Dev] Time limit (in seconds) of the MIP solver for each edge, default is 10.",
+        default=10.0,
+    )
+    parser.add_argument(
+        "--opt_jobs",
+        type=int,
+        help="[Dev] The number of processes searching the equivalent orders of a chain with --opt_algorithm cost, default is 1. The result does not depend on it.",
+        default=1,
+    )
+    parser.add_argument(
+        "--opt_timeout",
+        type=float,
+        help="[Dev] Time budget (in seconds) for optimizing each edge, default is none. When it expires, the best placement found so far is used (cost and mip only).",
+        default=None,
+    )
+    parser.add_argument(
+        "--opt_scope",
+        type=str,
+        help="[Dev] Optimization scope, default is edge. edge: optimize each edge on its own; app: optimize all edges together, charging the sidecar overhead once per service and switching off sidecars no edge needs (cost and dp only).",
+        choices=["edge", "app"],
+        default="edge",
+    )
+    parser.add_argument(
+        "--cost_profile",
+        type=str,
+        help="[Dev] Path to a cost profile (yaml) with measured element, processor and drop rate numbers that replace the defaults of the cost model, e.g., written by compiler/calibrate_cost_profile.py. The numbers behind each placement are logged.",
+        default=None,
+    )
+    parser.add_argument(
+        "--profile",
+        help="[Dev] If added, time each stage/element/edge and dump cProfile output of each stage to generated/profile.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile_top",
+        type=int,
+        help="[Dev] The number of slowest elements and edges shown in the profiling summary, default is 10.",
+        default=10,
+    )
     parser.add_argument("--debug", help="[Dev] Print debug info.", action="store_true")
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 def compile_impl(
     element: AbsElement,
@@ -182,13 +267,241 @@ def compile_impl(
 #     )
 
 
-def generate_element_impl(graphirs: Dict[str, GraphIR], pseudo_impl: bool):
+FINGERPRINT_FILE = ".appnet_fingerprint"
+
+
+def element_fingerprint(element: AbsElement, tag: str) -> str:
+    """Fingerprint all inputs that determine the generated code of an element."""
+    with open(element.proto_path, "rb") as f:
+        proto_digest = hashlib.sha256(f.read()).hexdigest()
+    inputs = {
+        "ir": source_digest(element.path),
+        "backend": backend_version(element.target),
+        "proto": proto_digest,
+        "proto_mod": [element.proto_mod_name, element.proto_mod_location],
+        "method": element.method,
+        "target": element.target,
+        "final_position": element.final_position,
+        "name": element.name,
+        "server": element.server,
+        "tag": tag,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def read_fingerprint(compile_dir: str) -> str:
+    path = os.path.join(compile_dir, FINGERPRINT_FILE)
+    if not os.path.exists(path):
+        return ""
+    with open(path, "r") as f:
+        return f.read().strip()
+
+
+def clean_generated_dir(gen_dir: str, incremental: bool):
+    """Prepare the generated directory.
+
+    Without incremental mode everything is wiped. In incremental mode only element
+    directories with a fingerprint (i.e., completely generated ones) are kept;
+    deployment scripts and other outputs are always regenerated.
+    """
+    if not incremental:
+        if os.path.exists(gen_dir):
+            shutil.rmtree(gen_dir)
+    elif os.path.exists(gen_dir):
+        for entry in os.listdir(gen_dir):
+            path = os.path.join(gen_dir, entry)
+            if os.path.isdir(path) and read_fingerprint(path) != "":
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    os.makedirs(gen_dir, exist_ok=True)
+
+
+class LogCollector(logging.Handler):
+    """Buffer log records so that a worker's logs can be replayed in a deterministic order."""
+
+    def __init__(self):
+        super().__init__()
+        self.records: List[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord):
+        # Render the message now, arguments and tracebacks may not be picklable
+        record.msg, record.args, record.exc_info = record.getMessage(), None, None
+        self.records.append(record)
+
+
+@contextlib.contextmanager
+def captured_logs(enabled: bool) -> Iterator[LogCollector]:
+    """Buffer the records of all compiler loggers in a LogCollector while enabled."""
+    collector = LogCollector()
+    saved_handlers = {}
+    if enabled:
+        for logger in loggers:
+            saved_handlers[logger.name] = logger.handlers
+            logger.handlers = [collector]
+    try:
+        yield collector
+    finally:
+        for logger in loggers:
+            if logger.name in saved_handlers:
+                logger.handlers = saved_handlers[logger.name]
+
+
+def analyze_element_impl(
+    element: AbsElement, label: str, capture_logs: bool
+) -> Tuple[Program, Dict, Optional[Dict], List[logging.LogRecord], List[Dict]]:
+    """Analyze an element (parsing, type inference and properties), possibly in a worker.
+
+    Returns:
+        The IR and properties of the element, the properties for the property database
+        (None if they were not analyzed), and the log records and profiling spans like
+        compile_dir_impl().
+    """
+    with captured_logs(capture_logs) as collector:
+        with PROFILER.span("analysis", label, ELEMETN_LOG):
+            element.analyze()
+    return (
+        element.ir,
+        element.prop,
+        element.analyzed_prop,
+        collector.records,
+        PROFILER.take_spans() if capture_logs else [],
+    )
+
+
+def analyze_elements(graphirs: Dict[str, GraphIR], jobs: int = 1):
+    """Analyze the elements of all graph IRs, each distinct element once, in up to jobs processes.
+
+    The same element (e.g., the ingress elements of a service) usually appears on many edges,
+    its results are copied to every instance.
+    """
+    type_inference = os.getenv("ENABLE_TYPE_INFERENCE") is not None
+    # distinct element -> its instances with their profiling labels
+    groups: Dict[Tuple, List[Tuple[AbsElement, str]]] = {}
+    for gir in graphirs.values():
+        for element in gir.complete_chain():
+            key = (tuple(element.path), tuple(element.name))
+            if type_inference:
+                # the types of the IR depend on the message of the method
+                key += (element.proto_path, element.method)
+            label = f"{gir.server}/{'+'.join(element.name)}"
+            groups.setdefault(key, []).append((element, label))
+
+    tasks = [group[0] for group in groups.values()]
+    results = []
+    # Type inference adds the fields an element sets to its proto, which later elements (in
+    # spec order) see and check against. A worker would only add them to its own copy.
+    if jobs <= 1 or len(tasks) <= 1 or type_inference:
+        for element, label in tasks:
+            results.append(analyze_element_impl(element, label, False)[:3])
+    else:
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=init_analysis_worker, initargs=(PROPERTY_DB,)
+        ) as executor:
+            futures = [executor.submit(analyze_element_impl, e, label, True) for e, label in tasks]
+            # Replay the logs of each element in submission order
+            for future in futures:
+                ir, prop, analyzed_prop, records, spans = future.result()
+                for record in records:
+                    logging.getLogger(record.name).handle(record)
+                PROFILER.merge(spans)
+                results.append((ir, prop, analyzed_prop))
+
+    for group, (ir, prop, analyzed_prop) in zip(groups.values(), results):
+        for element, _ in group:
+            element.set_analysis(ir, prop)
+        # new and changed elements go into the property database
+        if analyzed_prop is not None:
+            PROPERTY_DB.add(group[0][0].name, group[0][0].path, analyzed_prop)
+
+
+def init_analysis_worker(db):
+    PROPERTY_DB.__dict__.update(db.__dict__)
+
+
+class StagingPathFilter(logging.Filter):
+    """Report paths in a staging directory at their final location."""
+
+    def __init__(self, staging_dir: str, final_dir: str):
+        super().__init__()
+        self.staging_dir, self.final_dir = staging_dir, final_dir
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if self.staging_dir in message:
+            record.msg, record.args = message.replace(self.staging_dir, self.final_dir), None
+        return True
+
+
+@contextlib.contextmanager
+def staged_logs(staging_dir: str, final_dir: str):
+    log_filter = StagingPathFilter(staging_dir, final_dir)
+    for logger in loggers:
+        logger.addFilter(log_filter)
+    try:
+        yield
+    finally:
+        for logger in loggers:
+            logger.removeFilter(log_filter)
+
+
+def compile_dir_impl(
+    tasks: List[Tuple[AbsElement, str, str]], capture_logs: bool
+) -> Tuple[List[logging.LogRecord], List[Dict]]:
+    """Generate the code of all elements sharing a compile_dir, then move it into place atomically.
+
+    Code is generated into a staging directory, so a concurrent reader (or an interrupted
+    run) never observes a half-written compile_dir. The staging directory starts as a copy
+    of the existing compile_dir, so backends that update their output in place (e.g., the
+    native filters only rewrite appnet_filter/) see it as before, and logs show compile_dir.
+
+    Returns:
+        The log records emitted during generation if capture_logs is set, and the
+        profiling spans recorded in a worker process.
+    """
+    with captured_logs(capture_logs) as collector:
+        compile_dir = tasks[0][0].compile_dir
+        staging_dir = f"{compile_dir}.staging-{os.getpid()}"
+        if os.path.exists(staging_dir):
+            shutil.rmtree(staging_dir)
+        try:
+            if os.path.exists(compile_dir):
+                shutil.copytree(compile_dir, staging_dir, symlinks=True)
+            with staged_logs(staging_dir, compile_dir):
+                for element, server, tag in tasks:
+                    element.compile_dir = staging_dir
+                    try:
+                        with PROFILER.span("codegen", f"{server}/{'+'.join(element.name)}", ELEMETN_LOG):
+                            compile_impl(element, server, tag)
+                    finally:
+                        element.compile_dir = compile_dir
+        except BaseException:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        if os.path.exists(compile_dir):
+            old_dir = f"{compile_dir}.old-{os.getpid()}"
+            os.rename(compile_dir, old_dir)
+            os.rename(staging_dir, compile_dir)
+            shutil.rmtree(old_dir)
+        else:
+            os.rename(staging_dir, compile_dir)
+        GRAPH_LOG.debug(f"Moved generated code from {staging_dir} to {compile_dir}")
+    return collector.records, PROFILER.take_spans() if capture_logs else []
+
+
+def generate_element_impl(
+    graphirs: Dict[str, GraphIR],
+    pseudo_impl: bool,
+    tag: str,
+    incremental: bool = False,
+    jobs: int = 1,
+):
     compiled_name = set()
     gen_dir = os.path.join(graph_base_dir, "generated")
-    for gir in graphirs.values():  # For each edge in the application
+    for gir in graphirs.values():
         for element in gir.complete_chain():
-            # For each element in the edge
-            identifier = element.lib_name + element.final_position
             gen_name = element.server + "".join(element.name)[:24]
             if element.target == "grpc":
                 element.compile_dir = os.path.join(
@@ -198,23 +511,62 @@ def generate_element_impl(graphirs: Dict[str, GraphIR], pseudo_impl: bool):
                 element.compile_dir = os.path.join(
                     gen_dir, f"{gen_name}_{element.target}"
                 )
+
+    # The last element written into a compile_dir determines its final content.
+    fingerprints: Dict[str, str] = {}
+    for gir in graphirs.values():
+        for element in gir.complete_chain():
+            fingerprints[element.compile_dir] = element_fingerprint(element, tag)
+    up_to_date = set()
+    if incremental:
+        up_to_date = {d for d, fp in fingerprints.items() if read_fingerprint(d) == fp}
+
+    # Elements sharing a compile_dir are generated in order by the same worker.
+    tasks: Dict[str, List[Tuple[AbsElement, str, str]]] = {}
+    for gir in graphirs.values():  # For each edge in the application
+        for element in gir.complete_chain():
+            # For each element in the edge
+            identifier = element.lib_name + element.final_position
+            if element.compile_dir in up_to_date:
+                GRAPH_LOG.info(f"{element.compile_dir} is up to date, skip code generation.")
+                continue
             if identifier not in compiled_name:
-                compile_impl(
-                    element,
-                    # element.name,
-                    # element.path,
-                    # element.compile_dir,
-                    # element.target,
-                    # element.final_position,
-                    # element.proto,
-                    # element.method,
-                    gir.server,
-                    args.tag,
-                    # proto_module_name=element.proto_mod_name,
-                    # proto_module_location=element.proto_mod_location,
-                )
+                fingerprint_path = os.path.join(element.compile_dir, FINGERPRINT_FILE)
+                if os.path.exists(fingerprint_path):
+                    os.remove(fingerprint_path)
+                tasks.setdefault(element.compile_dir, []).append((element, gir.server, tag))
             compiled_name.add(identifier)
 
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks.values():
+            compile_dir_impl(task, capture_logs=False)
+    else:
+        if any("native" in e.target for task in tasks.values() for e, _, _ in task):
+            # Fetch the shared native template once instead of racing in the workers
+            prepare_template()
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(compile_dir_impl, task, True) for task in tasks.values()]
+            # Replay the logs of each compile_dir in submission order
+            for future in futures:
+                records, spans = future.result()
+                for record in records:
+                    logging.getLogger(record.name).handle(record)
+                PROFILER.merge(spans)
+
+    # Fingerprints are written last so that interrupted generations are never considered up to date
+    for compile_dir, fingerprint in fingerprints.items():
+        if compile_dir not in up_to_date and os.path.isdir(compile_dir):
+            with open(os.path.join(compile_dir, FINGERPRINT_FILE), "w") as f:
+                f.write(fingerprint)
+
+    if incremental:
+        # Garbage-collect element directories that are no longer part of the application
+        for entry in os.listdir(gen_dir):
+            path = os.path.join(gen_dir, entry)
+            if path not in fingerprints and read_fingerprint(path) != "":
+                GRAPH_LOG.info(f"Removing stale element directory {path}")
+                shutil.rmtree(path)
+
 
 def print_gir_summary(graphirs: Dict[str, GraphIR]):
     GRAPH_LOG.info("Graph IR summary:")
@@ -251,14 +603,22 @@ def handle_state(graphirs: Dict[str, GraphIR]):
 
 def main(args):
     # Step 1: Parse the spec file and generate graph IRs (see examples/chain for details about spec format)
+    gen_dir = os.path.join(graph_base_dir, "generated")
+    PROFILER.reset(args.profile, os.path.join(gen_dir, "profile"))
+    COST_PROFILE.reset(args.cost_profile)
+    REPLICAS.reset(args.replica)
+    PROPERTY_DB.reset(args.property_db)
+    if args.cost_profile is not None:
+        GRAPH_LOG.info(
+            f"Using cost profile {args.cost_profile} ({len(COST_PROFILE.measured)} measured numbers)"
+        )
+
     GRAPH_LOG.info(f"Parsing graph spec file {args.spec_path}...")
     parser = GraphParser()
-    graphirs, app_name, app_manifest_file, app_edges = parser.parse(args.spec_path)
+    with PROFILER.stage("parse"):
+        graphirs, app_name, app_manifest_file, app_edges = parser.parse(args.spec_path)
 
-    gen_dir = os.path.join(graph_base_dir, "generated")
-    if os.path.exists(gen_dir):
-        shutil.rmtree(gen_dir)
-    os.makedirs(gen_dir, exist_ok=True)
+    clean_generated_dir(gen_dir, args.incremental)
 
     if args.verbose:
         for gir in graphirs.values():
@@ -266,8 +626,6 @@ def main(args):
                 gir_summary[gir.name] = {"pre-optimized": [], "post-optimized": []}
             gir_summary[gir.name]["pre-optimized"] = gir.to_rich()
 
-    proto_dict: Dict[str, Proto] = {}
-
     # collect proto, apply static analysis to elements (type inference, property analysis, etc.) 
     has_arpc = False
     for gir in graphirs.values():
@@ -277,25 +635,49 @@ def main(args):
     if has_arpc:
         os.environ["ENABLE_TYPE_INFERENCE"] = "1"
 
-    for gir in graphirs.values():
-        for element in gir.complete_chain():
-            element.set_property_source(args.pseudo_property)
-            if element.proto_path not in proto_dict:
-                proto_dict[element.proto_path] = Proto(element.proto_path)
-            element.proto = proto_dict[element.proto_path]
-            element.analyze()
+    # Type inference adds fields to the protos and aRPC annotates them, so each run works on
+    # its own copies of the (cached) parsed files.
+    proto_dict: Dict[str, Proto] = {}
+    with PROFILER.stage("analyze"):
+        for gir in graphirs.values():
+            for element in gir.complete_chain():
+                element.set_property_source(args.pseudo_property)
+                if element.proto_path not in proto_dict:
+                    proto_dict[element.proto_path] = deepcopy(load_proto(element.proto_path))
+                element.proto = proto_dict[element.proto_path]
+        analyze_elements(graphirs, args.jobs)
+    if args.dump_property:
+        # Outside of generated/, which is cleaned by the next run.
+        PROPERTY_DB.save(args.property_db or os.path.join(cache_base_dir, "properties.yaml"))
+    elif args.property_db is not None and PROPERTY_DB.dirty:
+        PROPERTY_DB.save()
 
     # Step 2: Extract element properties via element compiler and optimize the graph IR.
     GRAPH_LOG.info("Generating element properties and optimizing the graph IR...")
-    for gir in graphirs.values():
-        # Each gir represests an edge in the application (a pair of communicating services)
-        # pseudo_property is set to True when we want to use user-provided properties instead of auto-generated ones
-        # for element in gir.complete_chain():
-            # element.set_property_source(args.pseudo_property)
-        gir.optimize(args.opt_level, args.opt_algorithm, args.dump_property)
-    
-    if args.opt_level != "no":
-        handle_state(graphirs)
+    with PROFILER.stage("optimize"):
+        if args.opt_scope == "app" and args.opt_level != "no":
+            joint_optimize(
+                graphirs,
+                app_edges,
+                args.opt_level,
+                args.opt_algorithm,
+                args.opt_jobs,
+                args.opt_timeout,
+            )
+        else:
+            for gir in graphirs.values():
+                # Each gir represests an edge in the application (a pair of communicating services)
+                with PROFILER.span("edge", gir.name):
+                    gir.optimize(
+                        args.opt_level,
+                        args.opt_algorithm,
+                        args.mip_time_limit,
+                        args.opt_jobs,
+                        args.opt_timeout,
+                    )
+
+        if args.opt_level != "no":
+            handle_state(graphirs)
     
     # If some elements require aRPC backend, we need to annotate related proto files.
     for gir in graphirs.values():
@@ -331,15 +713,24 @@ def main(args):
     
     # Step 3: Generate backend code for the elements and deployment scripts.
     if not args.dry_run:
+        missing = sorted(
+            {str(e) for gir in graphirs.values() for e in gir.complete_chain() if e.ir is None}
+        )
+        if len(missing) > 0:
+            raise ValueError(f"Cannot generate code without the sources of {missing}, use --dry_run")
         GRAPH_LOG.info(
             "Generating backend code for the elements and deployment scripts..."
         )
         # Step 3.1: Generate backend code for the elements
         # pseudo_impl is set to True when we want to use user-provided implementations instead of auto-generated ones
-        generate_element_impl(graphirs, args.pseudo_impl)
+        with PROFILER.stage("codegen"):
+            generate_element_impl(
+                graphirs, args.pseudo_impl, args.tag, incremental=args.incremental, jobs=args.jobs
+            )
         if not args.element_dry_run:
             # Step 3.2: Generate deployment scripts
-            scriptgen(graphirs, app_name, app_manifest_file, app_edges, args)
+            with PROFILER.stage("scriptgen"):
+                scriptgen(graphirs, app_name, app_manifest_file, app_edges, args)
 
     # Dump graphir summary (in yaml)
     graphir_summary = ""
@@ -358,15 +749,23 @@ def main(args):
     if args.verbose:
         print_gir_summary(graphirs)
 
+    PROFILER.dump()
+    PROFILER.summary(args.profile_top)
 
-if __name__ == "__main__":
-    args = parse_args()
-    init_logging(args.debug)
 
-    os.environ["SERVICE_REPLICA"] = args.replica
+def set_environment(args):
+    """Export the options that are read through environment variables by the compiler."""
     if args.dry_run:
         os.environ["DRY_RUN"] = "1"
     if args.opt_level == "no":
         os.environ["APPNET_NO_OPTIMIZE"] = "1"
+    if args.sensitivity_timeout is not None:
+        os.environ["APPNET_SENSITIVITY_TIMEOUT"] = str(args.sensitivity_timeout)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    init_logging(args.debug)
+    set_environment(args)
 
     main(args)
@@ -1,5 +1,6 @@
+import os
 import re
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from compiler.utils import strip
 
@@ -63,6 +64,7 @@ class ProtoMessage:
         if not message_match:
             raise ValueError(f"Could not find message name in content: {content[:50]}...")
         self._message_name = message_match.group(1)
+        # field name -> field, i.e., the (message, field) -> type index of the proto
         self._fields: Dict[str, ProtoMessageField] = {}
         
         field_pattern = re.compile(r"\s+(\w+)\s+(\w+)\s+=\s+\d+;")
@@ -109,7 +111,7 @@ class ProtoMessage:
 class ProtoRpcMethod:
     def __init__(self, content: str):
         rpc_match = re.match(
-            r"rpc\s+(\w+)\s*\((stream\s+)?(\w+)\)\s+returns\s*\((stream\s+)?(\w+)\)\s*;",
+            r"rpc\s+(\w+)\s*\((stream\s+)?(\w+)\)\s+returns\s*\((stream\s+)?(\w+)\)\s*(;|\{[^}]*\})",
             content.strip()
         )
         if not rpc_match:
@@ -160,7 +162,7 @@ class ProtoService:
         self._service_name = service_match.group(1)
         
         rpc_pattern = re.compile(
-            r"rpc\s+\w+\s*\([^)]*\)\s+returns\s*\([^)]*\)\s*;",
+            r"rpc\s+\w+\s*\([^)]*\)\s+returns\s*\([^)]*\)\s*(;|\{[^}]*\})",
             re.MULTILINE | re.DOTALL
         )
         self._rpc_methods: Dict[str, ProtoRpcMethod] = {}
@@ -217,6 +219,14 @@ class Proto:
             service = ProtoService(proto_content[service_match.start():end_pos+1])
             self._services[service.name] = service
 
+        # method -> (request message, response message), the first service defining it wins
+        self._rpc_messages: Dict[str, Tuple[str, str]] = {}
+        for service in self._services.values():
+            for rpc_method in service._rpc_methods.values():
+                self._rpc_messages.setdefault(
+                    rpc_method.name, (rpc_method.request_msg, rpc_method.response_msg)
+                )
+
         # _annotation indicates whether the proto is extended with public annotations
         self._annotation = False
     
@@ -248,17 +258,15 @@ class Proto:
         return proto_content
 
     def get_message(self, method: str, procedure: str) -> ProtoMessage:
-        for service in self._services.values():
-            rpc_method = service.get_rpc_method(method)
-            if rpc_method is not None:
-                if procedure in ["req", "request"]:
-                    msg_name = rpc_method.request_msg
-                elif procedure in ["resp", "response"]:
-                    msg_name = rpc_method.response_msg
-                else:
-                    raise ValueError(f"invalid procedure: {procedure}")
-                return self._messages[msg_name]
-        raise ValueError(f"RPC method {method} not found")
+        if method not in self._rpc_messages:
+            raise ValueError(f"RPC method {method} not found")
+        if procedure in ["req", "request"]:
+            msg_name = self._rpc_messages[method][0]
+        elif procedure in ["resp", "response"]:
+            msg_name = self._rpc_messages[method][1]
+        else:
+            raise ValueError(f"invalid procedure: {procedure}")
+        return self._messages[msg_name]
     
     def query_type(self, method: str, procedure: str, field_name: str) -> str:
         field_name = strip(field_name)
@@ -270,6 +278,27 @@ class Proto:
         msg = self.get_message(method, procedure)
         msg.add_field(field_name, field_type)
 
+
+# abspath -> (mtime, Proto)
+_loaded_protos: Dict[str, Tuple[int, Proto]] = {}
+
+
+def load_proto(proto_path: str) -> Proto:
+    """Load a proto file once per process, again only if it was modified since.
+
+    All callers share the returned Proto, which must not be modified: copy it before adding
+    fields (type inference) or annotations (aRPC), as main() does for each run.
+    """
+    path = os.path.abspath(proto_path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Proto file {proto_path} not found")
+    if path not in _loaded_protos or _loaded_protos[path][0] != mtime:
+        _loaded_protos[path] = (mtime, Proto(proto_path))
+    return _loaded_protos[path][1]
+
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
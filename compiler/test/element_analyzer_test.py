@@ -8,7 +8,7 @@ sys.path.append(str(Path(__file__).parent.parent.absolute()))
 from compiler import *
 from compiler.element.frontend.parser import ElementParser
 from compiler.element.frontend.transformer import ElementTransformer
-from compiler.element.frontend.sensitivity_analysis import *
+from compiler.element.frontend.sensitivity_analysis import analyze_sensitivity
 
 if __name__ == "__main__":
     # Parse command line arguments
@@ -25,6 +25,5 @@ if __name__ == "__main__":
     transformer = ElementTransformer()
     ir = transformer.transform(ast)
 
-    check_idempotent(ir)
-    check_ordering_sensitive(ir)
-    check_requires_all_rpcs(ir)
\ No newline at end of file
+    for name, verdict in analyze_sensitivity(ir).items():
+        print(f"{name}: {verdict}")
\ No newline at end of file
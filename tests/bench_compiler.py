@@ -0,0 +1,531 @@
+"""
+End-to-end compiler benchmark.
+
+Runs the compiler pipeline (compiler/main.py) in-process over the specs in
+examples/chain and over synthetic specs, and records the wall time and peak memory
+of every phase. Results are emitted as JSON and can be compared against a stored
+baseline to catch performance regressions.
+
+Usage:
+    python tests/bench_compiler.py --output bench.json
+    python tests/bench_compiler.py --compare bench.json
+    python tests/bench_compiler.py --synthetic 4x3 16x3 --mode dry_run --repeat 3
+
+Wall times are the minimum over --repeat runs. Peak memory (tracemalloc) is taken
+from one additional run, since tracing slows down the compiler considerably.
+Phase times are inclusive, e.g., gen_code includes the finalizer of the backend.
+Example specs whose files are not in this checkout are skipped (see local_copy()),
+failed runs make the benchmark exit with status 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import yaml
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+
+from tests import *
+
+import compiler.element as element_compiler
+import compiler.main as driver
+from compiler.graph.frontend import GraphParser
+from compiler.graph.ir import GraphIR
+from compiler.graph.ir.element import AbsElement
+from compiler.graph.logger import loggers
+
+TEST_LOG = logging.getLogger("BENCH")
+
+CHAIN_SPEC_DIR = os.path.join(ROOT_DIR, "examples/chain")
+PING_ELEMENT_DIR = os.path.join(ROOT_DIR, "examples/elements/ping_elements")
+PING_MANIFEST = os.path.join(
+    ROOT_DIR, "examples/applications/ping-pong-app/ping-pong-app.yaml"
+)
+
+MODES = {
+    "dry_run": ["--dry_run"],
+    "element_dry_run": ["--element_dry_run"],
+    # Requires a kubernetes cluster for scriptgen.
+    "full": [],
+}
+
+# Elements used by synthetic specs (the optimizer handles all of them).
+SYNTHETIC_ELEMENTS = [
+    "fault",
+    "logging",
+    "firewall",
+    "metrics",
+    "mutation",
+    "ratelimit",
+    "admissioncontrol",
+    "circuitbreaker",
+]
+
+# Peak memory differences below this many bytes are not reported as regressions.
+MEMORY_NOISE = 2**20
+
+# (phase name, owner object, attribute) of the functions being timed.
+PHASES = [
+    ("parse", GraphParser, "parse"),
+    ("analyze", AbsElement, "analyze"),
+    ("optimize", GraphIR, "optimize"),
+    ("gen_code", driver, "gen_code"),
+    ("finalize", element_compiler, "WasmFinalize"),
+    ("finalize", element_compiler, "GoFinalize"),
+    ("finalize", element_compiler, "NativeFinalize"),
+    ("finalize", element_compiler, "ArpcFinalize"),
+    ("scriptgen", driver, "scriptgen"),
+]
+
+
+class PhaseRecorder:
+    """Accumulate the wall time and peak memory of the instrumented phases."""
+
+    def __init__(self, trace_memory: bool):
+        self.trace_memory = trace_memory
+        self.phases: Dict[str, Dict] = {}
+        # Peak memory seen so far by each active phase (phases may nest).
+        self.stack: List[List] = []
+
+    def wrap(self, name: str, func):
+        recorder = self
+
+        def wrapper(*args, **kwargs):
+            with recorder.span(name):
+                return func(*args, **kwargs)
+
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def current_peak(self) -> int:
+        return tracemalloc.get_traced_memory()[1]
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        if self.trace_memory:
+            if self.stack:
+                self.stack[-1][1] = max(self.stack[-1][1], self.current_peak())
+            tracemalloc.reset_peak()
+        self.stack.append([name, 0])
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _, peak = self.stack.pop()
+            stats = self.phases.setdefault(
+                name, {"calls": 0, "time": 0.0, "peak_memory": 0}
+            )
+            stats["calls"] += 1
+            stats["time"] += elapsed
+            if self.trace_memory:
+                peak = max(peak, self.current_peak())
+                stats["peak_memory"] = max(stats["peak_memory"], peak)
+                if self.stack:
+                    self.stack[-1][1] = max(self.stack[-1][1], peak)
+
+    @contextlib.contextmanager
+    def instrument(self):
+        originals = []
+        for name, owner, attr in PHASES:
+            func = getattr(owner, attr)
+            originals.append((owner, attr, func))
+            setattr(owner, attr, self.wrap(name, func))
+        try:
+            yield
+        finally:
+            for owner, attr, func in reversed(originals):
+                setattr(owner, attr, func)
+
+
+@contextlib.contextmanager
+def isolated_environment(warm: bool):
+    saved = dict(os.environ)
+    if not warm:
+        os.environ["APPNET_NO_CACHE"] = "1"
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def run_once(spec_path: str, mode: str, warm: bool, trace_memory: bool) -> Dict:
+    args = driver.parse_args(["--spec_path", spec_path] + MODES[mode])
+    recorder = PhaseRecorder(trace_memory)
+    with isolated_environment(warm):
+        driver.set_environment(args)
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            with recorder.instrument(), recorder.span("total"):
+                # main() prints the graphir summary, keep the JSON output clean.
+                with contextlib.redirect_stdout(io.StringIO()):
+                    driver.main(args)
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+    return recorder.phases
+
+
+def bench_spec(
+    name: str, spec_path: str, mode: str, repeat: int, warm: bool, memory: bool
+) -> Dict:
+    result = {"spec": name, "mode": mode, "status": "ok"}
+    try:
+        runs = [run_once(spec_path, mode, warm, False) for _ in range(repeat)]
+        phases = {}
+        for phase in runs[0]:
+            phases[phase] = {
+                "calls": runs[0][phase]["calls"],
+                "time": min(run[phase]["time"] for run in runs),
+            }
+        if memory:
+            for phase, stats in run_once(spec_path, mode, warm, True).items():
+                phases[phase]["peak_memory"] = stats["peak_memory"]
+    except Exception as e:
+        TEST_LOG.warning(f"{name} ({mode}) failed: {e!r}")
+        TEST_LOG.debug(traceback.format_exc())
+        result["status"] = "error"
+        result["error"] = repr(e)
+        return result
+    total = phases.pop("total")
+    result["wall_time"] = total["time"]
+    if memory:
+        result["peak_memory"] = total["peak_memory"]
+    result["phases"] = phases
+    return result
+
+
+def local_copy(path: str) -> str:
+    """The copy of a file referenced by an example spec in this checkout, if there is one.
+
+    The specs in examples/chain were written on the authors' machines, e.g.,
+    /users/xzhu/appnet/compiler/examples/proto/kv.proto is examples/proto/kv.proto here,
+    and files of the go library live in APPNET_GO_LIB_DIR.
+    """
+    if os.path.exists(path):
+        return path
+    candidates = []
+    if "/examples/" in path:
+        candidates.append(
+            os.path.join(ROOT_DIR, "examples", path.rsplit("/examples/", 1)[1])
+        )
+    if "/go-lib/" in path:
+        candidates.append(
+            os.path.join(
+                os.getenv("APPNET_GO_LIB_DIR", "/tmp/appnet-go-lib"),
+                path.rsplit("/go-lib/", 1)[1],
+            )
+        )
+    # e.g., /mnt/appnet/config/samples/hotel/hotel_reservation.yaml
+    candidates += sorted(
+        str(p) for p in Path(ROOT_DIR, "examples").rglob(os.path.basename(path))
+    )
+    return next((c for c in candidates if os.path.exists(c)), path)
+
+
+def spec_elements(spec: Dict) -> List[Dict]:
+    elements = []
+    for section in ["egress", "edge", "ingress", "link", "transport"]:
+        for chain in (spec.get(section) or {}).values():
+            elements.extend(chain or [])
+    return elements
+
+
+class MissingFiles(Exception):
+    """An example spec references files that are not available in this checkout."""
+
+
+def materialize_example_spec(spec_path: str, out_dir: str) -> str:
+    """Fill in the path placeholders used by the specs in examples/chain, and point the
+    paths of other machines to the files in this checkout (see local_copy()).
+
+    Raises:
+        MissingFiles: if some files of the spec are still missing.
+    """
+    with open(spec_path) as f:
+        content = f.read()
+    content = content.replace("<COMPILER_DIR>", str(ROOT_DIR))
+    content = content.replace(
+        "<APPNET_GO_LIB_DIR>", os.getenv("APPNET_GO_LIB_DIR", "/tmp/appnet-go-lib")
+    )
+    spec = yaml.safe_load(content)
+    spec["app_manifest"] = local_copy(spec["app_manifest"])
+    missing = [spec["app_manifest"]]
+    for element in spec_elements(spec):
+        for key in ["path", "proto"]:
+            if key in element:
+                element[key] = local_copy(element[key].strip())
+                missing.append(element[key])
+    missing = sorted(set(path for path in missing if not os.path.exists(path)))
+    if missing:
+        raise MissingFiles(", ".join(missing))
+    out_path = os.path.join(out_dir, os.path.basename(spec_path))
+    with open(out_path, "w") as f:
+        yaml.safe_dump(spec, f, sort_keys=False)
+    return out_path
+
+
+def generate_synthetic_spec(services: int, elements: int, out_dir: str) -> str:
+    """Generate a chain application s0->s1->...->s{services-1} with `elements` elements per edge."""
+    edges = [f"s{i}->s{i + 1}" for i in range(services - 1)]
+    spec = {
+        "app_name": f"synthetic-{services}x{elements}",
+        "app_manifest": PING_MANIFEST,
+        "app_structure": edges,
+        "edge": {},
+        "link": {},
+    }
+    for i, edge in enumerate(edges):
+        chain = []
+        for j in range(elements):
+            name = SYNTHETIC_ELEMENTS[(i + j) % len(SYNTHETIC_ELEMENTS)]
+            chain.append(
+                {
+                    "method": "PingEcho",
+                    "name": name,
+                    "path": os.path.join(PING_ELEMENT_DIR, f"{name}.appnet"),
+                    "proto": os.path.join(proto_base_dir, "ping.proto"),
+                    "proto_mod_name": "github.com/appnet-org/golib/sample/ping-pb",
+                    "proto_mod_location": "/tmp/appnet-go-lib/sample/ping-pb",
+                    "processor": ["sidecar_wasm", "sidecar_native", "grpc"],
+                }
+            )
+        spec["edge"][edge] = chain
+    out_path = os.path.join(out_dir, f"synthetic-{services}x{elements}.yaml")
+    with open(out_path, "w") as f:
+        yaml.safe_dump(spec, f)
+    return out_path
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(
+    baseline: Dict, current: Dict, threshold: float, min_delta: float
+) -> List[str]:
+    """Return a description of every metric that regressed by more than threshold.
+
+    Time differences below min_delta seconds are treated as noise.
+    """
+    regressions = []
+    base_results = {(r["spec"], r["mode"]): r for r in baseline["results"]}
+    for result in current["results"]:
+        key = (result["spec"], result["mode"])
+        base = base_results.get(key)
+        if base is None:
+            continue
+        if base["status"] == "ok" and result["status"] != "ok":
+            regressions.append(f"{key[0]} ({key[1]}): failed with {result['error']}")
+            continue
+        if base["status"] != "ok" or result["status"] != "ok":
+            continue
+        metrics = [("total", "wall_time", base, result)]
+        metrics += [
+            (phase, "time", base["phases"][phase], stats)
+            for phase, stats in result["phases"].items()
+            if phase in base["phases"]
+        ]
+        metrics += [
+            (phase, "peak_memory", base["phases"][phase], stats)
+            for phase, stats in result["phases"].items()
+            if phase in base["phases"]
+        ]
+        metrics.append(("total", "peak_memory", base, result))
+        for phase, metric, old, new in metrics:
+            if metric not in old or metric not in new:
+                continue
+            noise = MEMORY_NOISE if metric == "peak_memory" else min_delta
+            if new[metric] - old[metric] < noise:
+                continue
+            if old[metric] > 0 and new[metric] > old[metric] * (1 + threshold):
+                regressions.append(
+                    f"{key[0]} ({key[1]}): {phase} {metric} {old[metric]:.3f} -> {new[metric]:.3f}"
+                    f" (+{(new[metric] / old[metric] - 1) * 100:.1f}%)"
+                )
+    return regressions
+
+
+def print_summary(report: Dict):
+    for result in report["results"]:
+        header = f"{result['spec']} ({result['mode']})"
+        if result["status"] != "ok":
+            print(
+                f"{header}: {result['status'].upper()} {result['error']}",
+                file=sys.stderr,
+            )
+            continue
+        print(f"{header}: {result['wall_time']:.3f}s", file=sys.stderr)
+        for phase, stats in result["phases"].items():
+            memory = (
+                f", peak {stats['peak_memory'] / 2**20:.1f} MiB"
+                if "peak_memory" in stats
+                else ""
+            )
+            print(
+                f"    {phase:<10} {stats['time']:8.3f}s ({stats['calls']} calls{memory})",
+                file=sys.stderr,
+            )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--spec",
+        nargs="*",
+        help="Spec files to benchmark, default is every spec in examples/chain.",
+    )
+    parser.add_argument(
+        "--synthetic",
+        nargs="*",
+        default=["4x3", "16x3", "2x5"],
+        help="Synthetic specs given as <services>x<elements per edge>.",
+    )
+    parser.add_argument(
+        "--mode",
+        nargs="*",
+        choices=list(MODES.keys()),
+        default=["dry_run", "element_dry_run"],
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--warm",
+        action="store_true",
+        help="Keep the element caches enabled (default measures cold compiles).",
+    )
+    parser.add_argument(
+        "--no_memory", action="store_true", help="Skip the peak memory run."
+    )
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file.")
+    parser.add_argument(
+        "--compare", help="Baseline JSON report to check for regressions."
+    )
+    parser.add_argument(
+        "--input",
+        help="Compare an existing JSON report instead of running the benchmark.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative slowdown reported as a regression, default is 0.2 (20%%).",
+    )
+    parser.add_argument(
+        "--min_delta",
+        type=float,
+        default=0.05,
+        help="Ignore time differences below this many seconds, default is 0.05.",
+    )
+    parser.add_argument("--debug", action="store_true")
+    return parser.parse_args()
+
+
+def run_benchmark(args) -> Dict:
+    for logger in loggers:
+        logger.setLevel(logging.DEBUG if args.debug else logging.ERROR)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": args.repeat,
+            "warm": args.warm,
+        },
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="appnet-bench-") as tmp_dir:
+        specs = []
+        if args.spec is None:
+            for name in sorted(os.listdir(CHAIN_SPEC_DIR)):
+                if name.endswith((".yaml", ".yml")):
+                    path = os.path.join(CHAIN_SPEC_DIR, name)
+                    try:
+                        specs.append((name, materialize_example_spec(path, tmp_dir)))
+                    except MissingFiles as e:
+                        TEST_LOG.warning(f"Skipping {name}, missing files: {e}")
+                        for mode in args.mode:
+                            report["results"].append(
+                                {
+                                    "spec": name,
+                                    "mode": mode,
+                                    "status": "skipped",
+                                    "error": f"missing files: {e}",
+                                }
+                            )
+        else:
+            specs = [(os.path.basename(path), path) for path in args.spec]
+        for size in args.synthetic:
+            services, elements = map(int, size.split("x"))
+            specs.append(
+                (
+                    f"synthetic-{size}",
+                    generate_synthetic_spec(services, elements, tmp_dir),
+                )
+            )
+
+        for name, path in specs:
+            for mode in args.mode:
+                TEST_LOG.info(f"Benchmarking {name} ({mode})...")
+                report["results"].append(
+                    bench_spec(
+                        name, path, mode, args.repeat, args.warm, not args.no_memory
+                    )
+                )
+    return report
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)-7s %(message)s")
+
+    if args.input:
+        with open(args.input) as f:
+            report = json.load(f)
+    else:
+        report = run_benchmark(args)
+        print_summary(report)
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+        else:
+            print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold, args.min_delta)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions found.", file=sys.stderr)
+
+    # Failed runs are in the report, but must not pass unnoticed.
+    if any(result["status"] == "error" for result in report["results"]):
+        sys.exit(1)
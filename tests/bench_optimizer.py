@@ -0,0 +1,430 @@
+"""
+Optimizer scalability benchmark.
+
+Synthesizes edges with chains of 3 to 30 elements with random properties (fields read,
+written and recorded, drop/block, state consistency and dependence, processors and positions),
+runs every optimizer of GraphIR.optimize() on them, and records the runtime and the cost of
+the placement found (optimization.cost()). All elements share the program of the fault element,
+only their properties are synthetic. No cluster, element compilation or solver license is
+needed; mip is only run if highspy is installed.
+
+Usage:
+    python tests/bench_optimizer.py --output opt.json
+    python tests/bench_optimizer.py --sizes 3 5 8 12 --algorithm cost dp --chains 5
+    python tests/bench_optimizer.py --opt_timeout 1 10 --compare opt.json
+
+Each run happens in a child process that is stopped after --limit seconds, and an algorithm
+is not run on longer chains once it has been stopped. The cost of a run is the cost of the
+placed chain before adjacent elements on the same target are fused (GraphIR.place()), i.e.,
+the objective of the optimizers. The gap of a run is its cost over the cheapest cost any
+algorithm found for the same chain, minus one.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+
+from compiler.element import parse_element
+from compiler.graph.ir import GraphIR
+from compiler.graph.ir.mip import MIP_TIME_LIMIT
+from compiler.graph.ir.optimization import cost
+from compiler.graph.logger import loggers
+from tests import *
+from tests.bench_compiler import git_revision
+
+TEST_LOG = logging.getLogger("BENCH")
+
+ALGORITHMS = ["cost", "dp", "mip", "heuristics"]
+
+# Message fields accessed by the synthetic elements.
+FIELDS = ["body", "user", "meta", "id", "token", "cache"]
+
+PROCESSORS = [
+    ["sidecar_wasm", "sidecar_native", "grpc"],
+    ["sidecar_wasm", "sidecar_native", "grpc"],
+    ["sidecar_wasm", "sidecar_native"],
+    ["sidecar_wasm"],
+    ["grpc"],
+]
+# The processors an element may have once an element further from the application requires the
+# sidecar: GraphIR places the elements of a side in gRPC up to the last one that requires it.
+SIDECAR_PROCESSORS = [p for p in PROCESSORS if any("sidecar" in t for t in p)]
+
+# The element program of every synthetic element, which the optimizer needs to fuse elements.
+IR_SOURCE = os.path.join(ROOT_DIR, "examples/elements/ping_elements/fault.appnet")
+
+# Relative cost differences below this are rounding errors, e.g., between dp and cost.
+GAP_TOLERANCE = 1e-9
+
+
+def synthetic_property(rnd: random.Random) -> Dict:
+    """Random element properties, in the format of compile_element_property()."""
+
+    def path_property(
+        read: int, write: float, record: float, drop: float, block: float
+    ):
+        return {
+            "read": rnd.sample(FIELDS, rnd.randint(0, read)),
+            "write": rnd.sample(FIELDS, 1) if rnd.random() < write else [],
+            "record": rnd.sample(FIELDS, 1) if rnd.random() < record else [],
+            "drop": rnd.random() < drop,
+            "block": rnd.random() < block,
+            "copy": False,
+        }
+
+    return {
+        "request": path_property(2, 0.3, 0.1, 0.3, 0.1),
+        "response": path_property(1, 0.2, 0.05, 0.1, 0.0),
+        "state": {
+            "stateful": rnd.random() < 0.5,
+            "consistency": rnd.choice(["None", "None", "weak", "strong"]),
+            "combiner": "LWW",
+            "persistence": "None",
+            "state_dependence": rnd.choice(
+                [[], [], ["client_service"], ["server_service"]]
+            ),
+        },
+        "sensitivity": {
+            "idempotent": False,
+            "ordering_sensitive": False,
+            "requires_all_rpcs": False,
+        },
+    }
+
+
+def draw_processors(rnd: random.Random, side: List[Dict]):
+    """Random processors for the elements of one side of an edge, ordered from the application
+    to the network, that GraphIR accepts: no element requires gRPC after one requires the sidecar.
+    """
+    sidecar = False
+    for info in side:
+        info["processor"] = rnd.choice(SIDECAR_PROCESSORS if sidecar else PROCESSORS)
+        sidecar = sidecar or "grpc" not in info["processor"]
+
+
+def synthetic_graphir(length: int, seed: int) -> GraphIR:
+    """An edge with a random chain of length elements (the same for the same seed)."""
+    rnd = random.Random(f"{length}-{seed}")
+    chain = []
+    # Client-only elements come first and server-only ones last.
+    split = rnd.randint(0, length)
+    for i in range(length):
+        info = {
+            "name": f"e{i}",
+            "path": IR_SOURCE,
+            "proto": os.path.join(proto_base_dir, "ping.proto"),
+            "method": "PingEcho",
+        }
+        if rnd.random() < 0.2:
+            info["position"] = "client" if i < split else "server"
+        if rnd.random() < 0.1:
+            info["upgrade"] = True
+        chain.append(info)
+    # The sides GraphIR splits the chain into, halfway between the position requirements.
+    c_id = max(
+        (i for i, e in enumerate(chain) if e.get("position") == "client"), default=-1
+    )
+    s_id = min(
+        (i for i, e in enumerate(chain) if e.get("position") == "server"),
+        default=length,
+    )
+    mid = (c_id + s_id) // 2
+    draw_processors(rnd, chain[: mid + 1])
+    draw_processors(rnd, chain[mid + 1 :][::-1])
+
+    gir = GraphIR("client", "server", chain, [], [])
+    for element in gir.complete_chain():
+        element.ir = parse_element(IR_SOURCE)
+        # Random properties instead of the compiled ones
+        element._prop = synthetic_property(rnd)
+    return gir
+
+
+def optimize_worker(
+    length: int,
+    seed: int,
+    algorithm: str,
+    opt_level: str,
+    timeout: Optional[float],
+    mip_time_limit: float,
+    queue,
+):
+    for logger in loggers:
+        logger.setLevel(logging.ERROR)
+    # Measure the optimizers, not the placement cache.
+    os.environ["APPNET_NO_CACHE"] = "1"
+    gir = synthetic_graphir(length, seed)
+    initial = cost(gir.complete_chain())
+    start = time.perf_counter()
+    if algorithm == "heuristics":
+        # The heuristics do not fuse elements.
+        gir.optimize(opt_level, algorithm)
+        placed = gir.complete_chain()
+    else:
+        placed = gir.place(opt_level, algorithm, mip_time_limit, timeout=timeout)
+    elapsed = time.perf_counter() - start
+    queue.put({"time": elapsed, "cost": cost(placed), "initial_cost": initial})
+
+
+def bench_run(
+    length: int,
+    seed: int,
+    algorithm: str,
+    opt_level: str,
+    timeout: Optional[float],
+    mip_time_limit: float,
+    limit: float,
+) -> Dict:
+    result = {
+        "size": length,
+        "seed": seed,
+        "algorithm": algorithm,
+        "opt_timeout": timeout,
+        "status": "ok",
+    }
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=optimize_worker,
+        args=(length, seed, algorithm, opt_level, timeout, mip_time_limit, queue),
+    )
+    process.start()
+    process.join(limit)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        result["status"] = "timeout"
+        return result
+    if process.exitcode != 0 or queue.empty():
+        result["status"] = "error"
+        result["error"] = f"exit code {process.exitcode}"
+        return result
+    result.update(queue.get())
+    return result
+
+
+def run_label(result: Dict) -> str:
+    if result["opt_timeout"] is None:
+        return result["algorithm"]
+    return f"{result['algorithm']}@{result['opt_timeout']:g}s"
+
+
+def add_gaps(results: List[Dict]):
+    best: Dict = {}
+    for result in results:
+        if result["status"] == "ok":
+            key = (result["size"], result["seed"])
+            best[key] = min(best.get(key, float("inf")), result["cost"])
+    for result in results:
+        if result["status"] == "ok":
+            lowest = best[(result["size"], result["seed"])]
+            gap = result["cost"] / lowest - 1.0 if lowest > 0 else 0.0
+            result["gap"] = gap if gap > GAP_TOLERANCE else 0.0
+
+
+def summarize(results: List[Dict]) -> Dict[str, Dict]:
+    """Median time and mean gap of each (size, run label) over the chains of that size."""
+    groups: Dict[str, List[Dict]] = {}
+    for result in results:
+        groups.setdefault(f"{result['size']}/{run_label(result)}", []).append(result)
+    summary = {}
+    for key, group in groups.items():
+        ok = [r for r in group if r["status"] == "ok"]
+        summary[key] = {
+            "runs": len(group),
+            "failed": len(group) - len(ok),
+            "time": statistics.median(r["time"] for r in ok) if ok else None,
+            "gap": statistics.mean(r["gap"] for r in ok) if ok else None,
+        }
+    return summary
+
+
+def compare(
+    baseline: Dict, current: Dict, threshold: float, min_delta: float, max_gap: float
+) -> List[str]:
+    """Return a description of every (size, algorithm) that got slower, worse or failed.
+
+    Time differences below min_delta seconds and gap differences below max_gap are noise.
+    """
+    regressions = []
+    for key, new in current["summary"].items():
+        old = baseline["summary"].get(key)
+        if old is None:
+            continue
+        if new["failed"] > old["failed"]:
+            regressions.append(
+                f"{key}: {new['failed']} of {new['runs']} runs failed or timed out"
+            )
+        if old["time"] is None or new["time"] is None:
+            continue
+        if new["time"] - old["time"] >= min_delta and new["time"] > old["time"] * (
+            1 + threshold
+        ):
+            regressions.append(
+                f"{key}: time {old['time']:.3f}s -> {new['time']:.3f}s"
+                f" (+{(new['time'] / old['time'] - 1) * 100:.1f}%)"
+            )
+        if new["gap"] - old["gap"] > max_gap:
+            regressions.append(f"{key}: gap {old['gap']:.1%} -> {new['gap']:.1%}")
+    return regressions
+
+
+def print_summary(report: Dict):
+    print(
+        f"{'size':>4} {'algorithm':<16} {'time':>10} {'gap':>8} failed", file=sys.stderr
+    )
+    for key, stats in report["summary"].items():
+        size, label = key.split("/", 1)
+        runtime = f"{stats['time']:.3f}s" if stats["time"] is not None else "-"
+        gap = f"{stats['gap']:.1%}" if stats["gap"] is not None else "-"
+        print(
+            f"{size:>4} {label:<16} {runtime:>10} {gap:>8} {stats['failed']}/{stats['runs']}",
+            file=sys.stderr,
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="*",
+        default=[3, 5, 8, 10, 12, 15, 20, 30],
+        help="Chain lengths to benchmark.",
+    )
+    parser.add_argument(
+        "--chains", type=int, default=3, help="Random chains per size, default is 3."
+    )
+    parser.add_argument(
+        "--algorithm",
+        nargs="*",
+        choices=ALGORITHMS,
+        default=None,
+        help="Optimizers to run, default is all of them (mip only with highspy installed).",
+    )
+    parser.add_argument(
+        "--opt_timeout",
+        type=float,
+        nargs="*",
+        default=[],
+        help="Also run the cost optimizer with each of these --opt_timeout budgets.",
+    )
+    parser.add_argument(
+        "--opt_level", choices=["weak", "strong", "ignore"], default="weak"
+    )
+    parser.add_argument("--mip_time_limit", type=float, default=MIP_TIME_LIMIT)
+    parser.add_argument(
+        "--limit",
+        type=float,
+        default=60.0,
+        help="Stop a run after this many seconds, default is 60.",
+    )
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file.")
+    parser.add_argument(
+        "--compare", help="Baseline JSON report to check for regressions."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative slowdown reported as a regression, default is 0.2 (20%%).",
+    )
+    parser.add_argument(
+        "--min_delta",
+        type=float,
+        default=0.05,
+        help="Ignore time differences below this many seconds, default is 0.05.",
+    )
+    parser.add_argument(
+        "--max_gap",
+        type=float,
+        default=0.01,
+        help="Report gap increases above this (absolute) value, default is 0.01.",
+    )
+    return parser.parse_args()
+
+
+def run_benchmark(args) -> Dict:
+    algorithms = args.algorithm
+    if algorithms is None:
+        algorithms = [
+            a for a in ALGORITHMS if a != "mip" or importlib.util.find_spec("highspy")
+        ]
+    runs = [(a, None) for a in algorithms] + [("cost", t) for t in args.opt_timeout]
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "opt_level": args.opt_level,
+            "chains": args.chains,
+            "limit": args.limit,
+        },
+        "results": [],
+    }
+    stopped = set()
+    for size in sorted(args.sizes):
+        for algorithm, timeout in runs:
+            if (algorithm, timeout) in stopped:
+                continue
+            for seed in range(args.chains):
+                TEST_LOG.info(
+                    f"Benchmarking {algorithm} on chain {seed} of {size} elements..."
+                )
+                result = bench_run(
+                    size,
+                    seed,
+                    algorithm,
+                    args.opt_level,
+                    timeout,
+                    args.mip_time_limit,
+                    args.limit,
+                )
+                report["results"].append(result)
+                if result["status"] == "timeout":
+                    TEST_LOG.warning(
+                        f"{run_label(result)} stopped after {args.limit}s on {size} elements, skipping longer chains."
+                    )
+                    stopped.add((algorithm, timeout))
+                    break
+    add_gaps(report["results"])
+    report["summary"] = summarize(report["results"])
+    return report
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)-7s %(message)s")
+
+    report = run_benchmark(args)
+    print_summary(report)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(
+            baseline, report, args.threshold, args.min_delta, args.max_gap
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions found.", file=sys.stderr)
@@ -0,0 +1,105 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Optional
+from unittest import mock
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+
+from compiler.graph.backend import cargo
+from compiler.graph.backend.cargo import WASM_TARGET, build_wasm_elements
+from tests import *
+
+
+class CargoTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.gen_dir = os.path.join(tmp.name, "generated")
+        self.install_dir = os.path.join(tmp.name, "install")
+        self.target_dir = os.path.join(tmp.name, "target")
+        self.crates = {name: self.crate(name) for name in ["logging", "fault"]}
+        self.builds = []
+        self.copies = []
+        for patch in [
+            mock.patch.object(cargo, "execute_local", side_effect=self.execute),
+            mock.patch.dict(cargo._built_crates, clear=True),
+            mock.patch.dict(os.environ, {"CARGO_TARGET_DIR": self.target_dir}),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def crate(self, name: str, parent: Optional[str] = None) -> str:
+        impl_dir = os.path.join(parent or self.gen_dir, f"{name}_wasm")
+        os.makedirs(os.path.join(impl_dir, "src"))
+        for rel in ["Cargo.toml", "build.rs", "src/lib.rs", "ping.proto"]:
+            with open(os.path.join(impl_dir, rel), "w") as f:
+                f.write(f"// {name} {rel}\n")
+        return impl_dir
+
+    def execute(self, cmd, env=None):
+        if cmd[0] == "cargo":
+            manifest = cmd[cmd.index("--manifest-path") + 1]
+            with open(manifest) as f:
+                self.builds.append((cmd, env, f.read()))
+        else:
+            self.copies.append(cmd)
+
+    def build(self, crates=None, jobs=None):
+        self.builds, self.copies = [], []
+        build_wasm_elements(crates or self.crates, self.install_dir, jobs)
+
+    def test_one_workspace(self):
+        self.build(jobs=4)
+        # One cargo build of all crates, in the shared target directory
+        self.assertEqual(len(self.builds), 1)
+        cmd, env, workspace = self.builds[0]
+        self.assertIn(f"--target={WASM_TARGET}", cmd)
+        self.assertIn("--jobs=4", cmd)
+        self.assertEqual(env, {"CARGO_TARGET_DIR": self.target_dir})
+        self.assertIn('members = ["fault_wasm", "logging_wasm"]', workspace)
+        self.assertEqual(
+            sorted(copy[1] for copy in self.copies),
+            [
+                os.path.join(self.target_dir, WASM_TARGET, "release", f"{name}.wasm")
+                for name in ["fault", "logging"]
+            ],
+        )
+        # The workspace is removed, the crates build on their own again.
+        self.assertFalse(os.path.exists(os.path.join(self.gen_dir, "Cargo.toml")))
+
+    def test_dedup(self):
+        self.build()
+        # e.g., the ambient backend after the sidecar backend
+        self.build()
+        self.assertEqual(self.builds, [])
+        self.assertEqual(self.copies, [])
+        # Crates with other sources or protos are built again.
+        for rel in ["src/lib.rs", "ping.proto"]:
+            with self.subTest(rel=rel):
+                with open(os.path.join(self.crates["fault"], rel), "a") as f:
+                    f.write("// changed\n")
+                self.build()
+                self.assertEqual(len(self.builds), 1)
+                self.assertIn('members = ["fault_wasm"]', self.builds[0][2])
+                self.assertEqual(len(self.copies), 1)
+
+    def test_failed_build(self):
+        cargo.execute_local.side_effect = RuntimeError("cargo failed")
+        with self.assertRaises(RuntimeError):
+            self.build()
+        self.assertFalse(os.path.exists(os.path.join(self.gen_dir, "Cargo.toml")))
+        # Nothing was built, so nothing is skipped the next time.
+        self.assertEqual(cargo._built_crates, {})
+
+    def test_crates_share_a_directory(self):
+        crates = dict(self.crates)
+        crates["metrics"] = self.crate("metrics", self.install_dir)
+        with self.assertRaises(AssertionError):
+            self.build(crates)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+import logging
+import os
+import sys
+import tempfile
+import unittest
+from copy import deepcopy
+from pathlib import Path
+from unittest import mock
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+
+from compiler.element import analyze_element_property
+from compiler.element.ir.props.flow import combine_drop_rates
+from compiler.graph.ir.commutation import CommutationMatrix
+from compiler.graph.ir.cost_model import (
+    COST_PROFILE,
+    REPLICAS,
+    ChainModel,
+    ReplicaConfig,
+    drop_rate,
+    drop_rate_source,
+)
+from compiler.graph.ir.optimization import cost, init_dependency, search_placement
+from compiler.graph.logger import loggers
+from tests import *
+from tests.bench_optimizer import synthetic_graphir
+
+
+def stateful_chain(consistency: str):
+    """A chain of 3 elements, the middle one keeps state shared by the replicas."""
+    chain = synthetic_graphir(3, 0).complete_chain()
+    for element in chain:
+        element.processor = ["sidecar_wasm", "sidecar_native", "grpc"]
+        element.position = "any"
+        element.prop["state"].update(stateful=False, consistency="None")
+        element.prop["state"]["state_dependence"] = []
+    chain[1].prop["state"].update(stateful=True, consistency=consistency)
+    init_dependency(chain, "both")
+    return chain
+
+
+class ReplicaTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        for logger in loggers:
+            logger.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        REPLICAS.reset()
+
+    def test_parse(self):
+        replicas = ReplicaConfig()
+        replicas.reset("3,frontend=1, search = 10")
+        self.assertEqual(replicas.count("frontend"), 1)
+        self.assertEqual(replicas.count("search"), 10)
+        self.assertEqual(replicas.count("other"), 3)
+        self.assertIsNone(replicas.count(None))
+        replicas.reset("frontend=2")
+        self.assertIsNone(replicas.count("other"))
+        self.assertEqual(replicas.deployed("other"), 1)
+        for spec in ["frontend=1,2", "0", "frontend=x"]:
+            with self.assertRaises(ValueError):
+                replicas.reset(spec)
+
+    def test_sync_factor(self):
+        replicas = ReplicaConfig()
+        replicas.reset("4,frontend=1")
+        self.assertEqual(replicas.sync_factor("frontend"), 0.0)
+        self.assertEqual(replicas.sync_factor("other"), 0.75)
+        # Ambient, and services without a count, are assumed to be replicated.
+        self.assertEqual(replicas.sync_factor(None), 1.0)
+        replicas.reset()
+        self.assertEqual(replicas.sync_factor("other"), 1.0)
+
+    def optimum(self, chain):
+        model = ChainModel(chain)
+        commutation = CommutationMatrix(chain, "both", "weak")
+        result = search_placement(model, commutation)
+        placed = model.apply(deepcopy(chain), *result[1:])
+        # The cost model of the optimizers and cost() agree.
+        self.assertAlmostEqual(cost(placed), result[0])
+        return result[0]
+
+    def test_sync_cost(self):
+        for consistency in ["weak", "strong"]:
+            with self.subTest(consistency=consistency):
+                chain = stateful_chain(consistency)
+                costs = {}
+                for spec in [None, "1", "2", "8"]:
+                    REPLICAS.reset(spec)
+                    costs[spec] = self.optimum(chain)
+                # More replicas, more sync: local state is cheapest, unknown counts the most.
+                self.assertLess(costs["1"], costs["2"])
+                self.assertLess(costs["2"], costs["8"])
+                self.assertLess(costs["8"], costs[None])
+
+                REPLICAS.reset("8,client=1")
+                self.assertEqual(self.optimum(chain), costs["1"])
+
+
+def dropping_element(drop: str) -> str:
+    """An element that drops the requests for which drop holds."""
+    return (
+        "state:\n    prob: float\n\ninit():\n    prob = 0.8\n\n"
+        f"req(rpc):\n    match {drop}:\n"
+        "        true =>\n            send(err('dropped'), Up)\n"
+        "        false =>\n            send(rpc, Down)\n\n"
+        "resp(rpc):\n    send(rpc, Up)\n"
+    )
+
+
+ELEMENTS = {
+    # drops 1 - 0.8 of the requests
+    "random": dropping_element("randomf(0, 1) > prob"),
+    "literal": dropping_element("randomf(0, 10) < 1"),
+    # depends on the requests
+    "field": dropping_element("get(rpc, 'body') == 'x'"),
+}
+
+
+class DropRateTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        for logger in loggers:
+            logger.setLevel(logging.ERROR)
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.paths = {}
+        for name, source in ELEMENTS.items():
+            cls.paths[name] = os.path.join(cls.tmp.name, f"{name}.appnet")
+            with open(cls.paths[name], "w") as f:
+                f.write(source)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def tearDown(self):
+        COST_PROFILE.reset()
+
+    def test_combine(self):
+        self.assertEqual(combine_drop_rates(), 0.0)
+        self.assertEqual(combine_drop_rates(0.5, 0.2), 0.6)
+        self.assertEqual(combine_drop_rates(0.05, 0.0), 0.05)
+        self.assertIsNone(combine_drop_rates(0.5, None))
+
+    @mock.patch.dict(os.environ, {"APPNET_NO_CACHE": "1"})
+    def test_analysis(self):
+        def rates(*names):
+            prop = analyze_element_property(
+                "+".join(names), [self.paths[name] for name in names]
+            )
+            return prop["request"]["drop_rate"], prop["response"]["drop_rate"]
+
+        self.assertEqual(rates("random"), (0.2, 0.0))
+        self.assertEqual(rates("literal"), (0.1, 0.0))
+        self.assertEqual(rates("field"), (None, 0.0))
+        # The parts of a fused element drop one after the other.
+        self.assertEqual(rates("random", "literal"), (0.28, 0.0))
+        self.assertEqual(rates("random", "field"), (None, 0.0))
+
+    def test_precedence(self):
+        chain = synthetic_graphir(2, 0).complete_chain()
+        element = chain[0]
+        element.prop["request"].update(drop=True, block=False, drop_rate=None)
+        element.prop["response"].update(drop=False, block=False, drop_rate=0.0)
+        self.assertEqual(drop_rate_source(element), "drop_rate")
+        self.assertEqual(drop_rate(element), COST_PROFILE.drop_rate)
+        # Elements that never drop keep all messages, whatever their rate.
+        self.assertEqual(drop_rate(element, "response"), 0.0)
+
+        element.prop["request"]["drop_rate"] = 0.2
+        self.assertEqual(drop_rate_source(element), "analysis")
+        self.assertEqual(drop_rate(element), 0.2)
+
+        profile = os.path.join(self.tmp.name, "profile.yaml")
+        with open(profile, "w") as f:
+            f.write(f"elements:\n  {element.name[0]}:\n    drop_rate: 0.3\n")
+        COST_PROFILE.reset(profile)
+        self.assertEqual(
+            drop_rate_source(element), f"elements.{element.name[0]}.drop_rate"
+        )
+        self.assertEqual(drop_rate(element), 0.3)
+
+        element.selectivity = 0.6
+        self.assertEqual(drop_rate_source(element), "spec")
+        self.assertAlmostEqual(drop_rate(element), 0.4)
+
+    def test_fuse(self):
+        chain = synthetic_graphir(2, 0).complete_chain()
+        for element in chain:
+            element.prop["request"].update(drop=True, block=False, drop_rate=0.5)
+
+        def fused(first, second):
+            element = deepcopy(chain[0])
+            element.selectivity = first
+            other = deepcopy(chain[1])
+            other.selectivity = second
+            element.fuse(other)
+            return element
+
+        element = fused(0.5, 0.8)
+        self.assertAlmostEqual(element.selectivity, 0.4)
+        self.assertEqual(element.prop["request"]["drop_rate"], 0.75)
+        # Unknown if a part drops requests at an unknown rate
+        self.assertIsNone(fused(0.5, None).selectivity)
+        chain[1].prop["request"].update(drop=False, drop_rate=0.0)
+        self.assertEqual(fused(0.5, None).selectivity, 0.5)
+
+    def test_workload(self):
+        # Requests dropped by an element are not processed by the elements after it.
+        chain = synthetic_graphir(3, 0).complete_chain()
+        for element in chain:
+            for path in ["request", "response"]:
+                element.prop[path].update(drop=False, block=False, drop_rate=0.0)
+        chain[0].prop["request"]["drop"] = True
+        costs = []
+        for selectivity in [1.0, 0.8, 0.5]:
+            chain[0].selectivity = selectivity
+            costs.append(cost(chain))
+        self.assertGreater(costs[0], costs[1])
+        self.assertGreater(costs[1], costs[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
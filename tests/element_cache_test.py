@@ -0,0 +1,122 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+
+from compiler import element
+from compiler.element import cache, parse_element
+from compiler.element.cache import ElementCache, backend_version, source_digest
+from tests import *
+
+SOURCE = os.path.join(ROOT_DIR, "examples/elements/echo_elements/fault.appnet")
+
+
+class ElementCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        for patch in [
+            mock.patch.object(cache, "cache_base_dir", os.path.join(self.dir, "cache")),
+            mock.patch.dict(os.environ, {"APPNET_NO_CACHE": "0"}),
+            # A fresh cache of IRs for each test, in memory and on disk
+            mock.patch.object(element, "IR_CACHE", ElementCache("ir")),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.path = os.path.join(self.dir, "fault.appnet")
+        with open(SOURCE) as f:
+            self.source = f.read()
+        self.write(self.source)
+
+    def write(self, source: str):
+        with open(self.path, "w") as f:
+            f.write(source)
+
+    def test_source_digest(self):
+        digest = source_digest([self.path])
+        self.assertEqual(source_digest([self.path]), digest)
+        self.assertNotEqual(source_digest([self.path], "timeout"), digest)
+        # Order matters for fused elements.
+        other = os.path.join(ROOT_DIR, "examples/elements/echo_elements/logging.appnet")
+        self.assertNotEqual(
+            source_digest([self.path, other]), source_digest([other, self.path])
+        )
+        # A change of the compiler invalidates all entries.
+        with mock.patch.object(cache, "_compiler_version", "other"):
+            self.assertNotEqual(source_digest([self.path]), digest)
+        self.write(self.source.replace("0.95", "0.9"))
+        self.assertNotEqual(source_digest([self.path]), digest)
+        # Whitespace changes of the source count as changes.
+        self.write(self.source + "\n")
+        self.assertNotEqual(source_digest([self.path]), digest)
+
+    def test_backend_version(self):
+        # Targets generated by the same backend share a version.
+        self.assertEqual(
+            backend_version("sidecar_wasm"), backend_version("ambient_wasm")
+        )
+        self.assertNotEqual(backend_version("sidecar_wasm"), backend_version("grpc"))
+        version = backend_version("grpc")
+        with mock.patch.object(cache, "_compiler_version", "other"), mock.patch.dict(
+            cache._backend_versions, clear=True
+        ):
+            self.assertNotEqual(backend_version("grpc"), version)
+
+    def test_memory_and_disk(self):
+        entries = ElementCache("test")
+        value = {"drop": [1, 2]}
+        entries.put("key", value)
+        value["drop"].append(3)
+        self.assertEqual(entries.get("key"), {"drop": [1, 2]})
+        # Callers may mutate what they get.
+        entries.get("key")["drop"].append(3)
+        self.assertEqual(entries.get("key"), {"drop": [1, 2]})
+        self.assertIsNone(entries.get("other"))
+        # Later runs read the entries from disk.
+        self.assertEqual(ElementCache("test").get("key"), {"drop": [1, 2]})
+        self.assertIsNone(ElementCache("property").get("key"))
+
+        with open(os.path.join(entries.disk_dir, "corrupted.pkl"), "w") as f:
+            f.write("not a pickle")
+        self.assertIsNone(ElementCache("test").get("corrupted"))
+
+        with mock.patch.dict(os.environ, {"APPNET_NO_CACHE": "1"}):
+            self.assertIsNone(entries.get("key"))
+            entries.put("disabled", value)
+        self.assertIsNone(entries.get("disabled"))
+
+    def test_parse_element(self):
+        with mock.patch.object(
+            element.ElementCompiler,
+            "parse_and_transform",
+            autospec=True,
+            side_effect=element.ElementCompiler.parse_and_transform,
+        ) as parse:
+            ir = parse_element(self.path)
+            self.assertEqual(parse.call_count, 1)
+            # Hit: the same source is parsed once, and the IR is a copy.
+            cached = parse_element(self.path)
+            self.assertEqual(parse.call_count, 1)
+            self.assertIsNot(cached, ir)
+            self.assertEqual(len(cached.definition.state), len(ir.definition.state))
+            # Hit from disk in a later run
+            with mock.patch.object(element, "IR_CACHE", ElementCache("ir")):
+                parse_element(self.path)
+            self.assertEqual(parse.call_count, 1)
+            # Miss: the source changed
+            self.write(self.source.replace("0.95", "0.9"))
+            parse_element(self.path)
+            self.assertEqual(parse.call_count, 2)
+            # Miss: the compiler changed
+            with mock.patch.object(cache, "_compiler_version", "other"):
+                parse_element(self.path)
+            self.assertEqual(parse.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+
+from compiler.graph.ir import GraphIR
+from compiler.graph.ir.cost_model import COST_PROFILE
+from tests import *
+
+ELEMENT_DIR = os.path.join(ROOT_DIR, "examples/elements/ping_elements")
+
+
+def element_info(name: str, **kwargs):
+    info = {
+        "name": name,
+        "path": os.path.join(ELEMENT_DIR, f"{name}.appnet"),
+        "proto": os.path.join(proto_base_dir, "ping.proto"),
+        "method": "PingEcho",
+    }
+    info.update(kwargs)
+    return info
+
+
+class GraphIRTestCase(unittest.TestCase):
+    def targets(self, gir: GraphIR):
+        return {
+            pos: [(e.name[0], e.target) for e in elements]
+            for pos, elements in gir.elements.items()
+            if elements
+        }
+
+    def test_elements_without_processors(self):
+        # Elements that declare no processors may run anywhere, and start in the sidecars
+        # with the default (wasm) implementation.
+        gir = GraphIR(
+            "client",
+            "server",
+            [element_info("logging"), element_info("fault")],
+            [],
+            [],
+        )
+        self.assertEqual(
+            self.targets(gir),
+            {
+                "client_sidecar": [("logging", "sidecar_wasm")],
+                "server_sidecar": [("fault", "sidecar_wasm")],
+            },
+        )
+        for element in gir.complete_chain():
+            self.assertEqual(element.processor, ["grpc", "sidecar", "ambient"])
+            # Every initial target has a cost.
+            COST_PROFILE.element_cost(element.name[0], element.target)
+
+    def test_processor_without_implementation(self):
+        # "sidecar" does not name an implementation: wasm, unless the element asks for native.
+        gir = GraphIR(
+            "client",
+            "server",
+            [
+                element_info("logging", processor=["sidecar"]),
+                element_info("fault", processor=["sidecar"], envoy_native=True),
+            ],
+            [],
+            [],
+        )
+        self.assertEqual(
+            self.targets(gir),
+            {
+                "client_sidecar": [("logging", "sidecar_wasm")],
+                "server_sidecar": [("fault", "sidecar_native")],
+            },
+        )
+
+    def test_named_implementations_are_kept(self):
+        gir = GraphIR(
+            "client",
+            "server",
+            [
+                element_info("logging", processor=["grpc"]),
+                element_info("fault", processor=["sidecar_native", "grpc"]),
+            ],
+            [],
+            [],
+        )
+        self.assertEqual(
+            self.targets(gir),
+            {
+                "client_grpc": [("logging", "grpc")],
+                "server_sidecar": [("fault", "sidecar_native")],
+            },
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+
+from compiler.graph.ir import joint
+from compiler.graph.ir.joint import MAX_EXHAUSTIVE_SERVICES, choose_sidecars
+from tests import *
+
+
+def pair_cost(pair: set):
+    """Sidecars only pay off in pairs: a single one costs more than none, both cost less."""
+
+    def total_cost(enabled: set) -> float:
+        c = float(len(enabled))
+        if pair <= enabled:
+            c -= 3.0
+        return c
+
+    return total_cost
+
+
+class ChooseSidecarsTestCase(unittest.TestCase):
+    def test_exhaustive(self):
+        candidates = [f"s{i}" for i in range(MAX_EXHAUSTIVE_SERVICES)]
+        calls = []
+
+        def total_cost(enabled: set) -> float:
+            calls.append(enabled)
+            return pair_cost({"s3", "s11"})(enabled)
+
+        best, min_cost = choose_sidecars(candidates, {"forced"}, total_cost)
+        # Every subset of the candidates is tried, the forced service is always kept.
+        self.assertEqual(len(calls), 1 << MAX_EXHAUSTIVE_SERVICES)
+        self.assertEqual(best, {"forced", "s3", "s11"})
+        self.assertEqual(min_cost, 0.0)
+
+    def test_fewer_sidecars_on_ties(self):
+        best, min_cost = choose_sidecars(["a", "b", "c"], set(), lambda enabled: 1.0)
+        self.assertEqual(best, set())
+        self.assertEqual(min_cost, 1.0)
+
+    def test_greedy(self):
+        candidates = [f"s{i}" for i in range(MAX_EXHAUSTIVE_SERVICES + 1)]
+        best, min_cost = choose_sidecars(candidates, set(), pair_cost({"s3", "s11"}))
+        # Sidecars are switched off one by one while the cost does not increase, the pair is
+        # kept since removing either of it costs more.
+        self.assertEqual(best, {"s3", "s11"})
+        self.assertEqual(min_cost, -1.0)
+
+        # Greedy stops at a local optimum where the exhaustive search does not.
+        def total_cost(enabled: set) -> float:
+            return {0: -1.0, 3: 0.0}.get(len(enabled), 1.0)
+
+        self.assertEqual(choose_sidecars(["a", "b", "c"], set(), total_cost)[0], set())
+        with mock.patch.object(joint, "MAX_EXHAUSTIVE_SERVICES", 2):
+            best, min_cost = choose_sidecars(["a", "b", "c"], set(), total_cost)
+        self.assertEqual(best, {"a", "b", "c"})
+        self.assertEqual(min_cost, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
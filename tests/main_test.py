@@ -0,0 +1,198 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import yaml
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+
+from compiler import main as driver
+from compiler.graph.ir import GraphIR
+from compiler.graph.logger import loggers
+from compiler.proto import Proto, load_proto
+from tests import *
+
+ELEMENT = """state:
+    pass
+
+init():
+    pass
+
+req(rpc):
+    set(rpc, 'tag', '{value}')
+    send(rpc, Down)
+
+resp(rpc):
+    send(rpc, Up)
+"""
+
+
+class MainTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        for logger in loggers:
+            logger.setLevel(logging.ERROR)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        environ = mock.patch.dict(os.environ, {"APPNET_NO_CACHE": "1"})
+        environ.start()
+        self.addCleanup(environ.stop)
+        # generated/ of this test only
+        base_dir = mock.patch.object(driver, "graph_base_dir", self.tmp)
+        base_dir.start()
+        self.addCleanup(base_dir.stop)
+
+    def arpc_spec(self, values) -> str:
+        """A spec with an aRPC element setting the (new) field tag of kv.proto per value."""
+        chain = []
+        for i, value in enumerate(values):
+            path = os.path.join(self.tmp, f"tag{i}.appnet")
+            with open(path, "w") as f:
+                f.write(ELEMENT.format(value=value))
+            chain.append(
+                {
+                    "name": f"tag{i}",
+                    "path": path,
+                    "method": "set",
+                    "position": "client",
+                    "proto": os.path.join(proto_base_dir, "kv.proto"),
+                    "proto_mod_name": "kv",
+                    "proto_mod_location": self.tmp,
+                    "processor": ["sidecar_arpc"],
+                }
+            )
+        spec = {
+            "app_name": "echo",
+            "app_manifest": os.path.join(
+                ROOT_DIR, "examples/applications/echo/echo.yaml"
+            ),
+            "app_structure": ["frontend->server"],
+            "edge": {"frontend->server": chain},
+            "link": {},
+        }
+        spec_path = os.path.join(self.tmp, "spec.yaml")
+        with open(spec_path, "w") as f:
+            yaml.safe_dump(spec, f)
+        return spec_path
+
+    def run_main(self, *argv: str) -> str:
+        """Run the compiler, returning the annotated proto of the edge."""
+        driver.main(driver.parse_args([*argv, "--dry_run"]))
+        with open(
+            os.path.join(self.tmp, "generated", "kv_frontend-server_arpc.proto")
+        ) as f:
+            return f.read()
+
+    def test_arpc_fields_with_jobs(self):
+        # The first element adds the field, the second one sees it: the same with any --jobs.
+        spec_path = self.arpc_spec(["a", "b"])
+        serial = self.run_main("--spec_path", spec_path)
+        self.assertIn("string tag = 5 [(kv.is_public) = true];", serial)
+        self.assertEqual(self.run_main("--spec_path", spec_path, "--jobs", "2"), serial)
+
+    def test_runs_do_not_share_protos(self):
+        # Type inference and annotations change the protos of a run, not the cached ones.
+        spec_path = self.arpc_spec(["a"])
+        first = self.run_main("--spec_path", spec_path)
+        self.assertEqual(self.run_main("--spec_path", spec_path), first)
+        proto_path = os.path.join(proto_base_dir, "kv.proto")
+        self.assertEqual(load_proto(proto_path).export(), Proto(proto_path).export())
+        self.assertNotIn("tag", load_proto(proto_path).export())
+
+
+class IncrementalTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        for logger in loggers:
+            logger.setLevel(logging.ERROR)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.gen_dir = os.path.join(self.tmp, "generated")
+        # Copies of the elements, to edit them
+        self.paths = {}
+        for name in ["logging", "fault", "metrics"]:
+            self.paths[name] = os.path.join(self.tmp, f"{name}.appnet")
+            shutil.copy(
+                os.path.join(
+                    ROOT_DIR, f"examples/elements/ping_elements/{name}.appnet"
+                ),
+                self.paths[name],
+            )
+        # Generation only creates the compile_dir, and records it.
+        self.generated = []
+        for patch in [
+            mock.patch.object(driver, "graph_base_dir", self.tmp),
+            mock.patch.object(driver, "compile_dir_impl", side_effect=self.compile),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def compile(self, tasks, capture_logs):
+        compile_dir = tasks[0][0].compile_dir
+        os.makedirs(compile_dir, exist_ok=True)
+        self.generated.append(os.path.basename(compile_dir))
+        return [], []
+
+    def generate(self, names, tag="0"):
+        """Run the code generation of an incremental run, returning the compile_dirs generated."""
+        self.generated = []
+        chain = [
+            {
+                "name": name,
+                "path": self.paths[name],
+                "proto": os.path.join(proto_base_dir, "ping.proto"),
+                "method": "PingEcho",
+            }
+            for name in names
+        ]
+        gir = GraphIR("client", "server", chain, [], [])
+        driver.clean_generated_dir(self.gen_dir, True)
+        driver.generate_element_impl({"client->server": gir}, False, tag, True)
+        return sorted(self.generated)
+
+    def test_fingerprints(self):
+        everything = self.generate(["logging", "fault"])
+        self.assertEqual(len(everything), 2)
+        # Hit: nothing changed
+        self.assertEqual(self.generate(["logging", "fault"]), [])
+        # Miss: the source of an element changed
+        with open(self.paths["fault"], "a") as f:
+            f.write("\n")
+        self.assertEqual(
+            self.generate(["logging", "fault"]),
+            [d for d in everything if "fault" in d],
+        )
+        # Miss: the inputs of all elements changed
+        self.assertEqual(self.generate(["logging", "fault"], tag="1"), everything)
+
+    def test_interrupted_and_stale_outputs(self):
+        everything = self.generate(["logging", "fault"])
+        logging_dir = next(d for d in everything if "logging" in d)
+        # An interrupted generation leaves no fingerprint, nor do other outputs.
+        os.remove(os.path.join(self.gen_dir, logging_dir, driver.FINGERPRINT_FILE))
+        with open(os.path.join(self.gen_dir, "gir_summary"), "w") as f:
+            f.write("")
+        self.assertEqual(self.generate(["logging", "fault"]), [logging_dir])
+        self.assertFalse(os.path.exists(os.path.join(self.gen_dir, "gir_summary")))
+
+        # Directories of elements no longer in the application are removed.
+        metrics = self.generate(["logging", "metrics"])
+        self.assertEqual(len(metrics), 1)
+        self.assertEqual(
+            sorted(os.listdir(self.gen_dir)), sorted([logging_dir] + metrics)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
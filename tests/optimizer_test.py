@@ -0,0 +1,177 @@
+import importlib.util
+import logging
+import os
+import queue
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+
+from compiler.graph.ir import placement
+from compiler.graph.ir.commutation import CommutationMatrix
+from compiler.graph.ir.cost_model import ChainModel
+from compiler.graph.ir.local_search import (
+    anytime_search,
+    local_optimum,
+    place_boundaries,
+    segment_order,
+)
+from compiler.graph.ir.mip import mip_search
+from compiler.graph.ir.optimization import init_dependency, search_placement
+from compiler.graph.ir.placement import dp_placement, dp_search
+from compiler.graph.logger import loggers
+from tests import *
+from tests.bench_optimizer import add_gaps, optimize_worker, synthetic_graphir
+
+# Random chains per length, short enough for the exhaustive search.
+CHAIN_LENGTHS = [2, 3, 4, 5, 6, 7]
+CHAINS = 25
+# The MIP approximates the workload under drops and groups runs (see mip.py).
+MIP_GAP = 0.05
+
+
+class OptimizerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        for logger in loggers:
+            logger.setLevel(logging.ERROR)
+
+    def test_dp_matches_search_placement(self):
+        # dp must find the minimum cost of the exhaustive search, with a placement of that cost.
+        for length in CHAIN_LENGTHS:
+            for seed in range(CHAINS):
+                for opt_level in ["weak", "strong"]:
+                    with self.subTest(length=length, seed=seed, opt_level=opt_level):
+                        chain = synthetic_graphir(length, seed).complete_chain()
+                        init_dependency(chain, "both")
+                        model = ChainModel(chain)
+                        commutation = CommutationMatrix(chain, "both", opt_level)
+                        expected = search_placement(model, commutation)
+                        result = dp_search(model, commutation)
+                        if expected is None:
+                            self.assertIsNone(result)
+                            continue
+                        self.assertIsNotNone(result)
+                        self.assertAlmostEqual(result[0], expected[0])
+                        self.assertTrue(commutation.is_valid(tuple(result[1])))
+                        self.assertAlmostEqual(model.evaluate(*result[1:]), result[0])
+
+    def test_dp_above_downset_cap(self):
+        # Chains with too many equivalent orders are still reordered, never placed worse than
+        # in their original order.
+        with mock.patch.object(placement, "MAX_DOWNSETS", 1):
+            for seed in range(CHAINS):
+                with self.subTest(seed=seed):
+                    chain = synthetic_graphir(8, seed).complete_chain()
+                    init_dependency(chain, "both")
+                    model = ChainModel(chain)
+                    commutation = CommutationMatrix(chain, "both", "weak")
+                    original = [(1 << j) - 1 for j in range(model.length)]
+                    fixed = dp_placement(model, original)
+                    result = dp_search(model, commutation)
+                    if fixed is None:
+                        continue
+                    self.assertIsNotNone(result)
+                    self.assertLessEqual(result[0], fixed[0] + 1e-9)
+                    self.assertTrue(commutation.is_valid(tuple(result[1])))
+                    self.assertAlmostEqual(model.evaluate(*result[1:]), result[0])
+
+    def test_local_search_improves_its_start(self):
+        # Local search never ends worse than the order it starts from, nor below the optimum.
+        for length in CHAIN_LENGTHS:
+            for seed in range(10):
+                with self.subTest(length=length, seed=seed):
+                    chain = synthetic_graphir(length, seed).complete_chain()
+                    init_dependency(chain, "both")
+                    model = ChainModel(chain)
+                    commutation = CommutationMatrix(chain, "both", "weak")
+                    order = segment_order(model, commutation)
+                    start, _ = place_boundaries(model.segment_table(order), length)
+                    result = local_optimum(model, commutation, order)
+                    if result is None:
+                        self.assertEqual(start, float("inf"))
+                        continue
+                    self.assertLessEqual(result[0], start)
+                    self.assertTrue(commutation.is_valid(tuple(result[1])))
+                    self.assertAlmostEqual(model.evaluate(*result[1:]), result[0])
+                    exact = search_placement(model, commutation)
+                    self.assertGreaterEqual(result[0], exact[0] - 1e-9)
+
+    def test_anytime_search(self):
+        for seed in range(10):
+            with self.subTest(seed=seed):
+                chain = synthetic_graphir(6, seed).complete_chain()
+                init_dependency(chain, "both")
+                model = ChainModel(chain)
+                commutation = CommutationMatrix(chain, "both", "weak")
+                expected = search_placement(model, commutation)
+                # Within the budget: the optimum
+                result, complete = anytime_search(chain, model, commutation, 60.0)
+                self.assertTrue(complete)
+                if expected is None:
+                    self.assertIsNone(result)
+                    continue
+                self.assertAlmostEqual(result[0], expected[0])
+                # Out of budget: the placement it started from, still valid
+                result, complete = anytime_search(chain, model, commutation, 0.0)
+                self.assertFalse(complete)
+                if result is not None:
+                    self.assertTrue(commutation.is_valid(tuple(result[1])))
+                    self.assertAlmostEqual(model.evaluate(*result[1:]), result[0])
+                    self.assertGreaterEqual(result[0], expected[0] - 1e-9)
+
+    @unittest.skipIf(importlib.util.find_spec("highspy") is None, "requires highspy")
+    def test_mip_close_to_search_placement(self):
+        exact = 0
+        for length in CHAIN_LENGTHS[:5]:
+            for seed in range(10):
+                with self.subTest(length=length, seed=seed):
+                    chain = synthetic_graphir(length, seed).complete_chain()
+                    init_dependency(chain, "both")
+                    model = ChainModel(chain)
+                    commutation = CommutationMatrix(chain, "both", "weak")
+                    expected = search_placement(model, commutation)
+                    result = mip_search(chain, model, commutation, 10.0)
+                    if expected is None:
+                        self.assertIsNone(result)
+                        continue
+                    self.assertTrue(commutation.is_valid(tuple(result[1])))
+                    self.assertAlmostEqual(model.evaluate(*result[1:]), result[0])
+                    self.assertGreaterEqual(result[0], expected[0] - 1e-9)
+                    self.assertLessEqual(result[0], expected[0] * (1 + MIP_GAP))
+                    exact += result[0] <= expected[0] + 1e-9
+        # Most chains are solved exactly
+        self.assertGreaterEqual(exact, 40)
+
+    def test_equal_placements_have_no_gap(self):
+        # cost and dp find placements of the same cost, the benchmark must not tell them apart
+        # (e.g., by measuring the chain after adjacent elements are fused).
+        results = []
+        with mock.patch.dict(os.environ):
+            for length in [5, 8]:
+                for seed in range(3):
+                    for algorithm in ["cost", "dp"]:
+                        results_queue = queue.Queue()
+                        optimize_worker(
+                            length, seed, algorithm, "weak", None, 0.0, results_queue
+                        )
+                        result = results_queue.get()
+                        result.update(size=length, seed=seed, status="ok")
+                        results.append(result)
+        add_gaps(results)
+        for result in results:
+            self.assertEqual(result["gap"], 0.0)
+
+        # Rounding errors do not count either.
+        results = [
+            {"size": 1, "seed": 0, "status": "ok", "cost": 0.1 + 0.2},
+            {"size": 1, "seed": 0, "status": "ok", "cost": 0.3},
+        ]
+        add_gaps(results)
+        self.assertEqual([result["gap"] for result in results], [0.0, 0.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import yaml
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+
+import compiler.element as element
+from compiler.element.property_db import PropertyDB, source_hash
+from tests import *
+
+ANALYZED = {"request": {"drop": True, "drop_rate": None}, "state": {"stateful": False}}
+OVERRIDE = {"request": {"drop_rate": 0.02}}
+CURATED = {"request": {"drop": True, "drop_rate": 0.02}, "state": {"stateful": False}}
+
+
+class PropertyDBTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.path = os.path.join(self.tmp, "fault.appnet")
+        with open(self.path, "w") as f:
+            f.write("fault")
+        self.name, self.paths = ["fault"], [self.path]
+        version = mock.patch(
+            "compiler.element.property_db.compiler_version", return_value="v2"
+        )
+        version.start()
+        self.addCleanup(version.stop)
+
+    def load(self, **entry) -> PropertyDB:
+        """A database with a single entry for the element."""
+        entry.update(name=self.name, paths=self.paths)
+        db_path = os.path.join(self.tmp, "properties.yaml")
+        with open(db_path, "w") as f:
+            yaml.safe_dump(
+                {"version": 1, "elements": {source_hash(self.paths, self.name): entry}},
+                f,
+            )
+        db = PropertyDB()
+        db.reset(db_path)
+        return db
+
+    def test_lookup(self):
+        db = self.load(analyzer="v2", properties=ANALYZED, override=OVERRIDE)
+        self.assertEqual(db.lookup(self.name, self.paths), CURATED)
+        # Another element, or the same one with changed sources
+        self.assertIsNone(db.lookup(["other"], self.paths))
+        with open(self.path, "w") as f:
+            f.write("changed")
+        self.assertIsNone(db.lookup(self.name, self.paths))
+
+    def test_hand_written_entries_are_never_stale(self):
+        db = self.load(properties=CURATED)
+        self.assertFalse(db.is_stale(db.find(self.name, self.paths)[1]))
+        self.assertEqual(db.lookup(self.name, self.paths), CURATED)
+        db.add(self.name, self.paths, ANALYZED)
+        self.assertFalse(db.dirty)
+
+    def test_stale_analyzer(self):
+        db = self.load(analyzer="v1", properties={}, override=OVERRIDE)
+        # Analyzed again, with the override of the stale entry
+        self.assertIsNone(db.lookup(self.name, self.paths))
+        self.assertEqual(db.apply_override(self.name, self.paths, ANALYZED), CURATED)
+        db.add(self.name, self.paths, ANALYZED)
+        self.assertTrue(db.dirty)
+        entry = db.find(self.name, self.paths)[1]
+        self.assertEqual(entry["analyzer"], "v2")
+        self.assertEqual(entry["properties"], ANALYZED)
+        self.assertEqual(entry["override"], OVERRIDE)
+        self.assertEqual(db.lookup(self.name, self.paths), CURATED)
+
+        # Saved and loaded again
+        db.save()
+        reloaded = PropertyDB()
+        reloaded.reset(db.path)
+        self.assertEqual(reloaded.lookup(self.name, self.paths), CURATED)
+
+    def test_stale_entry_without_sources(self):
+        db = self.load(analyzer="v1", properties=ANALYZED, override=OVERRIDE)
+        os.remove(self.path)
+        # Found by name and paths, stale or not, since the element cannot be analyzed
+        self.assertEqual(db.lookup(self.name, self.paths), CURATED)
+        db.add(self.name, self.paths, {})
+        self.assertFalse(db.dirty)
+
+    def test_resolve_element_property(self):
+        db = self.load(analyzer="v1", properties={}, override=OVERRIDE)
+        with mock.patch.object(element, "PROPERTY_DB", db), mock.patch.object(
+            element, "analyze_element_property", return_value=ANALYZED
+        ) as analyze:
+            # Stale: the analyzed properties with the override, and without for the database
+            self.assertEqual(
+                element.resolve_element_property(self.name, self.paths),
+                (CURATED, ANALYZED),
+            )
+            db.add(self.name, self.paths, ANALYZED)
+            # Up to date: the entry, nothing to add
+            self.assertEqual(
+                element.resolve_element_property(self.name, self.paths), (CURATED, None)
+            )
+            self.assertEqual(
+                element.compile_element_property(self.name, self.paths), CURATED
+            )
+            self.assertEqual(analyze.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import os
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+
+from compiler.proto import Proto
+from tests import *
+
+
+class ProtoTestCase(unittest.TestCase):
+    def test_methods_with_option_bodies(self):
+        # e.g., rpc AddItem(AddItemRequest) returns (Empty) {}
+        proto = Proto(os.path.join(proto_base_dir, "boutique.proto"))
+        self.assertEqual(proto.get_message("AddItem", "req").name, "AddItemRequest")
+        self.assertEqual(proto.get_message("AddItem", "resp").name, "Empty")
+        self.assertEqual(
+            proto.get_message("ListRecommendations", "request").name,
+            "ListRecommendationsRequest",
+        )
+
+    def test_methods(self):
+        proto = Proto(os.path.join(proto_base_dir, "kv.proto"))
+        self.assertEqual(proto.get_message("set", "req").name, "SetRequest")
+        self.assertEqual(proto.query_type("set", "req", "key"), "string")
+        self.assertEqual(proto.query_type("set", "req", "missing"), "")
+        with self.assertRaises(ValueError):
+            proto.get_message("missing", "req")
+        with self.assertRaises(ValueError):
+            proto.get_message("set", "other")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.absolute()))
+
+from compiler.element import parse_element
+from compiler.element.frontend.sensitivity_analysis import (
+    CONSERVATIVE,
+    analyze_sensitivity,
+)
+from compiler.graph.ir.optimization import init_dependency
+from tests import *
+from tests.bench_optimizer import synthetic_graphir
+
+# Generous for the small elements below, the verdicts must not depend on the machine.
+TIMEOUT = 10000
+
+
+def element(state: str, req: str) -> str:
+    return (
+        f"state:\n    {state}\n\ninit():\n    pass\n\n"
+        f"req(rpc):\n    {req}\n    send(rpc, Down)\n\n"
+        "resp(rpc):\n    send(rpc, Up)\n"
+    )
+
+
+ELEMENTS = {
+    "stateless": element("pass", "pass"),
+    # count + 1 commutes with itself, but each RPC counts
+    "counter": element("count: int", "count = count + 1"),
+    # the last RPC wins, whatever came before it
+    "last": element("last: string", "last = get(rpc, 'user')"),
+    # the last value of each key wins, other keys stay
+    "map": element(
+        "cache: Map<string, string>",
+        "set(cache, get(rpc, 'key'), get(rpc, 'value'))",
+    ),
+}
+
+
+class SensitivityTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.programs = {}
+        for name, source in ELEMENTS.items():
+            path = os.path.join(cls.tmp.name, f"{name}.appnet")
+            with open(path, "w") as f:
+                f.write(source)
+            cls.programs[name] = parse_element(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def verdicts(self, name: str, timeout: int = TIMEOUT):
+        verdicts = analyze_sensitivity(self.programs[name], timeout)
+        return (
+            verdicts["idempotent"],
+            verdicts["ordering_sensitive"],
+            verdicts["requires_all_rpcs"],
+        )
+
+    def test_verdicts(self):
+        # (idempotent, ordering_sensitive, requires_all_rpcs)
+        self.assertEqual(self.verdicts("stateless"), (True, False, False))
+        self.assertEqual(self.verdicts("counter"), (False, False, True))
+        self.assertEqual(self.verdicts("last"), (True, True, False))
+        self.assertEqual(self.verdicts("map"), (True, True, True))
+
+    def test_disabled(self):
+        # Without the solver, only stateless elements are known to ignore order and drops.
+        self.assertEqual(
+            analyze_sensitivity(self.programs["map"], 0), dict(CONSERVATIVE)
+        )
+        self.assertEqual(self.verdicts("stateless", 0), (False, False, False))
+
+    def test_strong_dependencies(self):
+        # Elements that copies matter to record the copies before them.
+        chain = synthetic_graphir(4, 0).complete_chain()
+        for e, name in zip(chain, ["stateless", "counter", "last", "map"]):
+            e.prop["request"]["record"] = []
+            e.prop["sensitivity"] = analyze_sensitivity(self.programs[name], TIMEOUT)
+        init_dependency(chain, "request")
+        self.assertEqual(
+            [e.get_prop("request", "record") for e in chain],
+            [
+                [],
+                ["droptrace", "blocktrace", "copytrace"],
+                ["copytrace"],
+                ["droptrace", "blocktrace", "copytrace"],
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()